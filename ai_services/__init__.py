@@ -6,18 +6,32 @@ from .claude import ClaudeService
 # Import other services when they are created
 from .gemini import GeminiService
 # from .grok import GrokService
-# from .llama import LlamaService
+from .llama import LlamaService
+from .hedged import HedgedAIService
+from .loop_runner import get_loop_runner
 
 def get_ai_service() -> BaseAIService:
     """
     Factory function to get the configured AI service instance.
+    With AI_SECONDARY_PROVIDER set, calls are hedged and fail over to that provider (see HedgedAIService).
     """
     ai_config = Config.get_ai_config()
     provider = ai_config.get("provider", "").lower() # Get provider and convert to lowercase
-    api_key = ai_config.get("api_key")
-    model_name = ai_config.get("model_name") # Optional override
-    custom_prompts = ai_config.get("custom_prompts")
+    service = create_ai_service(provider, ai_config.get("api_key"), ai_config.get("model_name"), ai_config.get("custom_prompts"))
 
+    secondary_provider = Config.AI_SECONDARY_PROVIDER
+    if not secondary_provider:
+        return service
+    secondary_api_key = Config.get_ai_api_key(secondary_provider)
+    if not secondary_api_key:
+        print(f"Warning: AI_SECONDARY_PROVIDER '{secondary_provider}' has no API key configured. Hedging disabled.")
+        return service
+    secondary = create_ai_service(secondary_provider, secondary_api_key, Config.AI_SECONDARY_MODEL_NAME or None,
+                                  ai_config.get("custom_prompts"))
+    return HedgedAIService(service, secondary)
+
+def create_ai_service(provider: str, api_key: str, model_name: str = None, custom_prompts: dict = None) -> BaseAIService:
+    """Build the service for one provider ('claude', 'gemini', 'llama'); unknown providers fall back to Claude."""
     print(f"Initializing AI service for provider: {provider}")
 
     if provider == 'claude':
@@ -35,16 +49,12 @@ def get_ai_service() -> BaseAIService:
     #     # return GrokService(api_key=api_key, model_name=model_name, custom_prompts=custom_prompts)
     #     print(f"Warning: AI Provider '{provider}' selected but not implemented yet. Falling back to Claude.")
     #     return ClaudeService(api_key=Config.ANTHROPIC_API_KEY, model_name=model_name, custom_prompts=custom_prompts) # Fallback for now
-    # elif provider == 'llama':
-    #     # from .llama import LlamaService
-    #     # llama_base_url = ai_config.get("llama_base_url")
-    #     # return LlamaService(api_base_url=llama_base_url, api_key=api_key, model_name=model_name, custom_prompts=custom_prompts)
-    #     print(f"Warning: AI Provider '{provider}' selected but not implemented yet. Falling back to Claude.")
-    #     return ClaudeService(api_key=Config.ANTHROPIC_API_KEY, model_name=model_name, custom_prompts=custom_prompts) # Fallback for now
+    elif provider == 'llama':
+        return LlamaService(api_key=api_key, model_name=model_name, custom_prompts=custom_prompts, base_url=Config.LLAMA_API_BASE_URL)
     else:
         print(f"Warning: Unknown AI Provider '{provider}' configured. Falling back to Claude.")
         # Fallback to Claude or raise an error
         return ClaudeService(api_key=Config.ANTHROPIC_API_KEY, model_name=model_name, custom_prompts=custom_prompts) # Default/Fallback
 
 # Make the factory function easily accessible
-__all__ = ['BaseAIService', 'ClaudeService', 'GeminiService', 'get_ai_service']
\ No newline at end of file
+__all__ = ['BaseAIService', 'ClaudeService', 'GeminiService', 'LlamaService', 'HedgedAIService', 'create_ai_service', 'get_ai_service', 'get_loop_runner']
\ No newline at end of file
@@ -1,14 +1,367 @@
 import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
+import json
+import math
+import random
 import re # Import regex module
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Dict, Any, Optional
+from collections import deque
+from typing import List, Tuple, Dict, Any, Optional, Callable, Awaitable, AsyncIterator
+
+from config import Config
+from .local_tagger import LocalTagger
+from .loop_runner import get_loop_runner
+from .near_duplicates import cluster_products, map_tags_to_member
+from .product_clusters import cluster_for_categorization
+from .telemetry import collectors
+from .text_compaction import compact_description, truncate_to_tokens
 
 # Assuming Product is defined elsewhere, e.g., in models.py
 # from models import Product # Uncomment if Product type hinting is needed
 
+
+# Prompt used when several products are tagged in one request ("packed" mode).
+# The instruction block is sent once per request instead of once per product.
+DEFAULT_PACKED_TAG_PROMPT = """
+You are a product tagging expert. Generate comprehensive, specific tags for EACH of the products below.
+
+For every product, cover:
+1. BASE TAGS: nouns and adjectives from the title and description, materials, colors, sizes, styles, product types, brand names
+2. FEATURE TAGS: specific features, technical specifications, special attributes
+3. USE CASE TAGS: where or how the product is used, problems it solves, activities
+4. AUDIENCE TAGS (if applicable): target demographic, skill level, user groups
+
+Guidelines:
+- Each tag MUST be a multi-word phrase (2-4 words); DO NOT create single-word tags
+- All tags should be lowercase with no special characters
+- Avoid generic terms like "product", "item", "quality", "value", "new", "trending"
+- Combine related concepts into meaningful phrases (e.g., "stainless steel coffee maker")
+- Tag each product only from its own title and description
+
+Return ONLY a JSON object mapping every product id (as a string) to a comma-separated string of its tags, e.g.
+{{"12": "first tag, second tag", "13": "another tag, more tags"}}
+
+Products (JSON list of objects with "id", "title" and "description"):
+{products_json}
+"""
+
+PACKED_TAG_SYSTEM_PROMPT = "You are a product tagging expert that generates specific, meaningful tags for several products at once and answers with strict JSON."
+
+
+# Tag results that mean the provider gave no usable answer
+FAILED_TAG_RESULTS = (["error generating tags"], ["api_key_missing"])
+
+# How the local TF-IDF tagger is combined with the AI (see iter_generate_tags)
+LOCAL_TAGGER_MODES = ('local', 'gate', 'fallback')
+
+
+# Tasks that can be routed to their own model (AI_MODEL_ROUTES); the keys match the method names
+ROUTED_TASKS = ('generate_tags', 'analyze_product_for_collection', 'generate_collection_description',
+                'generate_collection_meta_description', 'generate_keyword_map', 'generate_outline', 'generate_content_block')
+
+# USD per million (input, output) tokens, for cost tracking. Models not listed (e.g. local ones) cost nothing.
+# Cache reads are billed at 10% of the input price and cache writes at 125%.
+MODEL_PRICES_PER_MTOK = {
+    'claude-3-7-sonnet-20250219': (3.00, 15.00),
+    'claude-3-5-sonnet-20241022': (3.00, 15.00),
+    'claude-3-5-haiku-20241022': (0.80, 4.00),
+    'claude-3-haiku-20240307': (0.25, 1.25),
+    'gemini-1.5-pro': (1.25, 5.00),
+    'gemini-1.5-flash': (0.075, 0.30),
+    'gemini-1.5-flash-8b': (0.0375, 0.15),
+}
+
+# The routed task the current call belongs to (set by @routed_task on the public methods)
+_current_task: contextvars.ContextVar = contextvars.ContextVar('ai_routed_task', default=None)
+
+# Failed provider calls (models) of the current call, when a caller such as HedgedAIService collects them.
+# Provider methods swallow errors and return defaults, so this is how a caller tells a fallback from an answer.
+_provider_errors: contextvars.ContextVar = contextvars.ContextVar('ai_provider_errors', default=None)
+
+
+def routed_task(task: str) -> Callable:
+    """Run an async service method as `task`: its provider calls use the model routed for it and are tracked under it."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            token = _current_task.set(task)
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                _current_task.reset(token)
+        return wrapper
+    return decorator
+
+
+def parse_model_routes(value: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    Parse AI_MODEL_ROUTES ("generate_tags=claude-3-5-haiku-20241022,generate_outline=...").
+    Returns None for 'off' (every task uses the service's model) and {} when unset.
+    """
+    value = (value or '').strip()
+    if value.lower() == 'off':
+        return None
+    routes = {}
+    for entry in value.split(','):
+        task, _, model = entry.partition('=')
+        task, model = task.strip(), model.strip()
+        if not task:
+            continue
+        if task not in ROUTED_TASKS or not model:
+            print(f"Warning: ignoring AI_MODEL_ROUTES entry '{entry.strip()}' (tasks: {', '.join(ROUTED_TASKS)})")
+            continue
+        routes[task] = model
+    return routes
+
+
+def model_cost_usd(model: Optional[str], input_tokens: int = 0, output_tokens: int = 0,
+                   cache_read_input_tokens: int = 0, cache_creation_input_tokens: int = 0) -> float:
+    """Estimated cost of the given usage at MODEL_PRICES_PER_MTOK (0 for unknown models)."""
+    input_price, output_price = MODEL_PRICES_PER_MTOK.get(model or '', (0.0, 0.0))
+    billed_input = input_tokens + 0.1 * cache_read_input_tokens + 1.25 * cache_creation_input_tokens
+    return (billed_input * input_price + output_tokens * output_price) / 1_000_000
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of `values` (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+# Matches a single-brace format placeholder such as {product_title} (but not escaped {{...}})
+PLACEHOLDER_PATTERN = re.compile(r"(?<!\{)\{([A-Za-z_][A-Za-z0-9_]*)\}(?!\})")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about 4 characters per token) for budgeting prompts."""
+    return max(1, len(text or '') // 4)
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Pull the outermost JSON object out of a model response (tolerates ```json fences and chatter)."""
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start == -1 or end <= start:
+        return None
+    try:
+        parsed = json.loads(text[start:end])
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def compute_backoff(attempt: int, base_delay: float = 1.0, max_delay: float = 60.0,
+                    retry_after: Optional[float] = None) -> float:
+    """
+    Exponential backoff with full jitter: a random delay in [0, base * 2^attempt], capped.
+    A server-provided Retry-After acts as a floor so we never retry earlier than asked.
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    if retry_after:
+        delay = max(delay, min(retry_after, max_delay))
+    return delay
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) limit on in-flight AI calls.
+
+    Every success grows the limit by roughly one slot per full window of calls; a
+    rate-limit error halves it. Decreases are debounced so a burst of 429s from the
+    same window only counts once. Thread-safe, and usable from any event loop.
+    """
+
+    def __init__(self, initial_limit: int = 10, min_limit: int = 1, max_limit: int = 50,
+                 decrease_factor: float = 0.5, decrease_cooldown: float = 1.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self.rate_limit_events = 0
+        self._last_decrease = 0.0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> None:
+        """Wait for a free slot."""
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                return
+            waiter = {'future': asyncio.get_running_loop().create_future(), 'granted': False}
+            self._waiters.append(waiter)
+        try:
+            await waiter['future']
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter['granted']:
+                    # The slot was handed over just as we were cancelled; give it back
+                    self.in_flight -= 1
+                    self._wake_waiters()
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        """Return a slot acquired with acquire()."""
+        with self._lock:
+            self.in_flight -= 1
+            self._wake_waiters()
+
+    def on_success(self) -> None:
+        """Additive increase: about +1 slot per window of successful calls."""
+        with self._lock:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._wake_waiters()
+
+    def on_rate_limit(self) -> None:
+        """Multiplicative decrease, at most once per cooldown period."""
+        with self._lock:
+            self.rate_limit_events += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.decrease_cooldown:
+                self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                self._last_decrease = now
+                print(f"AI rate limit hit, reducing concurrency limit to {int(self.limit)}")
+
+    def _wake_waiters(self) -> None:
+        # Caller holds the lock. Hand slots directly to waiters so newcomers can't barge in.
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            future = waiter['future']
+            if future.done():
+                continue
+            waiter['granted'] = True
+            self.in_flight += 1
+            future.get_loop().call_soon_threadsafe(self._resolve, future)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(None)
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of recent request volume, so a provider outage can't
+    be amplified into a retry storm. Each request deposits `ratio` tokens (up to
+    `max_balance`); each retry spends one.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_balance: float = 10.0, max_balance: float = 100.0):
+        self.ratio = ratio
+        self.max_balance = max_balance
+        self.balance = min_balance
+        self.exhausted_count = 0
+        self._lock = threading.Lock()
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.balance >= 1.0:
+                self.balance -= 1.0
+                return True
+            self.exhausted_count += 1
+            return False
+
+def normalize_prompt_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Collapse whitespace in string parameters so trivially different prompts share a key."""
+    return {name: " ".join(value.split()) if isinstance(value, str) else value for name, value in params.items()}
+
+
+def make_request_key(provider: str, model: Optional[str], params: Dict[str, Any]) -> str:
+    """Hash of the provider, model and normalized prompt parameters."""
+    payload = json.dumps({"provider": provider, "model": model, "params": normalize_prompt_params(params)},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls: the first caller for a key runs the call and
+    everyone else arriving while it is in flight awaits the same result.
+
+    Results are shared through concurrent.futures.Future so callers on different event
+    loops (Flask runs each async request on its own loop) can wait on one call.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, concurrent.futures.Future] = {}
+        self.stats = {'leaders': 0, 'coalesced': 0}
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run `call` once per in-flight key.
+
+        Returns:
+            (result, shared) where shared is True if another caller's result was reused.
+        """
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self.in_flight[key] = future
+                self.stats['leaders'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            try:
+                # Shielded, so cancelling one follower (e.g. the losing side of a hedged call)
+                # doesn't cancel the shared future for the leader and every other follower
+                return await asyncio.shield(asyncio.wrap_future(future)), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled, not us: make the call ourselves
+                return await call(), False
+
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        else:
+            if not future.done():
+                future.set_result(result)
+            return result, False
+        finally:
+            with self.lock:
+                if self.in_flight.get(key) is future:
+                    del self.in_flight[key]
+
+
+# Shared by every service instance so identical requests coalesce process-wide
+SINGLE_FLIGHT = SingleFlight()
+
+
 class BaseAIService(ABC):
     """Abstract base class for AI services for product tagging and collection generation."""
 
+    # Whether the provider has an asynchronous batch API usable for offline bulk tagging
+    supports_message_batches = False
+
+    # Model per routed task unless AI_MODEL_ROUTES overrides it; unlisted tasks use model_name
+    DEFAULT_MODEL_ROUTES: Dict[str, str] = {}
+
     def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None, custom_prompts: Optional[Dict[str, str]] = None):
         """
         Initialize the AI service.
@@ -29,13 +382,275 @@ class BaseAIService(ABC):
             "general", "misc", "miscellaneous", "other", "various", "assorted",
             "collection", "set", "bundle", "pack", "kit", "package", "group"
         ]
-        # Consider making max_concurrent_calls configurable
-        self.max_concurrent_calls = 10
+        # Upper bound on in-flight calls; the adaptive limiter works below it and backs off on 429s
+        self.max_concurrent_calls = int(Config.AI_MAX_CONCURRENT_CALLS or 20)
+        self.concurrency = AdaptiveConcurrencyLimiter(
+            initial_limit=int(Config.AI_INITIAL_CONCURRENT_CALLS or 10),
+            max_limit=self.max_concurrent_calls
+        )
+        # Packed tagging: several products per request, sized to an input token budget
+        self.pack_token_budget = int(Config.AI_PACK_TOKEN_BUDGET or 6000)
+        self.pack_max_products = int(Config.AI_PACK_MAX_PRODUCTS or 20)
+        self.packing_stats = {'requests': 0, 'products': 0, 'fallbacks': 0}
+        self.max_retries = int(Config.AI_MAX_RETRIES or 5)
+        self.retry_budget = RetryBudget(ratio=float(Config.AI_RETRY_BUDGET_RATIO or 0.2))
+        # Set to True to skip the persistent response cache entirely for this service instance
+        self.cache_bypass = False
+        # Identical concurrent requests share one provider call (see SingleFlight)
+        self.single_flight_enabled = True
+        self.single_flight_stats = {'calls': 0, 'coalesced': 0}
+        # Provider-side prompt prefix caching, as reported in response usage
+        self.prompt_cache_stats = {'requests': 0, 'input_tokens': 0, 'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+        # Near-duplicate products (e.g. color variants) share one tagging call per cluster
+        self.dedup_threshold = float(Config.AI_DEDUP_THRESHOLD or 0.6)
+        self.dedup_num_perm = int(Config.AI_DEDUP_NUM_PERM or 64)
+        self.dedup_stats = {'products': 0, 'clusters': 0, 'calls_avoided': 0}
+        # Clustered categorization: one call per cluster of similar products, its category shared with close members
+        self.category_cluster_size = int(Config.AI_CATEGORY_CLUSTER_SIZE or 20)
+        self.category_cluster_threshold = float(Config.AI_CATEGORY_CLUSTER_THRESHOLD or 0.4)
+        self.category_cluster_stats = {'products': 0, 'clusters': 0, 'outliers': 0, 'calls_avoided': 0, 'fallbacks': 0}
+        # Local tagger: products whose local tags reach this confidence skip the AI in 'gate' mode
+        self.local_tagger_min_confidence = float(Config.AI_LOCAL_TAGGER_MIN_CONFIDENCE or 0.8)
+        self.local_tagger_max_tags = int(Config.AI_LOCAL_TAGGER_MAX_TAGS or 8)
+        self.local_tagger_stats = {'products': 0, 'local': 0, 'ai': 0, 'fallbacks': 0}
+        # Product descriptions go into prompts compacted (see prompt_description), cut to a token budget per task (0 = no limit)
+        self.description_token_budgets = {
+            'generate_tags': int(Config.AI_TAGS_DESCRIPTION_TOKENS or 0),
+            'analyze_product_for_collection': int(Config.AI_CATEGORY_DESCRIPTION_TOKENS or 0),
+        }
+        # Per-task model routing (see routed_task), with latency, token and cost stats per (task, model)
+        routes = parse_model_routes(Config.AI_MODEL_ROUTES)
+        self.model_routes = {} if routes is None else {**self.DEFAULT_MODEL_ROUTES, **routes}
+        self.route_stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._route_stats_lock = threading.Lock()
+
+    async def aclose(self) -> None:
+        """Release any pooled clients bound to the running event loop. No-op by default."""
+        pass
+
+    def model_for(self, task: Optional[str] = None) -> str:
+        """The model for `task` (default: the task of the current call), falling back to model_name."""
+        return self.model_routes.get(task or _current_task.get()) or self.model_name
+
+    @property
+    def provider_name(self) -> str:
+        """Short provider label for telemetry ('claude', 'gemini', 'llama')."""
+        return type(self).__name__.replace('Service', '').lower()
+
+    def _telemetry_labels(self, model: Optional[str]) -> Tuple[str, str, str]:
+        return (self.provider_name, model or self.active_model, _current_task.get() or 'other')
+
+    @property
+    def active_model(self) -> str:
+        """Model for the call being made right now; provider helpers send this instead of model_name."""
+        return self.model_for()
+
+    def _route_entry(self, model: Optional[str]) -> Dict[str, Any]:
+        # Caller holds _route_stats_lock
+        key = (_current_task.get() or 'other', model or self.model_name)
+        entry = self.route_stats.get(key)
+        if entry is None:
+            entry = self.route_stats[key] = {'calls': 0, 'errors': 0, 'latencies_ms': deque(maxlen=1000),
+                                             'input_tokens': 0, 'output_tokens': 0,
+                                             'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+        return entry
+
+    def record_call(self, model: Optional[str], latency_ms: float, error: bool = False,
+                    error_type: Optional[str] = None, retries: int = 0) -> None:
+        """
+        Record one provider call (latency of the successful attempt, or an error) for the current
+        task, in the route stats and in telemetry along with its retries and exception type.
+        """
+        labels = self._telemetry_labels(model)
+        for telemetry in collectors():
+            telemetry.record_call(labels, latency_ms, error_type=(error_type or 'Error') if error else None, retries=retries)
+        with self._route_stats_lock:
+            entry = self._route_entry(model)
+            entry['calls'] += 1
+            if error:
+                entry['errors'] += 1
+            else:
+                entry['latencies_ms'].append(latency_ms)
+        errors = _provider_errors.get()
+        if error and errors is not None:
+            errors.append(model or self.model_name)
+
+    def latency_percentile(self, task: str, fraction: float) -> Tuple[Optional[float], int]:
+        """(percentile latency in ms, sample count) of recent successful calls for `task` on its routed model."""
+        with self._route_stats_lock:
+            entry = self.route_stats.get((task, self.model_for(task)))
+            latencies = list(entry['latencies_ms']) if entry else []
+        return percentile(latencies, fraction), len(latencies)
+
+    def route_report(self) -> List[Dict[str, Any]]:
+        """Per (task, model): calls, errors, p50/p95 latency (ms), tokens and estimated cost (USD)."""
+        with self._route_stats_lock:
+            snapshot = [(key, dict(entry, latencies_ms=list(entry['latencies_ms']))) for key, entry in self.route_stats.items()]
+        report = []
+        for (task, model), entry in sorted(snapshot):
+            latencies = entry['latencies_ms']
+            p50, p95 = percentile(latencies, 0.5), percentile(latencies, 0.95)
+            usage = {key: entry[key] for key in ('input_tokens', 'output_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens')}
+            report.append({
+                'task': task,
+                'model': model,
+                'calls': entry['calls'],
+                'errors': entry['errors'],
+                'p50_ms': round(p50, 1) if p50 is not None else None,
+                'p95_ms': round(p95, 1) if p95 is not None else None,
+                **usage,
+                'cost_usd': round(model_cost_usd(model, **usage), 6),
+            })
+        return report
+
+    def _is_rate_limit_error(self, error: Exception) -> bool:
+        """Whether an exception from the provider means 'slow down'. Overridden per provider."""
+        return False
+
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        """Seconds the provider asked us to wait, if it said so. Overridden per provider."""
+        return None
+
+    async def _execute(self, request: Dict[str, Any], send: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a single provider call under the adaptive concurrency limit, retrying
+        rate-limit errors with exponential backoff and jitter within the retry budget.
+
+        Args:
+            request: Description of the call (model, prompts, max_tokens, temperature).
+            send: Zero-argument coroutine function that performs the actual API call.
+        """
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            await self.concurrency.acquire()
+            started = time.perf_counter()
+            try:
+                result = await send()
+            except Exception as e:
+                if not self._is_rate_limit_error(e):
+                    self.record_call(request.get('model'), 0.0, error=True, error_type=type(e).__name__, retries=attempt)
+                    raise
+                self.concurrency.on_rate_limit()
+                error = e
+            else:
+                self.concurrency.on_success()
+                self.record_call(request.get('model'), (time.perf_counter() - started) * 1000, retries=attempt)
+                return result
+            finally:
+                self.concurrency.release()
+
+            # Rate limited: back off (outside the concurrency slot) and retry if allowed
+            if attempt >= self.max_retries or not self.retry_budget.try_spend():
+                print(f"Giving up on {request.get('model')} call after {attempt + 1} attempt(s): retries exhausted")
+                self.record_call(request.get('model'), 0.0, error=True, error_type=type(error).__name__, retries=attempt)
+                raise error
+            delay = compute_backoff(attempt, retry_after=self._retry_after(error))
+            print(f"Rate limited by {request.get('model')}, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _coalesce(self, params: Dict[str, Any], call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a provider call through the single-flight layer, keyed by the normalized prompt hash."""
+        self.single_flight_stats['calls'] += 1
+        if not self.single_flight_enabled:
+            return await call()
+        key = make_request_key(type(self).__name__, self.active_model, params)
+        result, shared = await SINGLE_FLIGHT.do(key, call)
+        if shared:
+            self.single_flight_stats['coalesced'] += 1
+        return result
 
     def get_prompt(self, prompt_key: str, default_prompt: str) -> str:
         """Returns the custom prompt if available, otherwise the default."""
         return self.custom_prompts.get(prompt_key, default_prompt)
 
+    def split_prompt_template(self, template: str, **variables: Any) -> Tuple[str, str]:
+        """
+        Split a prompt template into its static instructions and the per-call variables.
+
+        The template is split once, at the first line that references a placeholder (e.g.
+        "Product Title: {product_title}"), or at the label line directly above it if that ends
+        in ':'. Everything before it is identical on every call, so providers can cache it as
+        a prompt prefix; everything from there on is formatted and returned as one block, in
+        template order. Templates (including custom prompts) get the most prefix caching when
+        their placeholders come last.
+
+        Returns:
+            (instructions, variable_text)
+        """
+        lines = template.strip().splitlines()
+        split = next((index for index, line in enumerate(lines) if PLACEHOLDER_PATTERN.search(line)), len(lines))
+        if 0 < split < len(lines) and lines[split - 1].rstrip().endswith(':'):
+            split -= 1
+        instructions = "\n".join(lines[:split]).replace('{{', '{').replace('}}', '}').strip()
+        return instructions, "\n".join(lines[split:]).format(**variables).strip()
+
+    def build_blog_context_prefix(self, context: Dict[str, Any]) -> str:
+        """
+        Store context shared by every prompt for one blog post (concept, audience, tone, examples
+        and the outline once it exists). Kept byte-stable so it can be cached as a prompt prefix.
+        """
+        lines = [
+            "You are writing for an e-commerce store's blog. Use the store context below for every request.",
+            "",
+            f"Blog Topic (tag): {context.get('tag_name', '')}",
+            f"Store Concept: {context.get('store_concept') or 'Not specified'}",
+            f"Target Audience: {context.get('target_audience') or 'General online shoppers'}",
+            f"Tone of Voice: {context.get('tone_of_voice') or 'Friendly and informative'}",
+        ]
+        if context.get('sitemap_url'):
+            lines.append(f"Sitemap: {context['sitemap_url']}")
+        if context.get('product_examples'):
+            lines.append("Products to reference: " + ", ".join(context['product_examples']))
+        if context.get('existing_blogs'):
+            lines.append("Existing posts (avoid repeating them): " + ", ".join(context['existing_blogs']))
+        if context.get('full_outline'):
+            lines.extend(["", "Full Outline:", str(context['full_outline'])])
+        return "\n".join(lines)
+
+    def record_prompt_cache_usage(self, input_tokens: int = 0, cache_read_input_tokens: int = 0,
+                                  cache_creation_input_tokens: int = 0, output_tokens: int = 0,
+                                  model: Optional[str] = None) -> None:
+        """
+        Accumulate provider-reported token usage for prompt prefix caching, and for the cost
+        of the current task on `model` (default: the model routed for it).
+        """
+        labels = self._telemetry_labels(model)
+        for telemetry in collectors():
+            telemetry.record_usage(labels, input_tokens or 0, output_tokens or 0, cache_read_input_tokens or 0)
+        stats = self.prompt_cache_stats
+        stats['requests'] += 1
+        stats['input_tokens'] += input_tokens or 0
+        stats['cache_read_input_tokens'] += cache_read_input_tokens or 0
+        stats['cache_creation_input_tokens'] += cache_creation_input_tokens or 0
+        with self._route_stats_lock:
+            entry = self._route_entry(model or self.active_model)
+            entry['input_tokens'] += input_tokens or 0
+            entry['output_tokens'] += output_tokens or 0
+            entry['cache_read_input_tokens'] += cache_read_input_tokens or 0
+            entry['cache_creation_input_tokens'] += cache_creation_input_tokens or 0
+
+    def record_cache_hit(self) -> None:
+        """Count a response served from the persistent response cache (see cache.py) in telemetry."""
+        labels = self._telemetry_labels(None)
+        for telemetry in collectors():
+            telemetry.record_cache_hit(labels)
+
+    def prompt_description(self, product: Any, task: Optional[str] = None) -> str:
+        """
+        A product's description as sent in prompts: its stored compact_description (plain text with
+        the store's boilerplate removed, see product_descriptions.py) or, until that is computed, the
+        description with HTML stripped; cut to the token budget of `task` (default: the current task).
+        """
+        return truncate_to_tokens(self.compacted_description(product), self.description_token_budgets.get(task or _current_task.get(), 0))
+
+    @staticmethod
+    def compacted_description(product: Any) -> str:
+        """A product's stored compact_description, or its description with HTML stripped until that is computed."""
+        text = getattr(product, 'compact_description', None)
+        return compact_description(getattr(product, 'description', None)) if text is None else text
+
     def filter_generic_tags(self, tags: List[str]) -> List[str]:
         """Filter out generic tags."""
         return [tag for tag in tags if tag not in self.generic_tags]
@@ -54,6 +669,192 @@ class BaseAIService(ABC):
             tags = ["multi word tag"] # Default if all filtered
         return tags
 
+    async def complete_async(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                             cached_prefix: Optional[str] = None) -> str:
+        """
+        Provider-agnostic text completion used by shared pipelines such as packed tagging.
+        `cached_prefix` holds static instructions the provider may cache across calls.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support generic completions")
+
+    def pack_products(self, products: List[Any], token_budget: Optional[int] = None,
+                      max_products: Optional[int] = None) -> List[List[Any]]:
+        """Group products into packs whose prompt entries fit the input token budget."""
+        token_budget = token_budget or self.pack_token_budget
+        max_products = max_products or self.pack_max_products
+        overhead = estimate_tokens(self.get_prompt('generate_tags_packed', DEFAULT_PACKED_TAG_PROMPT))
+        packs: List[List[Any]] = []
+        current: List[Any] = []
+        current_tokens = overhead
+        for product in products:
+            entry_tokens = estimate_tokens(json.dumps(self._packed_entry(product, 0)))
+            if current and (current_tokens + entry_tokens > token_budget or len(current) >= max_products):
+                packs.append(current)
+                current, current_tokens = [], overhead
+            current.append(product)
+            current_tokens += entry_tokens
+        if current:
+            packs.append(current)
+        return packs
+
+    def _packed_entry(self, product: Any, position: int) -> Dict[str, Any]:
+        key = getattr(product, 'id', None) or position + 1
+        return {"id": str(key), "title": product.title, "description": self.prompt_description(product, 'generate_tags')}
+
+    @routed_task('generate_tags')
+    async def generate_tags_for_pack_async(self, products: List[Any]) -> Tuple[List[Tuple[Any, List[str]]], List[Any]]:
+        """
+        Tag a pack of products with a single request.
+
+        Returns:
+            (results, unresolved) where unresolved products were missing or unparseable
+            in the response and should be tagged individually.
+        """
+        entries = [self._packed_entry(product, position) for position, product in enumerate(products)]
+        if len({entry["id"] for entry in entries}) != len(entries):
+            # Duplicate ids would make the response ambiguous; fall back to positional keys
+            entries = [dict(entry, id=str(position + 1)) for position, entry in enumerate(entries)]
+        instructions, products_text = self.split_prompt_template(
+            self.get_prompt('generate_tags_packed', DEFAULT_PACKED_TAG_PROMPT),
+            products_json=json.dumps(entries, indent=1)
+        )
+        self.packing_stats['requests'] += 1
+        self.packing_stats['products'] += len(products)
+        try:
+            response_text = await self.complete_async(
+                system_prompt=PACKED_TAG_SYSTEM_PROMPT,
+                user_prompt=products_text,
+                cached_prefix=instructions,
+                max_tokens=min(8000, 150 * len(products) + 100),
+                temperature=0.2
+            )
+        except Exception as e:
+            print(f"Packed tag request for {len(products)} products failed: {e}")
+            return [], list(products)
+
+        tag_map = extract_json_object(response_text) or {}
+        results, unresolved = [], []
+        for product, entry in zip(products, entries):
+            raw_tags = tag_map.get(entry["id"])
+            if isinstance(raw_tags, list):
+                raw_tags = ", ".join(str(tag) for tag in raw_tags)
+            if not isinstance(raw_tags, str) or not raw_tags.strip():
+                unresolved.append(product)
+                continue
+            results.append((product, self.clean_tags(raw_tags)))
+        return results, unresolved
+
+    async def _tag_pack_with_fallback(self, pack: List[Any]) -> List[Tuple[Any, List[str]]]:
+        results, unresolved = await self.generate_tags_for_pack_async(pack)
+        if unresolved:
+            print(f"Packed tagging could not resolve {len(unresolved)} of {len(pack)} products, tagging them individually")
+            self.packing_stats['fallbacks'] += len(unresolved)
+            results.extend(await asyncio.gather(*[self.generate_tags_async(product) for product in unresolved]))
+        return results
+
+    def group_near_duplicates(self, products: List[Any]) -> List[List[Any]]:
+        """
+        Cluster near-duplicate products within each store (see near_duplicates.cluster_products),
+        comparing their compacted descriptions (store boilerplate removed).
+        The first product of each cluster is its representative.
+        """
+        clusters = cluster_products(products, threshold=self.dedup_threshold, num_perm=self.dedup_num_perm,
+                                    describe=self.compacted_description)
+        self.dedup_stats['products'] += len(products)
+        self.dedup_stats['clusters'] += len(clusters)
+        self.dedup_stats['calls_avoided'] += len(products) - len(clusters)
+        print(f"Near-duplicate detection: {len(products)} products in {len(clusters)} clusters")
+        return clusters
+
+    def group_for_categorization(self, products: List[Any],
+                                 catalog: Optional[List[Any]] = None) -> Tuple[List[Tuple[Any, List[Any]]], List[Any]]:
+        """
+        Cluster products for categorization (see product_clusters.cluster_for_categorization) on the
+        text the categorization prompt would carry, with term weights from the store's `catalog`
+        if given. Returns (medoid, members) groups and the outliers.
+        """
+        groups, outliers = cluster_for_categorization(
+            products, lambda product: self.prompt_description(product, 'analyze_product_for_collection'),
+            cluster_size=self.category_cluster_size, threshold=self.category_cluster_threshold, catalog=catalog)
+        self.category_cluster_stats['products'] += len(products)
+        self.category_cluster_stats['clusters'] += len(groups)
+        self.category_cluster_stats['outliers'] += len(outliers)
+        print(f"Clustered categorization: {len(products)} products in {len(groups)} clusters, "
+              f"{len(outliers)} outliers categorized individually")
+        return groups, outliers
+
+    def build_local_tagger(self, catalog: Optional[List[Any]] = None) -> LocalTagger:
+        """
+        A local TF-IDF tagger that applies this service's tag cleaning rules, fitted on `catalog`
+        if given (otherwise it fits on the first products it tags).
+        """
+        tagger = LocalTagger(clean_tags=self.clean_tags, max_tags=self.local_tagger_max_tags)
+        return tagger.fit(catalog) if catalog else tagger
+
+    async def _iter_generate_tags_with_local(self, products: List[Any], local_mode: str, catalog: Optional[List[Any]],
+                                             concurrency: Optional[int], packed: bool, dedupe: bool,
+                                             local_tagger: Optional[LocalTagger] = None) -> AsyncIterator[Tuple[Any, List[str]]]:
+        local_results = (local_tagger or self.build_local_tagger(catalog)).tag(products)
+        self.local_tagger_stats['products'] += len(products)
+
+        if local_mode == 'fallback':
+            local_tags = {id(product): tags for product, (tags, _) in zip(products, local_results)}
+            async for product, tags in self.iter_generate_tags(products, concurrency, packed=packed, dedupe=dedupe):
+                if tags in FAILED_TAG_RESULTS and local_tags[id(product)]:
+                    self.local_tagger_stats['fallbacks'] += 1
+                    tags = local_tags[id(product)]
+                else:
+                    self.local_tagger_stats['ai'] += 1
+                yield product, tags
+            return
+
+        needs_ai = []
+        for product, (tags, confidence) in zip(products, local_results):
+            if tags and (local_mode == 'local' or confidence >= self.local_tagger_min_confidence):
+                self.local_tagger_stats['local'] += 1
+                yield product, tags
+            elif local_mode == 'local':
+                yield product, []
+            else:
+                needs_ai.append(product)
+        print(f"Local tagger: {len(products) - len(needs_ai)} of {len(products)} products tagged locally")
+        async for result in self.iter_generate_tags(needs_ai, concurrency, packed=packed, dedupe=dedupe):
+            self.local_tagger_stats['ai'] += 1
+            yield result
+
+    # --- Provider batch API (offline bulk tagging) ---
+
+    @staticmethod
+    def batch_custom_id(product: Any) -> str:
+        """Identifier used to match a batch result back to its product."""
+        return f"product-{product.id}"
+
+    async def submit_tag_batch(self, products: List[Any]) -> Dict[str, Any]:
+        """Submit tagging requests for `products` as one provider batch. Returns {'batch_id', 'status', 'counts'}."""
+        raise NotImplementedError(f"{type(self).__name__} does not support batch tagging")
+
+    async def get_tag_batch_status(self, batch_id: str) -> Dict[str, Any]:
+        """Poll a submitted batch. Returns {'batch_id', 'status', 'counts'}; status 'ended' means results are ready."""
+        raise NotImplementedError(f"{type(self).__name__} does not support batch tagging")
+
+    async def iter_tag_batch_results(self, batch_id: str) -> AsyncIterator[Tuple[str, Optional[List[str]]]]:
+        """Stream (custom_id, tags) for an ended batch; tags is None for failed requests."""
+        raise NotImplementedError(f"{type(self).__name__} does not support batch tagging")
+        yield  # pragma: no cover - makes this an async generator
+
+    async def _batch_generate_tags_via_provider_batch(self, products: List[Any]) -> List[Tuple[Any, List[str]]]:
+        """Submit one provider batch, wait for it to end and return results in input order."""
+        poll_seconds = float(Config.AI_BATCH_POLL_SECONDS or 60)
+        batch = await self.submit_tag_batch(products)
+        while batch["status"] != "ended":
+            await asyncio.sleep(poll_seconds)
+            batch = await self.get_tag_batch_status(batch["batch_id"])
+            print(f"Batch {batch['batch_id']}: {batch['status']} {batch['counts']}")
+        tags_by_id = {}
+        async for custom_id, tags in self.iter_tag_batch_results(batch["batch_id"]):
+            tags_by_id[custom_id] = tags
+        return [(product, tags_by_id.get(self.batch_custom_id(product)) or ["error generating tags"]) for product in products]
+
     @abstractmethod
     async def generate_tags_async(self, product: Any) -> Tuple[Any, List[str]]:
         """Generate tags for a product asynchronously."""
@@ -91,142 +892,198 @@ class BaseAIService(ABC):
         pass
 
     @abstractmethod
-    async def generate_content_block_async(self, context: Dict[str, Any]) -> str:
+    async def generate_content_block_async(self, context: Dict[str, Any], prompt_override: Optional[str] = None,
+                                           on_delta: Optional[Callable[[str], None]] = None) -> str:
         """
         Generate a block of content for a specific part of the blog post.
-        Context should include keys like: 'outline_point', 'full_outline', 'tag_name',
-        'store_concept', 'target_audience', 'tone_of_voice'.
+        Context should include keys like: 'section_topic', 'full_outline', 'tag_name',
+        'store_concept', 'target_audience', 'tone_of_voice'. `prompt_override` replaces the
+        per-section instruction; the store context is always sent as the shared prefix.
+        With `on_delta`, the block is streamed: on_delta(text) is called with each chunk as
+        it arrives (once with the whole block where the provider can't stream). The full
+        text is returned either way.
         """
         pass
 
-    async def batch_generate_tags(self, products: List[Any], batch_size: int = 50) -> List[Tuple[Any, List[str]]]:
-        """Generate tags for multiple products in parallel."""
-        results = []
-        for i in range(0, len(products), batch_size):
-            batch = products[i:i+batch_size]
-            print(f"Processing tag batch {i//batch_size + 1} of {(len(products) + batch_size - 1) // batch_size}")
-            semaphore = asyncio.Semaphore(self.max_concurrent_calls)
-
-            async def process_with_semaphore(prod: Any):
-                async with semaphore:
-                    return await self.generate_tags_async(prod)
-
-            tasks = [process_with_semaphore(product) for product in batch]
-            batch_results = await asyncio.gather(*tasks)
-            results.extend(batch_results)
-            print(f"Completed tag batch {i//batch_size + 1}")
-        return results
+    async def _iter_completed(self, func: Callable[[Any], Awaitable[Any]], items: List[Any],
+                              concurrency: Optional[int] = None) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        Sliding-window pipeline: keep up to `concurrency` calls in flight at all times and
+        yield (index, result) pairs as each call finishes, rather than in input order.
+        A slow call only holds up its own worker, never a whole batch.
+        """
+        if not items:
+            return
+        concurrency = max(1, min(concurrency or self.max_concurrent_calls, len(items)))
+        pending: asyncio.Queue = asyncio.Queue()
+        for index, item in enumerate(items):
+            pending.put_nowait((index, item))
+        finished: asyncio.Queue = asyncio.Queue()
 
-    async def batch_analyze_products_for_collections(self, products: List[Any], batch_size: int = 50) -> List[Tuple[Any, Optional[str]]]:
-        """Analyze multiple products for collections in parallel."""
-        results = []
-        for i in range(0, len(products), batch_size):
-            batch = products[i:i+batch_size]
-            print(f"Processing collection analysis batch {i//batch_size + 1} of {(len(products) + batch_size - 1) // batch_size}")
-            semaphore = asyncio.Semaphore(self.max_concurrent_calls)
-
-            async def process_with_semaphore(prod: Any):
-                async with semaphore:
-                    return await self.analyze_product_for_collection_async(prod)
-
-            tasks = [process_with_semaphore(product) for product in batch]
-            batch_results = await asyncio.gather(*tasks)
-            results.extend(batch_results)
-            print(f"Completed collection analysis batch {i//batch_size + 1}")
+        async def worker():
+            while True:
+                try:
+                    index, item = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    result = await func(item)
+                except Exception as e: # Surface the error to the consumer instead of stalling it
+                    await finished.put((index, None, e))
+                else:
+                    await finished.put((index, result, None))
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            for _ in range(len(items)):
+                index, result, error = await finished.get()
+                if error is not None:
+                    raise error
+                yield index, result
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def iter_generate_tags(self, products: List[Any], concurrency: Optional[int] = None,
+                                 packed: bool = False, dedupe: bool = False, local_mode: Optional[str] = None,
+                                 catalog: Optional[List[Any]] = None,
+                                 local_tagger: Optional[LocalTagger] = None) -> AsyncIterator[Tuple[Any, List[str]]]:
+        """
+        Generate tags for many products, yielding (product, tags) as soon as each one is done.
+        With packed=True several products share each request (see pack_products).
+        With dedupe=True only one product per near-duplicate cluster is sent to the AI; the
+        other members reuse its tags, minus tags naming what sets the representative apart.
+
+        local_mode runs the local TF-IDF tagger (fitted on `catalog`, default `products`) first:
+        'local' uses only local tags, 'gate' sends only products with low-confidence local tags
+        to the AI, and 'fallback' asks the AI and uses local tags where it fails. A `local_tagger`
+        already fitted (see build_local_tagger) is used instead of fitting one on every call.
+        """
+        if local_mode in LOCAL_TAGGER_MODES:
+            async for result in self._iter_generate_tags_with_local(products, local_mode, catalog, concurrency, packed, dedupe,
+                                                                    local_tagger):
+                yield result
+            return
+        if dedupe:
+            clusters = self.group_near_duplicates(products)
+            members = {id(cluster[0]): cluster[1:] for cluster in clusters}
+            representatives = [cluster[0] for cluster in clusters]
+            async for representative, tags in self.iter_generate_tags(representatives, concurrency, packed=packed):
+                yield representative, tags
+                for member in members[id(representative)]:
+                    yield member, map_tags_to_member(tags, representative, member)
+            return
+        if packed:
+            async for _, pack_results in self._iter_completed(self._tag_pack_with_fallback, self.pack_products(products), concurrency):
+                for result in pack_results:
+                    yield result
+            return
+        async for _, result in self._iter_completed(self.generate_tags_async, products, concurrency):
+            yield result
+
+    async def iter_analyze_products_for_collections(self, products: List[Any], concurrency: Optional[int] = None,
+                                                    clustered: bool = False,
+                                                    catalog: Optional[List[Any]] = None) -> AsyncIterator[Tuple[Any, Optional[str]]]:
+        """
+        Analyze many products for collections, yielding (product, category) as each one is done.
+        With clustered=True only each cluster's medoid and the outliers are sent to the AI; the
+        medoid's category is reused for the members close to it. Members of a cluster whose
+        medoid could not be categorized are analyzed individually. `catalog` (the store's
+        products) weights the clustering's terms by how common they are in the store.
+        """
+        if clustered:
+            groups, outliers = self.group_for_categorization(products, catalog)
+            members = {id(medoid): group for medoid, group in groups}
+            unresolved = []
+            async for product, category in self.iter_analyze_products_for_collections([medoid for medoid, _ in groups] + outliers, concurrency):
+                yield product, category
+                group = members.get(id(product), [])
+                if category is None:
+                    unresolved.extend(group)
+                    continue
+                self.category_cluster_stats['calls_avoided'] += len(group)
+                for member in group:
+                    yield member, category
+            if unresolved:
+                self.category_cluster_stats['fallbacks'] += len(unresolved)
+                async for result in self.iter_analyze_products_for_collections(unresolved, concurrency):
+                    yield result
+            return
+        async for _, result in self._iter_completed(self.analyze_product_for_collection_async, products, concurrency):
+            yield result
+
+    async def _collect_in_order(self, func: Callable[[Any], Awaitable[Any]], products: List[Any], label: str, report_every: int) -> List[Any]:
+        """Run the sliding-window pipeline to completion and return results in input order."""
+        results: List[Any] = [None] * len(products)
+        done = 0
+        async for index, result in self._iter_completed(func, products):
+            results[index] = result
+            done += 1
+            if done % report_every == 0 or done == len(products):
+                print(f"Completed {label} for {done} of {len(products)} products")
         return results
 
-    # Synchronous wrappers (can be kept in base or moved to implementations if needed)
-    # These might need adjustment depending on how event loops are managed in Flask/sync contexts
+    async def batch_generate_tags(self, products: List[Any], batch_size: int = 50, packed: bool = False,
+                                  backend: str = 'interactive', dedupe: bool = False,
+                                  local_mode: Optional[str] = None) -> List[Tuple[Any, List[str]]]:
+        """
+        Generate tags for multiple products in parallel, returned in input order.
+        `batch_size` only controls how often progress is logged; work is not batched.
 
-    def generate_tags(self, product: Any) -> List[str]:
-        """Synchronous wrapper for generate_tags_async."""
-        # Note: Managing event loops like this globally can be tricky.
-        # Consider using a library like `nest_asyncio` or running async code differently in Flask.
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:  # No running event loop
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            close_loop = True
-        else:
-            close_loop = False
+        backend='message_batch' submits everything through the provider's batch API instead
+        (cheaper, but results can take hours) and polls until the batch has ended.
+        """
+        if backend == 'message_batch':
+            return await self._batch_generate_tags_via_provider_batch(products)
+        if packed or dedupe or local_mode in LOCAL_TAGGER_MODES:
+            results_by_product = {}
+            async for product, tags in self.iter_generate_tags(products, packed=packed, dedupe=dedupe, local_mode=local_mode):
+                results_by_product[id(product)] = (product, tags)
+            return [results_by_product[id(product)] for product in products]
+        return await self._collect_in_order(self.generate_tags_async, products, "tag generation", batch_size)
 
-        try:
-            product_out, tags = loop.run_until_complete(self.generate_tags_async(product))
-            return tags
-        finally:
-            if close_loop:
-                loop.close()
+    async def batch_analyze_products_for_collections(self, products: List[Any], batch_size: int = 50,
+                                                     clustered: bool = False,
+                                                     catalog: Optional[List[Any]] = None) -> List[Tuple[Any, Optional[str]]]:
+        """
+        Analyze multiple products for collections in parallel, returned in input order.
+        `batch_size` only controls how often progress is logged; work is not batched.
+        clustered=True categorizes one product per cluster of similar products (see
+        iter_analyze_products_for_collections).
+        """
+        if clustered:
+            results_by_product = {}
+            async for product, category in self.iter_analyze_products_for_collections(products, clustered=True, catalog=catalog):
+                results_by_product[id(product)] = (product, category)
+            return [results_by_product[id(product)] for product in products]
+        return await self._collect_in_order(self.analyze_product_for_collection_async, products, "collection analysis", batch_size)
+
+    # Synchronous wrappers. They run the async methods on the shared background event loop
+    # (see loop_runner), so pooled connections survive from one call to the next.
+
+    def run_sync(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run a coroutine of this service on the background event loop and wait for its result."""
+        return get_loop_runner().run(coro, timeout=timeout)
 
+    def generate_tags(self, product: Any) -> List[str]:
+        """Synchronous wrapper for generate_tags_async."""
+        product_out, tags = self.run_sync(self.generate_tags_async(product))
+        return tags
 
     def analyze_product_for_collection(self, product: Any) -> Optional[str]:
         """Synchronous wrapper for analyze_product_for_collection_async."""
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            close_loop = True
-        else:
-            close_loop = False
-
-        try:
-            product_out, category = loop.run_until_complete(self.analyze_product_for_collection_async(product))
-            return category
-        finally:
-            if close_loop:
-                loop.close()
+        product_out, category = self.run_sync(self.analyze_product_for_collection_async(product))
+        return category
 
     def generate_collection_description(self, tag_name: str, product_count: int, product_examples: List[Dict[str, str]]) -> str:
         """Synchronous wrapper for generate_collection_description_async."""
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            close_loop = True
-        else:
-            close_loop = False
-
-        try:
-            description = loop.run_until_complete(self.generate_collection_description_async(tag_name, product_count, product_examples))
-            return description
-        finally:
-            if close_loop:
-                loop.close()
+        return self.run_sync(self.generate_collection_description_async(tag_name, product_count, product_examples))
 
     def generate_keyword_map(self, concept: str) -> Dict[str, Any]:
         """Synchronous wrapper for generate_keyword_map_async."""
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            close_loop = True
-        else:
-            close_loop = False
-
-        try:
-            keyword_map = loop.run_until_complete(self.generate_keyword_map_async(concept))
-            return keyword_map
-        finally:
-            if close_loop:
-                loop.close()
+        return self.run_sync(self.generate_keyword_map_async(concept))
 
     def generate_collection_meta_description(self, tag_name: str, product_titles_text: str) -> str:
         """Synchronous wrapper for generate_collection_meta_description_async."""
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            close_loop = True
-        else:
-            close_loop = False
-
-        try:
-            meta_description = loop.run_until_complete(self.generate_collection_meta_description_async(tag_name, product_titles_text))
-            return meta_description
-        finally:
-            if close_loop:
-                loop.close()
\ No newline at end of file
+        return self.run_sync(self.generate_collection_meta_description_async(tag_name, product_titles_text))
@@ -0,0 +1,253 @@
+"""
+Persistent, content-addressed cache for AI completions.
+
+Responses are stored in a local SQLite file keyed by a SHA-256 hash of the
+provider, model and every prompt parameter (prompt, system prompt, temperature,
+max tokens). Only calls at or below CACHE_MAX_TEMPERATURE are cached: creative copy
+(collection descriptions, blog text) is sampled at higher temperatures, and replaying it
+would make "regenerate" return the same text. Entries expire after a TTL and the store is bounded by entry count,
+evicting the least recently used rows first.
+
+Provider services opt in by decorating their low-level completion helper with
+`cached_completion`; the public generate_* methods are unchanged. Cache misses
+are coalesced through the single-flight layer in base.py. Streaming helpers use
+`cached_stream`, which shares the same entries.
+"""
+
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+
+# Set to True (via bypass_cache()) to skip cache reads for the current task/request.
+# Fresh responses are still written so later calls benefit from them.
+_bypass_cache = contextvars.ContextVar('ai_cache_bypass', default=False)
+
+# Calls sampled above this temperature (creative copy) are never cached
+CACHE_MAX_TEMPERATURE = 0.3
+
+
+@contextmanager
+def bypass_cache(enabled: bool = True):
+    """Skip cached responses inside this block (e.g. a user-requested re-tag)."""
+    token = _bypass_cache.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass_cache.reset(token)
+
+
+def make_cache_key(provider: str, model: Optional[str], params: Dict[str, Any]) -> str:
+    """Hash the provider, model and prompt parameters into a stable cache key."""
+    payload = json.dumps({"provider": provider, "model": model, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed completion cache with TTL expiry, LRU eviction and hit/miss counters."""
+
+    def __init__(self, path: str, max_entries: int = 50000, ttl_seconds: float = 30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'expired': 0, 'evictions': 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            " key TEXT PRIMARY KEY,"
+            " provider TEXT,"
+            " model TEXT,"
+            " response TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_response_cache_last_access ON ai_response_cache (last_access)")
+        self.entry_count = self.conn.execute("SELECT COUNT(*) FROM ai_response_cache").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for `key`, or None on a miss or expired entry."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created_at FROM ai_response_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            response, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self.conn.execute("DELETE FROM ai_response_cache WHERE key = ?", (key,))
+                self.entry_count -= 1
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self.conn.execute("UPDATE ai_response_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.stats['hits'] += 1
+            return response
+
+    def set(self, key: str, response: str, provider: str = '', model: Optional[str] = None) -> None:
+        """Store a response, evicting the least recently used entries once over capacity."""
+        now = time.time()
+        with self.lock:
+            existed = self.conn.execute("SELECT 1 FROM ai_response_cache WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ai_response_cache (key, provider, model, response, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response, now, now)
+            )
+            if not existed:
+                self.entry_count += 1
+            self.stats['writes'] += 1
+            if self.max_entries and self.entry_count > self.max_entries:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        # Drop expired rows first, then trim to 90% of capacity so eviction isn't run on every write
+        if self.ttl_seconds:
+            expired = self.conn.execute("DELETE FROM ai_response_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+            self.stats['expired'] += expired
+            self.entry_count -= expired
+        overflow = self.entry_count - int(self.max_entries * 0.9)
+        if overflow > 0:
+            evicted = self.conn.execute(
+                "DELETE FROM ai_response_cache WHERE key IN"
+                " (SELECT key FROM ai_response_cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            ).rowcount
+            self.stats['evictions'] += evicted
+            self.entry_count -= evicted
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM ai_response_cache")
+            self.entry_count = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counters since startup plus the current size and hit rate."""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = self.entry_count
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide cache for the configured path, or None when caching is disabled."""
+    if str(Config.AI_CACHE_ENABLED).lower() != 'true':
+        return None
+    path = Config.AI_CACHE_PATH or 'instance/ai_cache.sqlite3'
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = ResponseCache(
+                path,
+                max_entries=int(Config.AI_CACHE_MAX_ENTRIES or 50000),
+                ttl_seconds=float(Config.AI_CACHE_TTL_SECONDS or 0)
+            )
+            _caches[path] = cache
+        return cache
+
+
+def _cache_for(service: Any, params: Dict[str, Any]) -> Optional[ResponseCache]:
+    """The response cache to use for a call, or None (bypassed service, or a creative high-temperature call)."""
+    if getattr(service, 'cache_bypass', False) or (params.get('temperature') or 0) > CACHE_MAX_TEMPERATURE:
+        return None
+    return get_response_cache()
+
+
+def cached_completion(func: Callable) -> Callable:
+    """
+    Decorator for a provider's low-level completion helper (an async method returning text).
+
+    The cache key covers the provider class, model and all of the helper's arguments.
+    Empty responses, provider error strings ("error: ...") and calls above
+    CACHE_MAX_TEMPERATURE are never stored. Cache
+    misses go through the service's single-flight layer, so identical requests already
+    in flight share one provider call.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        params = {name: value for name, value in bound.arguments.items() if name != 'self'}
+        provider = type(self).__name__
+        cache = _cache_for(self, params)
+
+        key = None
+        if cache is not None:
+            key = make_cache_key(provider, self.active_model, params)
+            if not _bypass_cache.get():
+                cached = cache.get(key)
+                if cached is not None:
+                    self.record_cache_hit()
+                    return cached
+
+        async def call():
+            response = await func(self, *args, **kwargs)
+            if cache is not None and isinstance(response, str) and response and not response.startswith('error:'):
+                cache.set(key, response, provider=provider, model=self.active_model)
+            return response
+
+        return await self._coalesce(params, call)
+
+    return wrapper
+
+
+def cached_stream(func: Callable) -> Callable:
+    """
+    Streaming counterpart of cached_completion for a helper taking an `on_delta` callback.
+
+    The key is computed from every argument except on_delta, so a helper whose other
+    arguments match the non-streaming one (e.g. _stream_claude_api and _call_claude_api)
+    shares its cache entries. A cached response is replayed as a single delta; a streamed
+    response is stored once complete. Streams are not single-flighted, since every caller
+    wants its own deltas.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        params = {name: value for name, value in bound.arguments.items() if name not in ('self', 'on_delta')}
+        on_delta = bound.arguments.get('on_delta')
+        provider = type(self).__name__
+        cache = _cache_for(self, params)
+
+        key = None
+        if cache is not None:
+            key = make_cache_key(provider, self.active_model, params)
+            if not _bypass_cache.get():
+                cached = cache.get(key)
+                if cached is not None:
+                    self.record_cache_hit()
+                    if on_delta:
+                        on_delta(cached)
+                    return cached
+
+        response = await func(self, *args, **kwargs)
+        if cache is not None and isinstance(response, str) and response and not response.startswith('error:'):
+            cache.set(key, response, provider=provider, model=self.active_model)
+        return response
+
+    return wrapper
@@ -1,18 +1,18 @@
 import anthropic
 import asyncio
+import httpx
 import json
-from typing import List, Tuple, Dict, Any, Optional
+import weakref
+from typing import List, Tuple, Dict, Any, Optional, AsyncIterator, Callable
 
-from .base import BaseAIService
+from .base import BaseAIService, routed_task
+from .cache import cached_completion, cached_stream
 from config import Config # Assuming Config holds the default API key if needed
 
 # Default prompts specific to Claude
 DEFAULT_CLAUDE_TAG_PROMPT = """
 You are a product tagging expert. Your task is to analyze the following product information and generate comprehensive, specific tags.
 
-Product Title: {product_title}
-Product Description: {product_description}
-
 Please generate tags in the following categories:
 
 1. BASE TAGS (required):
@@ -45,15 +45,14 @@ Guidelines:
 - Combine related concepts into meaningful phrases (e.g., "stainless steel coffee maker" instead of just "coffee maker")
 
 Return only the tags as a comma-separated list with no additional text, categories, or explanation.
+
+Product Title: {product_title}
+Product Description: {product_description}
 """
 
 DEFAULT_CLAUDE_COLLECTION_ANALYSIS_PROMPT = """
 You are a product categorization expert. Your task is to analyze the following product information and determine the most appropriate primary category for it.
 
-Product Title: {product_title}
-Product Description: {product_description}
-Current Tags: {product_tags}
-
 Please determine the single most appropriate category for this product. The category should be:
 - A specific, meaningful category that accurately represents this product type
 - Descriptive enough to be useful for grouping similar products
@@ -67,13 +66,14 @@ Focus on categories that would be useful in an e-commerce context, such as:
 - Primary function (e.g., "kitchen tools", "office supplies")
 
 Return only the category name with no additional text or explanation.
+
+Product Title: {product_title}
+Product Description: {product_description}
+Current Tags: {product_tags}
 """
 
 DEFAULT_CLAUDE_COLLECTION_DESC_PROMPT = """
-Create a unique, engaging description for a collection of {product_count} products tagged as '{tag_name}'.
-
-Some example products in this collection:
-{product_examples_json}
+Create a unique, engaging description for the product collection below.
 
 The description should:
 - Be creative and unique to this specific collection
@@ -85,27 +85,30 @@ The description should:
 - Use h2 or h3 tags for any headings (never h1)
 
 Return only the HTML content with no additional text, categories, or explanation.
+
+Collection: '{tag_name}' ({product_count} products)
+Some example products in this collection:
+{product_examples_json}
 """
 
 DEFAULT_CLAUDE_META_DESC_PROMPT = """
-Create a concise, SEO-friendly meta description for a collection of products tagged as '{tag_name}'.
-
-Some products in this collection include: {product_titles_text}
+Create a concise, SEO-friendly meta description for the product collection below.
 
 The meta description should:
 - Be 150-160 characters maximum
-- Include the collection name ('{tag_name}')
+- Include the collection name
 - Be compelling and encourage clicks
 - NOT make claims about shipping, pricing, or guarantees
 - Focus on the value proposition of the collection
 
 Return only the meta description text with no additional explanation.
+
+Collection: '{tag_name}'
+Some products in this collection include: {product_titles_text}
 """
 
 DEFAULT_CLAUDE_KEYWORD_MAP_PROMPT = """
-You are an SEO and e-commerce expert. Your task is to analyze the following store concept and generate a structured semantic keyword map in JSON format.
-
-Store Concept: {concept}
+You are an SEO and e-commerce expert. Your task is to analyze the store concept below and generate a structured semantic keyword map in JSON format.
 
 Generate a JSON object with the following structure:
 {
@@ -120,38 +123,167 @@ Guidelines:
 - Keywords should be relevant for SEO and e-commerce.
 - Focus on terms customers would actually use for searching.
 - Ensure the output is ONLY the valid JSON object, with no surrounding text or explanations.
+
+Store Concept: {concept}
+"""
+
+# Beta header enabling cache_control on system blocks for API versions that still require it
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+
+CLAUDE_TAG_SYSTEM_PROMPT = "You are a product tagging expert that generates specific, meaningful tags that avoid generic terms and focus on distinctive product attributes."
+
+DEFAULT_CLAUDE_OUTLINE_PROMPT = """
+Create a detailed outline for a blog post about the topic below, using the store context provided.
+
+The outline should:
+- Contain 4-6 section headings (no introduction or conclusion, those are written separately)
+- Work the listed products in naturally where relevant
+- Avoid topics already covered by the existing posts
+- Suit the target audience and the store's tone of voice
+
+Return ONLY a JSON list of section heading strings, e.g. ["First Section", "Second Section"].
+
+Topic: '{tag_name}'
+"""
+
+DEFAULT_CLAUDE_CONTENT_BLOCK_PROMPT = """
+Write the content for one section of the blog post described in the store context.
+
+Guidelines:
+- 2-4 paragraphs of HTML (<p>, plus <ul>/<li> where a list helps); no headings, the section heading is added separately
+- Stay on this section's topic; the other sections of the outline are written separately
+- Write for the target audience in the store's tone of voice
+- Mention relevant products naturally, without hard selling
+
+Return only the HTML content with no additional explanation.
+
+Section: '{section_topic}'
 """
 
+BLOG_SYSTEM_PROMPT = "You are an expert e-commerce content writer who writes helpful, engaging blog posts that match a store's voice."
+
 class ClaudeService(BaseAIService):
     """Claude implementation for AI product tagging and collection generation."""
 
     DEFAULT_MODEL = "claude-3-7-sonnet-20250219" # Or perhaps claude-3-opus-20240229 / claude-3-haiku-20240307
-
-    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None, custom_prompts: Optional[Dict[str, str]] = None):
-        """Initialize the Claude client."""
+    # Short, structured outputs go to the fast model; descriptions and blog posts stay on DEFAULT_MODEL
+    DEFAULT_MODEL_ROUTES = {
+        'generate_tags': "claude-3-5-haiku-20241022",
+        'analyze_product_for_collection': "claude-3-5-haiku-20241022",
+        'generate_collection_meta_description': "claude-3-5-haiku-20241022",
+    }
+
+    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None, custom_prompts: Optional[Dict[str, str]] = None,
+                 base_url: Optional[str] = None, pool_size: Optional[int] = None):
+        """
+        Initialize the Claude service.
+
+        Args:
+            base_url: Override for the Anthropic API endpoint (e.g., a local mock server).
+            pool_size: Maximum pooled HTTP connections shared by concurrent calls.
+        """
         resolved_api_key = api_key or Config.ANTHROPIC_API_KEY # Fallback to config
         resolved_model_name = model_name or self.DEFAULT_MODEL
         super().__init__(api_key=resolved_api_key, model_name=resolved_model_name, custom_prompts=custom_prompts)
-        # Async client is created per request to manage resources better
-        # self.client = anthropic.AsyncAnthropic(api_key=self.api_key) # Can be initialized here if preferred
+        self.base_url = base_url or Config.ANTHROPIC_BASE_URL or None
+        self.pool_size = int(pool_size or Config.AI_HTTP_POOL_SIZE or 20)
+        # One long-lived client per event loop. httpx connection pools are bound to the loop
+        # they were created on, so a client can't be shared across loops; keying weakly by loop
+        # lets clients for loops that have gone away be garbage collected.
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, anthropic.AsyncAnthropic]" = weakref.WeakKeyDictionary()
+        self._http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+    supports_message_batches = True
+
+    def _get_client(self) -> anthropic.AsyncAnthropic:
+        """Return the pooled client for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            # Drop clients whose loops were closed without calling aclose()
+            for stale_loop in [l for l in self._clients if l.is_closed()]:
+                self._clients.pop(stale_loop, None)
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(600.0, connect=10.0),
+            )
+            # SDK retries are disabled: rate limits are retried by BaseAIService._execute with
+            # adaptive concurrency, backoff and a retry budget
+            client = anthropic.AsyncAnthropic(api_key=self.api_key, base_url=self.base_url, http_client=http_client, max_retries=0)
+            self._clients[loop] = client
+            self._http_clients[loop] = http_client
+        return client
+
+    async def aclose(self) -> None:
+        """Close the client (and its connection pool) bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        self._http_clients.pop(loop, None)
+        client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.close()
+
+    def _is_rate_limit_error(self, error: Exception) -> bool:
+        """429 rate limits and 529 'overloaded' responses both mean back off and retry."""
+        if isinstance(error, anthropic.RateLimitError):
+            return True
+        return isinstance(error, anthropic.APIStatusError) and error.status_code == 529
+
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        response = getattr(error, 'response', None)
+        try:
+            return float(response.headers.get('retry-after')) if response is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    def _system_blocks(self, system_prompt: str, cached_prefix: Optional[str] = None) -> Any:
+        """
+        Build the `system` parameter. Static instructions and store context go in a second
+        block marked with cache_control so Claude can reuse the processed prefix across calls
+        (prefixes shorter than the model's minimum cacheable length are simply not cached).
+        """
+        if not cached_prefix:
+            return system_prompt
+        return [
+            {"type": "text", "text": system_prompt},
+            {"type": "text", "text": cached_prefix, "cache_control": {"type": "ephemeral"}},
+        ]
 
-    async def _call_claude_api(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float) -> str:
-        """Helper method to call the Claude API."""
+    def _record_usage(self, usage: Any) -> None:
+        if usage is None:
+            return
+        self.record_prompt_cache_usage(
+            input_tokens=getattr(usage, 'input_tokens', 0),
+            cache_read_input_tokens=getattr(usage, 'cache_read_input_tokens', 0),
+            cache_creation_input_tokens=getattr(usage, 'cache_creation_input_tokens', 0),
+            output_tokens=getattr(usage, 'output_tokens', 0)
+        )
+
+    @cached_completion
+    async def _call_claude_api(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                               cached_prefix: Optional[str] = None) -> str:
+        """
+        Helper method to call the Claude API.
+
+        Args:
+            cached_prefix: Static instructions/context shared across calls, sent as a cacheable system block.
+        """
         if not self.api_key:
             raise ValueError("Anthropic API key is missing.")
 
         try:
-            # Use Anthropic's async client within an async context manager
-            async with anthropic.AsyncAnthropic(api_key=self.api_key) as client:
-                response = await client.messages.create(
-                    model=self.model_name,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    system=system_prompt,
-                    messages=[
-                        {"role": "user", "content": user_prompt}
-                    ]
-                )
+            request = {
+                "model": self.active_model,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "system": self._system_blocks(system_prompt, cached_prefix),
+                "messages": [
+                    {"role": "user", "content": user_prompt}
+                ]
+            }
+            extra_headers = {"anthropic-beta": PROMPT_CACHING_BETA} if cached_prefix else None
+            # Reuse the long-lived client so concurrent calls share one connection pool
+            response = await self._execute(request, lambda: self._get_client().messages.create(**request, extra_headers=extra_headers))
+            self._record_usage(getattr(response, 'usage', None))
             # Assuming the response structure is consistent
             if response.content and len(response.content) > 0:
                  return response.content[0].text.strip()
@@ -163,8 +295,7 @@ class ClaudeService(BaseAIService):
             print(f"Claude API connection error: {e}")
             raise # Re-raise for handling upstream
         except anthropic.RateLimitError as e:
-            print(f"Claude API rate limit exceeded: {e}")
-            # Consider implementing backoff/retry logic here or in batch methods
+            print(f"Claude API rate limit exceeded after retries: {e}")
             raise
         except anthropic.APIStatusError as e:
             print(f"Claude API status error: {e.status_code} - {e.response}")
@@ -173,7 +304,126 @@ class ClaudeService(BaseAIService):
             print(f"An unexpected error occurred during Claude API call: {e}")
             raise
 
+    @cached_stream
+    async def _stream_claude_api(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                                 cached_prefix: Optional[str] = None, on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Streaming variant of _call_claude_api: on_delta gets each text delta; returns the full text."""
+        if not self.api_key:
+            raise ValueError("Anthropic API key is missing.")
 
+        request = {
+            "model": self.active_model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": self._system_blocks(system_prompt, cached_prefix),
+            "messages": [
+                {"role": "user", "content": user_prompt}
+            ]
+        }
+        extra_headers = {"anthropic-beta": PROMPT_CACHING_BETA} if cached_prefix else None
+        parts: List[str] = []
+
+        async def send():
+            try:
+                async with self._get_client().messages.stream(**request, extra_headers=extra_headers) as stream:
+                    async for text in stream.text_stream:
+                        parts.append(text)
+                        if on_delta:
+                            on_delta(text)
+                    return await stream.get_final_message()
+            except Exception as e:
+                if parts:
+                    # Text was already forwarded, so a retry would repeat it
+                    raise RuntimeError(f"Claude stream interrupted: {e}") from e
+                raise
+
+        try:
+            message = await self._execute(request, send)
+        except Exception as e:
+            print(f"Claude API streaming error: {e}")
+            raise
+        self._record_usage(getattr(message, 'usage', None))
+        return "".join(parts).strip()
+
+    async def complete_async(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                             cached_prefix: Optional[str] = None) -> str:
+        """Generic completion used by shared pipelines (e.g. packed tagging)."""
+        return await self._call_claude_api(system_prompt, user_prompt, max_tokens, temperature, cached_prefix=cached_prefix)
+
+    # --- Message Batches API (offline bulk tagging) ---
+
+    def build_tag_request(self, product: Any) -> Dict[str, Any]:
+        """Messages API parameters for tagging one product (shared by interactive and batch tagging)."""
+        instructions, prompt = self.split_prompt_template(
+            self.get_prompt('generate_tags', DEFAULT_CLAUDE_TAG_PROMPT),
+            product_title=product.title,
+            product_description=self.prompt_description(product, 'generate_tags')
+        )
+        return {
+            "model": self.model_for('generate_tags'),
+            "max_tokens": 500,
+            "temperature": 0.2,
+            "system": self._system_blocks(CLAUDE_TAG_SYSTEM_PROMPT, instructions),
+            "messages": [{"role": "user", "content": prompt}]
+        }
+
+    @staticmethod
+    def _batch_summary(batch: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "batch_id": batch.get("id"),
+            "status": batch.get("processing_status"),
+            "counts": batch.get("request_counts") or {},
+            "results_url": batch.get("results_url"),
+        }
+
+    @routed_task('generate_tags')
+    async def submit_tag_batch(self, products: List[Any]) -> Dict[str, Any]:
+        """Submit one Message Batch with a tagging request per product (custom_id = batch_custom_id(product))."""
+        if not self.api_key:
+            raise ValueError("Anthropic API key is missing.")
+        body = {"requests": [
+            {"custom_id": self.batch_custom_id(product), "params": self.build_tag_request(product)}
+            for product in products
+        ]}
+        request = {"model": self.model_for('generate_tags'), "batch_size": len(products)}
+        options = {"headers": {"anthropic-beta": PROMPT_CACHING_BETA}}
+        batch = await self._execute(request, lambda: self._get_client().post("/v1/messages/batches", body=body, cast_to=object, options=options))
+        print(f"Submitted Claude message batch {batch.get('id')} with {len(products)} requests")
+        return self._batch_summary(batch)
+
+    async def get_tag_batch_status(self, batch_id: str) -> Dict[str, Any]:
+        """Poll a Message Batch; status is 'in_progress', 'canceling' or 'ended'."""
+        request = {"model": self.model_name, "batch_id": batch_id}
+        batch = await self._execute(request, lambda: self._get_client().get(f"/v1/messages/batches/{batch_id}", cast_to=object))
+        return self._batch_summary(batch)
+
+    async def iter_tag_batch_results(self, batch_id: str) -> AsyncIterator[Tuple[str, Optional[List[str]]]]:
+        """
+        Stream the results of an ended batch, yielding (custom_id, tags) per line of the
+        JSONL results file. Tags are None for requests that errored, expired or were canceled.
+        """
+        status = await self.get_tag_batch_status(batch_id)
+        if status["status"] != "ended":
+            raise ValueError(f"Batch {batch_id} has not ended yet (status: {status['status']})")
+        client = self._get_client()
+        http_client = self._http_clients[asyncio.get_running_loop()]
+        results_url = status["results_url"] or f"{str(client.base_url).rstrip('/')}/v1/messages/batches/{batch_id}/results"
+        async with http_client.stream("GET", results_url, headers=client.default_headers) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                result = entry.get("result") or {}
+                if result.get("type") != "succeeded":
+                    print(f"Batch request {entry.get('custom_id')} did not succeed: {result.get('type')} {result.get('error')}")
+                    yield entry.get("custom_id"), None
+                    continue
+                content = (result.get("message") or {}).get("content") or []
+                tags_text = "".join(block.get("text", "") for block in content if block.get("type") == "text").strip()
+                yield entry.get("custom_id"), self.clean_tags(tags_text)
+
+    @routed_task('generate_tags')
     async def generate_tags_async(self, product: Any) -> Tuple[Any, List[str]]:
         """Generate tags for a product using Claude asynchronously."""
         print(f"Generating Claude tags for product: {product.title}")
@@ -182,18 +432,20 @@ class ClaudeService(BaseAIService):
             print("API key is missing, returning api_key_missing tag")
             return product, ["api_key_missing"]
 
-        # Prepare the prompt using the base class method
+        # Prepare the prompt using the base class method; the static instructions become the cached prefix
         prompt_template = self.get_prompt('generate_tags', DEFAULT_CLAUDE_TAG_PROMPT)
-        prompt = prompt_template.format(
+        instructions, prompt = self.split_prompt_template(
+            prompt_template,
             product_title=product.title,
-            product_description=product.description
+            product_description=self.prompt_description(product, 'generate_tags')
         )
-        system_prompt = "You are a product tagging expert that generates specific, meaningful tags that avoid generic terms and focus on distinctive product attributes."
+        system_prompt = CLAUDE_TAG_SYSTEM_PROMPT
 
         try:
             tags_text = await self._call_claude_api(
                 system_prompt=system_prompt,
                 user_prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=500,
                 temperature=0.2
             )
@@ -210,6 +462,7 @@ class ClaudeService(BaseAIService):
             return product, ["error generating tags"]
 
 
+    @routed_task('analyze_product_for_collection')
     async def analyze_product_for_collection_async(self, product: Any) -> Tuple[Any, Optional[str]]:
         """Analyze a product to determine its primary collection/category using Claude."""
         print(f"Analyzing product for collection using Claude: {product.title}")
@@ -218,9 +471,10 @@ class ClaudeService(BaseAIService):
             return product, None
 
         prompt_template = self.get_prompt('analyze_product_for_collection', DEFAULT_CLAUDE_COLLECTION_ANALYSIS_PROMPT)
-        prompt = prompt_template.format(
+        instructions, prompt = self.split_prompt_template(
+            prompt_template,
             product_title=product.title,
-            product_description=product.description,
+            product_description=self.prompt_description(product, 'analyze_product_for_collection'),
             product_tags=', '.join([tag.name for tag in product.tags]) if product.tags else 'None'
         )
         system_prompt = "You are a product categorization expert that determines specific, meaningful categories for products, avoiding generic terms."
@@ -229,6 +483,7 @@ class ClaudeService(BaseAIService):
             category = await self._call_claude_api(
                 system_prompt=system_prompt,
                 user_prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=50,
                 temperature=0.1
             )
@@ -250,6 +505,7 @@ class ClaudeService(BaseAIService):
             return product, None # Indicate failure
 
 
+    @routed_task('generate_collection_description')
     async def generate_collection_description_async(self, tag_name: str, product_count: int, product_examples: List[Dict[str, str]]) -> str:
         """Generate a description for a collection using Claude."""
         print(f"Generating Claude collection description for: {tag_name}")
@@ -259,7 +515,8 @@ class ClaudeService(BaseAIService):
             return default_desc
 
         prompt_template = self.get_prompt('generate_collection_description', DEFAULT_CLAUDE_COLLECTION_DESC_PROMPT)
-        prompt = prompt_template.format(
+        instructions, prompt = self.split_prompt_template(
+            prompt_template,
             tag_name=tag_name,
             product_count=product_count,
             product_examples_json=json.dumps(product_examples, indent=2)
@@ -270,6 +527,7 @@ class ClaudeService(BaseAIService):
             description = await self._call_claude_api(
                 system_prompt=system_prompt,
                 user_prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=1000, # Allow longer descriptions
                 temperature=0.7  # Higher temperature for creativity
             )
@@ -285,6 +543,7 @@ class ClaudeService(BaseAIService):
             return default_desc
 
 
+    @routed_task('generate_collection_meta_description')
     async def generate_collection_meta_description_async(self, tag_name: str, product_titles_text: str) -> str:
         """Generate a meta description for a collection using Claude."""
         print(f"Generating Claude meta description for: {tag_name}")
@@ -294,7 +553,8 @@ class ClaudeService(BaseAIService):
             return default_meta
 
         prompt_template = self.get_prompt('generate_collection_meta_description', DEFAULT_CLAUDE_META_DESC_PROMPT)
-        prompt = prompt_template.format(
+        instructions, prompt = self.split_prompt_template(
+            prompt_template,
             tag_name=tag_name,
             product_titles_text=product_titles_text
         )
@@ -304,6 +564,7 @@ class ClaudeService(BaseAIService):
             meta_description = await self._call_claude_api(
                 system_prompt=system_prompt,
                 user_prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=60, # Meta descriptions are short, ~160 chars = ~40-50 tokens
                 temperature=0.4
             )
@@ -324,6 +585,7 @@ class ClaudeService(BaseAIService):
             return default_meta
 
 
+    @routed_task('generate_keyword_map')
     async def generate_keyword_map_async(self, concept: str) -> Dict[str, Any]:
         """Generate a semantic keyword map based on a store concept using Claude."""
         print(f"Generating Claude keyword map for concept: {concept[:50]}...")
@@ -336,13 +598,14 @@ class ClaudeService(BaseAIService):
             return default_map
 
         prompt_template = self.get_prompt('generate_keyword_map', DEFAULT_CLAUDE_KEYWORD_MAP_PROMPT)
-        prompt = prompt_template.format(concept=concept)
+        instructions, prompt = self.split_prompt_template(prompt_template, concept=concept)
         system_prompt = "You are an SEO expert generating structured keyword data in JSON format based on a provided concept."
 
         try:
             response_text = await self._call_claude_api(
                 system_prompt=system_prompt,
                 user_prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=1000, # Allow ample tokens for JSON structure
                 temperature=0.3  # Lower temperature for structured output
             )
@@ -377,38 +640,60 @@ class ClaudeService(BaseAIService):
 
     # --- Blog Generation Methods (Placeholders) ---
 
+    @routed_task('generate_outline')
     async def generate_outline_async(self, context: Dict[str, Any]) -> List[str]:
-        """Generate a blog post outline using Claude (Placeholder)."""
+        """Generate a blog post outline (list of section headings) using Claude."""
         print(f"ClaudeService: Generating outline with context: {context.get('tag_name', 'N/A')}")
         if not self.api_key:
             print("API key is missing, cannot generate outline.")
             return ["Outline generation requires API key."]
 
-        # TODO: Implement actual prompt construction and API call
-        # Example context keys: 'tag_name', 'store_concept', 'target_audience',
-        # 'tone_of_voice', 'sitemap_url', 'product_examples', 'existing_blogs'.
-
-        # Placeholder implementation
-        await asyncio.sleep(0.1) # Simulate async call
-        return [
-            f"Introduction to {context.get('tag_name', 'Topic')}",
-            f"Key Feature 1 of {context.get('tag_name', 'Topic')}",
-            f"Benefit of using {context.get('tag_name', 'Topic')}",
-            f"Conclusion about {context.get('tag_name', 'Topic')}"
-        ]
+        tag_name = context.get('tag_name', 'Topic')
+        default_outline = [f"What Makes {tag_name} Special", f"Choosing the Right {tag_name}", f"Getting the Most from {tag_name}"]
+        instructions, task = self.split_prompt_template(self.get_prompt('generate_outline', DEFAULT_CLAUDE_OUTLINE_PROMPT), tag_name=tag_name)
 
-    async def generate_content_block_async(self, context: Dict[str, Any]) -> str:
-        """Generate a block of content for a blog post using Claude (Placeholder)."""
-        outline_point = context.get('outline_point', 'this section')
-        print(f"ClaudeService: Generating content block for: {outline_point}")
+        try:
+            response_text = await self._call_claude_api(
+                system_prompt=BLOG_SYSTEM_PROMPT,
+                user_prompt=task,
+                cached_prefix=f"{self.build_blog_context_prefix(context)}\n\n{instructions}",
+                max_tokens=500,
+                temperature=0.5
+            )
+            json_start = response_text.find('[')
+            json_end = response_text.rfind(']') + 1
+            outline = json.loads(response_text[json_start:json_end]) if json_start != -1 and json_end > json_start else None
+            if isinstance(outline, list) and outline and all(isinstance(item, str) for item in outline):
+                return [item.strip() for item in outline if item.strip()]
+            print(f"Warning: Could not parse Claude outline for '{tag_name}', using default outline.")
+            return default_outline
+        except json.JSONDecodeError as e:
+            print(f"Error decoding Claude outline JSON: {e}")
+            return default_outline
+
+    @routed_task('generate_content_block')
+    async def generate_content_block_async(self, context: Dict[str, Any], prompt_override: Optional[str] = None,
+                                           on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Generate a block of content for a blog post section using Claude (streamed to on_delta if given)."""
+        section_topic = context.get('section_topic') or context.get('outline_point', 'this section')
+        print(f"ClaudeService: Generating content block for: {section_topic}")
         if not self.api_key:
             print("API key is missing, cannot generate content block.")
-            return f"<p>Content generation requires an API key. This section is about: {outline_point}</p>"
-
-        # TODO: Implement actual prompt construction and API call
-        # Example context keys: 'outline_point', 'full_outline', 'tag_name',
-        # 'store_concept', 'target_audience', 'tone_of_voice'.
+            return f"<p>Content generation requires an API key. This section is about: {section_topic}</p>"
 
-        # Placeholder implementation
-        await asyncio.sleep(0.1) # Simulate async call
-        return f"<p>This is the generated content for the section about '{outline_point}'. It discusses the importance and details related to the main topic of {context.get('tag_name', 'the blog post')}, keeping in mind the target audience ({context.get('target_audience', 'general readers')}) and maintaining a {context.get('tone_of_voice', 'neutral')} tone.</p>"
\ No newline at end of file
+        # Store context, outline and writing guidelines are identical for every section of a post,
+        # so they form the cached prefix; only the section instruction changes per call
+        instructions, task = self.split_prompt_template(
+            self.get_prompt('generate_content_block', DEFAULT_CLAUDE_CONTENT_BLOCK_PROMPT),
+            section_topic=section_topic
+        )
+        request = dict(
+            system_prompt=BLOG_SYSTEM_PROMPT,
+            user_prompt=prompt_override or task,
+            cached_prefix=f"{self.build_blog_context_prefix(context)}\n\n{instructions}",
+            max_tokens=1500,
+            temperature=0.7
+        )
+        if on_delta:
+            return await self._stream_claude_api(**request, on_delta=on_delta)
+        return await self._call_claude_api(**request)
@@ -1,9 +1,15 @@
 import google.generativeai as genai
+from google.generativeai import caching
+from google.api_core import exceptions as google_exceptions
 import asyncio
+import hashlib
 import json
-from typing import List, Tuple, Dict, Any, Optional
+import time
+from datetime import timedelta
+from typing import List, Tuple, Dict, Any, Optional, Callable
 
-from .base import BaseAIService
+from .base import BaseAIService, estimate_tokens, routed_task
+from .cache import cached_completion, cached_stream
 from config import Config # To get API key if not provided directly
 
 # Default prompts specific to Gemini (might need adjustments)
@@ -11,9 +17,6 @@ from config import Config # To get API key if not provided directly
 DEFAULT_GEMINI_TAG_PROMPT = """
 Analyze the following product information and generate comprehensive, specific tags suitable for e-commerce collections.
 
-Product Title: {product_title}
-Product Description: {product_description}
-
 Generate tags based on these categories:
 - BASE TAGS: Nouns, adjectives, materials, colors, sizes, styles, product types, brand names.
 - FEATURE TAGS: Specific features, functionalities, technical specs, special attributes.
@@ -28,41 +31,44 @@ Guidelines:
 - Combine related concepts (e.g., "stainless steel coffee maker").
 
 Return ONLY the tags as a single comma-separated string.
+
+Product Title: {product_title}
+Product Description: {product_description}
 """
 
 # Placeholder prompts for other methods - these will need refinement for Gemini
 DEFAULT_GEMINI_COLLECTION_ANALYSIS_PROMPT = """
 Analyze the product and determine the single most appropriate primary category (2-3 words, lowercase). Focus on product type, material, or function. Avoid generic terms.
 
+Return ONLY the category name.
+
 Product Title: {product_title}
 Product Description: {product_description}
 Current Tags: {product_tags}
-
-Return ONLY the category name.
 """
 
 DEFAULT_GEMINI_COLLECTION_DESC_PROMPT = """
-Create a unique, engaging HTML description (3-5 paragraphs, use h2/h3 for headings) for a collection named '{tag_name}' with {product_count} products. Highlight key features/benefits. Be conversational.
+Create a unique, engaging HTML description (3-5 paragraphs, use h2/h3 for headings) for the collection below. Highlight key features/benefits. Be conversational.
 
+Return ONLY the HTML content.
+
+Collection: '{tag_name}' ({product_count} products)
 Example Products:
 {product_examples_json}
-
-Return ONLY the HTML content.
 """
 
 DEFAULT_GEMINI_META_DESC_PROMPT = """
-Create a concise, SEO-friendly meta description (150-160 chars max) for the collection '{tag_name}'. Include the collection name and encourage clicks. Do not mention shipping/price. Focus on value.
-
-Example Product Titles: {product_titles_text}
+Create a concise, SEO-friendly meta description (150-160 chars max) for the collection below. Include the collection name and encourage clicks. Do not mention shipping/price. Focus on value.
 
 Return ONLY the meta description text.
+
+Collection: '{tag_name}'
+Example Product Titles: {product_titles_text}
 """
 
 DEFAULT_GEMINI_KEYWORD_MAP_PROMPT = """
 Analyze the store concept below and generate a semantic keyword map in JSON format.
 
-Store Concept: {concept}
-
 Generate a JSON object with these keys: "core_concepts", "related_topics", "long_tail_keywords", "audience_descriptors".
 - "core_concepts": List of 3-5 primary keywords for the concept.
 - "related_topics": List of 5-10 keywords for related themes/categories.
@@ -73,6 +79,30 @@ Guidelines:
 - All keywords must be lowercase.
 - Focus on relevant e-commerce/SEO terms.
 - Output ONLY the valid JSON object. Do not include ```json markdown or any other text.
+
+Store Concept: {concept}
+"""
+
+DEFAULT_GEMINI_OUTLINE_PROMPT = """
+Create a detailed outline for a blog post about the topic below, using the store context above.
+- 4-6 section headings; no introduction or conclusion (written separately).
+- Work the listed products in where relevant and avoid topics of the existing posts.
+- Suit the target audience and tone of voice.
+
+Output ONLY a JSON list of section heading strings. Do not include ```json markdown or any other text.
+
+Topic: '{tag_name}'
+"""
+
+DEFAULT_GEMINI_CONTENT_BLOCK_PROMPT = """
+Write the content for one section of the blog post described above.
+- 2-4 paragraphs of HTML (<p>, plus <ul>/<li> where useful); no headings.
+- Stay on this section's topic; other sections are written separately.
+- Match the target audience and tone of voice, mentioning products naturally.
+
+Return ONLY the HTML content.
+
+Section: '{section_topic}'
 """
 
 class GeminiService(BaseAIService):
@@ -80,12 +110,23 @@ class GeminiService(BaseAIService):
 
     # Common models: 'gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-1.0-pro'
     DEFAULT_MODEL = "gemini-1.5-flash" # Or choose another default
+    # Short, structured outputs go to the smaller flash model; long-form stays on DEFAULT_MODEL
+    DEFAULT_MODEL_ROUTES = {
+        'generate_tags': "gemini-1.5-flash-8b",
+        'analyze_product_for_collection': "gemini-1.5-flash-8b",
+        'generate_collection_meta_description': "gemini-1.5-flash-8b",
+    }
 
     def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None, custom_prompts: Optional[Dict[str, str]] = None):
         """Initialize the Gemini client."""
         resolved_api_key = api_key or Config.GEMINI_API_KEY # Fallback to config
         resolved_model_name = model_name or self.DEFAULT_MODEL
         super().__init__(api_key=resolved_api_key, model_name=resolved_model_name, custom_prompts=custom_prompts)
+        # Context caches by prefix hash: (refresh_at, model bound to the cache)
+        self._context_caches: Dict[str, Tuple[float, Any]] = {}
+        self._context_cache_failures = set()
+        # Clients for routed models other than model_name (see _model_client)
+        self._routed_clients: Dict[str, Any] = {}
 
         if not self.api_key:
             print("Warning: Gemini API key is missing.")
@@ -116,23 +157,98 @@ class GeminiService(BaseAIService):
                 print(f"Error configuring Gemini client: {e}")
                 self.client = None
 
-    async def _call_gemini_api(self, prompt: str, max_tokens: int, temperature: float) -> str:
-        """Helper method to call the Gemini API asynchronously."""
+    def _model_client(self, model_name: str) -> Any:
+        """The GenerativeModel for `model_name`: self.client for the service's model, else one per routed model."""
+        if model_name == self.model_name or not self.client:
+            return self.client
+        client = self._routed_clients.get(model_name)
+        if client is None:
+            client = self._routed_clients[model_name] = genai.GenerativeModel(
+                model_name=model_name,
+                safety_settings=self.safety_settings,
+                generation_config=self.generation_config
+            )
+        return client
+
+    def _is_rate_limit_error(self, error: Exception) -> bool:
+        """Quota exhaustion (429) and temporary unavailability (503) are retried with backoff."""
+        return isinstance(error, (google_exceptions.ResourceExhausted,
+                                  google_exceptions.TooManyRequests,
+                                  google_exceptions.ServiceUnavailable))
+
+    async def _get_context_cached_model(self, prefix: str) -> Optional[Any]:
+        """
+        Return a model bound to a Gemini context cache holding `prefix`, creating the cache on
+        first use. Context caching has a large minimum size and needs an explicitly versioned
+        model, so this returns None (send the prefix inline) when it isn't possible.
+        """
+        if estimate_tokens(prefix) < int(Config.GEMINI_CONTEXT_CACHE_MIN_TOKENS or 32768):
+            return None
+        model_name = self.active_model
+        key = hashlib.sha256(f"{model_name}\n{prefix}".encode('utf-8')).hexdigest()
+        if key in self._context_cache_failures:
+            return None
+        entry = self._context_caches.get(key)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        ttl_seconds = int(Config.GEMINI_CONTEXT_CACHE_TTL_SECONDS or 3600)
+        try:
+            cached_content = await asyncio.to_thread(
+                caching.CachedContent.create,
+                model=model_name,
+                system_instruction=prefix,
+                ttl=timedelta(seconds=ttl_seconds)
+            )
+            model = genai.GenerativeModel.from_cached_content(cached_content, safety_settings=self.safety_settings)
+        except Exception as e:
+            print(f"Gemini context caching unavailable for {model_name}, sending prefix inline: {e}")
+            self._context_cache_failures.add(key)
+            return None
+        # Refresh a little before the server-side expiry
+        self._context_caches[key] = (time.time() + ttl_seconds * 0.9, model)
+        return model
+
+    @cached_completion
+    async def _call_gemini_api(self, prompt: str, max_tokens: int, temperature: float,
+                               cached_prefix: Optional[str] = None) -> str:
+        """
+        Helper method to call the Gemini API asynchronously.
+
+        Args:
+            cached_prefix: Static instructions/context shared across calls. Served from a
+                           context cache when large enough, otherwise sent first in the prompt
+                           so the stable prefix comes before the per-call variables.
+        """
         if not self.client:
             raise ValueError("Gemini client is not configured (likely missing API key).")
 
         try:
+            model = self._model_client(self.active_model)
+            if cached_prefix:
+                cached_model = await self._get_context_cached_model(cached_prefix)
+                if cached_model is not None:
+                    model = cached_model
+                else:
+                    prompt = f"{cached_prefix}\n\n{prompt}"
             # Create a specific generation config for this call if temperature/max_tokens differ
             current_config = genai.types.GenerationConfig(
                 max_output_tokens=max_tokens,
                 temperature=temperature
             )
+            request = {"model": self.active_model, "prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
             # Use generate_content_async for async calls
-            response = await self.client.generate_content_async(
+            response = await self._execute(request, lambda: model.generate_content_async(
                 prompt,
                 generation_config=current_config
                 # stream=False # Default is False
-            )
+            ))
+            usage = getattr(response, 'usage_metadata', None)
+            if usage is not None:
+                self.record_prompt_cache_usage(
+                    input_tokens=getattr(usage, 'prompt_token_count', 0),
+                    cache_read_input_tokens=getattr(usage, 'cached_content_token_count', 0),
+                    output_tokens=getattr(usage, 'candidates_token_count', 0)
+                )
 
             # Handle potential safety blocks or empty responses
             if not response.candidates:
@@ -157,7 +273,72 @@ class GeminiService(BaseAIService):
             # print(f"Failed prompt: {prompt}")
             raise # Re-raise for handling upstream
 
+    @cached_stream
+    async def _stream_gemini_api(self, prompt: str, max_tokens: int, temperature: float,
+                                 cached_prefix: Optional[str] = None, on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Streaming variant of _call_gemini_api: on_delta gets each text chunk; returns the full text."""
+        if not self.client:
+            raise ValueError("Gemini client is not configured (likely missing API key).")
+
+        model = self._model_client(self.active_model)
+        if cached_prefix:
+            cached_model = await self._get_context_cached_model(cached_prefix)
+            if cached_model is not None:
+                model = cached_model
+            else:
+                prompt = f"{cached_prefix}\n\n{prompt}"
+        current_config = genai.types.GenerationConfig(
+            max_output_tokens=max_tokens,
+            temperature=temperature
+        )
+        request = {"model": self.active_model, "prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
+        parts: List[str] = []
+
+        async def send():
+            try:
+                response = await model.generate_content_async(prompt, generation_config=current_config, stream=True)
+                async for chunk in response:
+                    # Chunks blocked by safety filters carry no text
+                    text = chunk.text if chunk.candidates and chunk.candidates[0].content.parts else ""
+                    if text:
+                        parts.append(text)
+                        if on_delta:
+                            on_delta(text)
+                return response
+            except Exception as e:
+                if parts:
+                    # Text was already forwarded, so a retry would repeat it
+                    raise RuntimeError(f"Gemini stream interrupted: {e}") from e
+                raise
 
+        try:
+            response = await self._execute(request, send)
+        except Exception as e:
+            print(f"An error occurred during Gemini streaming call: {e}")
+            raise
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.record_prompt_cache_usage(
+                input_tokens=getattr(usage, 'prompt_token_count', 0),
+                cache_read_input_tokens=getattr(usage, 'cached_content_token_count', 0),
+                output_tokens=getattr(usage, 'candidates_token_count', 0)
+            )
+        if not parts:
+            block_reason = response.prompt_feedback.block_reason if getattr(response, 'prompt_feedback', None) else "Unknown"
+            print(f"Warning: Gemini stream blocked or empty. Reason: {block_reason}")
+            return f"error: response blocked ({block_reason})"
+        return "".join(parts).strip()
+
+    async def complete_async(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                             cached_prefix: Optional[str] = None) -> str:
+        """Generic completion used by shared pipelines; Gemini takes the system text inline."""
+        prefix = f"{system_prompt}\n\n{cached_prefix}" if cached_prefix else system_prompt
+        response_text = await self._call_gemini_api(user_prompt, max_tokens, temperature, cached_prefix=prefix)
+        if response_text.startswith("error:"):
+            raise ValueError(f"Gemini completion failed: {response_text}")
+        return response_text
+
+    @routed_task('generate_tags')
     async def generate_tags_async(self, product: Any) -> Tuple[Any, List[str]]:
         """Generate tags for a product using Gemini asynchronously."""
         print(f"Generating Gemini tags for product: {product.title}")
@@ -166,16 +347,18 @@ class GeminiService(BaseAIService):
             print("Gemini client not configured, returning api_key_missing tag")
             return product, ["api_key_missing"]
 
-        # Prepare the prompt using the base class method
+        # Prepare the prompt using the base class method; the static instructions become the cached prefix
         prompt_template = self.get_prompt('generate_tags', DEFAULT_GEMINI_TAG_PROMPT)
-        prompt = prompt_template.format(
+        instructions, prompt = self.split_prompt_template(
+            prompt_template,
             product_title=product.title,
-            product_description=product.description
+            product_description=self.prompt_description(product, 'generate_tags')
         )
 
         try:
             tags_text = await self._call_gemini_api(
                 prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=500, # Adjust as needed
                 temperature=0.2 # Low temp for consistent tagging
             )
@@ -198,6 +381,7 @@ class GeminiService(BaseAIService):
     # --- Placeholder implementations for other methods ---
     # These need to be fully implemented similar to generate_tags_async
 
+    @routed_task('analyze_product_for_collection')
     async def analyze_product_for_collection_async(self, product: Any) -> Tuple[Any, Optional[str]]:
         """Analyze a product to determine its primary collection/category using Gemini."""
         print(f"Analyzing product for collection using Gemini: {product.title}")
@@ -206,15 +390,17 @@ class GeminiService(BaseAIService):
             return product, None
 
         prompt_template = self.get_prompt('analyze_product_for_collection', DEFAULT_GEMINI_COLLECTION_ANALYSIS_PROMPT)
-        prompt = prompt_template.format(
+        instructions, prompt = self.split_prompt_template(
+            prompt_template,
             product_title=product.title,
-            product_description=product.description,
+            product_description=self.prompt_description(product, 'analyze_product_for_collection'),
             product_tags=', '.join([tag.name for tag in product.tags]) if product.tags else 'None'
         )
 
         try:
             category = await self._call_gemini_api(
                 prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=50,
                 temperature=0.1
             )
@@ -239,6 +425,7 @@ class GeminiService(BaseAIService):
             print(f"Error analyzing product for collection with Gemini: {e}")
             return product, None
 
+    @routed_task('generate_collection_description')
     async def generate_collection_description_async(self, tag_name: str, product_count: int, product_examples: List[Dict[str, str]]) -> str:
         """Generate a description for a collection using Gemini."""
         print(f"Generating Gemini collection description for: {tag_name}")
@@ -248,7 +435,8 @@ class GeminiService(BaseAIService):
              return default_desc
 
         prompt_template = self.get_prompt('generate_collection_description', DEFAULT_GEMINI_COLLECTION_DESC_PROMPT)
-        prompt = prompt_template.format(
+        instructions, prompt = self.split_prompt_template(
+            prompt_template,
             tag_name=tag_name,
             product_count=product_count,
             product_examples_json=json.dumps(product_examples, indent=2)
@@ -257,6 +445,7 @@ class GeminiService(BaseAIService):
         try:
             description = await self._call_gemini_api(
                 prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=1000,
                 temperature=0.7 # Higher temp for creativity
             )
@@ -276,6 +465,7 @@ class GeminiService(BaseAIService):
             print(f"Error generating Gemini collection description for {tag_name}: {e}")
             return default_desc
 
+    @routed_task('generate_collection_meta_description')
     async def generate_collection_meta_description_async(self, tag_name: str, product_titles_text: str) -> str:
         """Generate a meta description for a collection using Gemini."""
         print(f"Generating Gemini meta description for: {tag_name}")
@@ -285,7 +475,8 @@ class GeminiService(BaseAIService):
             return default_meta
 
         prompt_template = self.get_prompt('generate_collection_meta_description', DEFAULT_GEMINI_META_DESC_PROMPT)
-        prompt = prompt_template.format(
+        instructions, prompt = self.split_prompt_template(
+            prompt_template,
             tag_name=tag_name,
             product_titles_text=product_titles_text
         )
@@ -293,6 +484,7 @@ class GeminiService(BaseAIService):
         try:
             meta_description = await self._call_gemini_api(
                 prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=60,
                 temperature=0.4
             )
@@ -317,6 +509,7 @@ class GeminiService(BaseAIService):
             print(f"Error generating Gemini meta description for {tag_name}: {e}")
             return default_meta
 
+    @routed_task('generate_keyword_map')
     async def generate_keyword_map_async(self, concept: str) -> Dict[str, Any]:
         """Generate a semantic keyword map based on a store concept using Gemini."""
         print(f"Generating Gemini keyword map for concept: {concept[:50]}...")
@@ -329,11 +522,12 @@ class GeminiService(BaseAIService):
             return default_map
 
         prompt_template = self.get_prompt('generate_keyword_map', DEFAULT_GEMINI_KEYWORD_MAP_PROMPT)
-        prompt = prompt_template.format(concept=concept)
+        instructions, prompt = self.split_prompt_template(prompt_template, concept=concept)
 
         try:
             response_text = await self._call_gemini_api(
                 prompt=prompt,
+                cached_prefix=instructions,
                 max_tokens=1000, # Allow ample tokens for JSON
                 temperature=0.3  # Lower temperature for structured JSON output
             )
@@ -373,38 +567,60 @@ class GeminiService(BaseAIService):
 
     # --- Blog Generation Methods (Placeholders) ---
 
+    @routed_task('generate_outline')
     async def generate_outline_async(self, context: Dict[str, Any]) -> List[str]:
-        """Generate a blog post outline using Gemini (Placeholder)."""
+        """Generate a blog post outline (list of section headings) using Gemini."""
         print(f"GeminiService: Generating outline with context: {context.get('tag_name', 'N/A')}")
         if not self.client:
             print("Gemini client not configured, cannot generate outline.")
             return ["Outline generation requires API key/client configuration."]
 
-        # TODO: Implement actual prompt construction and API call using _call_gemini_api
-        # Example context keys: 'tag_name', 'store_concept', 'target_audience',
-        # 'tone_of_voice', 'sitemap_url', 'product_examples', 'existing_blogs'.
-
-        # Placeholder implementation
-        await asyncio.sleep(0.1) # Simulate async call
-        return [
-            f"Gemini Intro to {context.get('tag_name', 'Topic')}",
-            f"Gemini Point 1 about {context.get('tag_name', 'Topic')}",
-            f"Gemini Point 2 about {context.get('tag_name', 'Topic')}",
-            f"Gemini Conclusion for {context.get('tag_name', 'Topic')}"
-        ]
-
-    async def generate_content_block_async(self, context: Dict[str, Any]) -> str:
-        """Generate a block of content for a blog post using Gemini (Placeholder)."""
-        outline_point = context.get('outline_point', 'this section')
-        print(f"GeminiService: Generating content block for: {outline_point}")
+        tag_name = context.get('tag_name', 'Topic')
+        default_outline = [f"What Makes {tag_name} Special", f"Choosing the Right {tag_name}", f"Getting the Most from {tag_name}"]
+        instructions, task = self.split_prompt_template(self.get_prompt('generate_outline', DEFAULT_GEMINI_OUTLINE_PROMPT), tag_name=tag_name)
+
+        response_text = await self._call_gemini_api(
+            prompt=task,
+            cached_prefix=f"{self.build_blog_context_prefix(context)}\n\n{instructions}",
+            max_tokens=500,
+            temperature=0.5
+        )
+        try:
+            json_start = response_text.find('[')
+            json_end = response_text.rfind(']') + 1
+            outline = json.loads(response_text[json_start:json_end]) if json_start != -1 and json_end > json_start else None
+        except json.JSONDecodeError as e:
+            print(f"Error decoding Gemini outline JSON: {e}")
+            outline = None
+        if isinstance(outline, list) and outline and all(isinstance(item, str) for item in outline):
+            return [item.strip() for item in outline if item.strip()]
+        print(f"Warning: Could not parse Gemini outline for '{tag_name}', using default outline.")
+        return default_outline
+
+    @routed_task('generate_content_block')
+    async def generate_content_block_async(self, context: Dict[str, Any], prompt_override: Optional[str] = None,
+                                           on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Generate a block of content for a blog post section using Gemini (streamed to on_delta if given)."""
+        section_topic = context.get('section_topic') or context.get('outline_point', 'this section')
+        print(f"GeminiService: Generating content block for: {section_topic}")
         if not self.client:
             print("Gemini client not configured, cannot generate content block.")
-            return f"<p>Content generation requires Gemini client configuration. This section is about: {outline_point}</p>"
-
-        # TODO: Implement actual prompt construction and API call using _call_gemini_api
-        # Example context keys: 'outline_point', 'full_outline', 'tag_name',
-        # 'store_concept', 'target_audience', 'tone_of_voice'.
+            return f"<p>Content generation requires Gemini client configuration. This section is about: {section_topic}</p>"
 
-        # Placeholder implementation
-        await asyncio.sleep(0.1) # Simulate async call
-        return f"<p>This is the Gemini-generated content for the section '{outline_point}'. It elaborates on this point within the context of {context.get('tag_name', 'the blog post')}, tailored for {context.get('target_audience', 'the audience')} with a {context.get('tone_of_voice', 'standard')} tone.</p>"
\ No newline at end of file
+        instructions, task = self.split_prompt_template(
+            self.get_prompt('generate_content_block', DEFAULT_GEMINI_CONTENT_BLOCK_PROMPT),
+            section_topic=section_topic
+        )
+        request = dict(
+            prompt=prompt_override or task,
+            cached_prefix=f"{self.build_blog_context_prefix(context)}\n\n{instructions}",
+            max_tokens=1500,
+            temperature=0.7
+        )
+        if on_delta:
+            content = await self._stream_gemini_api(**request, on_delta=on_delta)
+        else:
+            content = await self._call_gemini_api(**request)
+        if content.startswith("error:"):
+            raise ValueError(f"Gemini content generation failed: {content}")
+        return content
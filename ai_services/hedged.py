@@ -0,0 +1,215 @@
+"""
+Hedged requests and failover across two AI providers.
+
+A bulk job is only as fast as its slowest calls: when one provider has a latency spike,
+every worker ends up waiting out that provider's tail. HedgedAIService wraps a primary
+and a secondary service behind the BaseAIService interface and, for calls that run past
+the primary's usual p95 latency, races a duplicate on the secondary.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import List, Tuple, Dict, Any, Optional, Callable, AsyncIterator
+
+from config import Config
+from .base import BaseAIService, FAILED_TAG_RESULTS, RetryBudget, _current_task, _provider_errors, routed_task
+
+
+def is_valid_result(method: str, result: Any) -> bool:
+    """Whether a provider answer is usable; provider methods return fallbacks (not exceptions) on failure."""
+    if method == 'generate_tags_async':
+        return result[1] not in FAILED_TAG_RESULTS
+    if method == 'analyze_product_for_collection_async':
+        return result[1] is not None
+    return bool(result)
+
+
+class HedgedAIService(BaseAIService):
+    """
+    Runs every call on a primary provider and, once the call has taken longer than the
+    primary's recent p95 latency for that task, sends a duplicate ("hedge") to a secondary
+    provider. The first valid answer wins and the other call is cancelled. A provider
+    failure falls back to the other provider straight away.
+
+    Hedges are capped by a budget: each call deposits `hedge_budget_ratio` tokens and each
+    hedge spends one, so at most that share of calls is duplicated even when the primary
+    is slow across the board. A burst of primary failures (`failover_error_threshold`
+    within `failover_window_seconds`) fails over entirely: the secondary serves every
+    call, without hedging, for `failover_cooldown_seconds`.
+    """
+
+    def __init__(self, primary: BaseAIService, secondary: BaseAIService, hedge_budget_ratio: Optional[float] = None,
+                 hedge_percentile: float = 0.95, hedge_min_samples: int = 20,
+                 failover_error_threshold: Optional[int] = None, failover_window_seconds: Optional[float] = None,
+                 failover_cooldown_seconds: Optional[float] = None):
+        super().__init__(api_key=primary.api_key, model_name=primary.model_name, custom_prompts=primary.custom_prompts)
+        self.primary = primary
+        self.secondary = secondary
+        # Prompt cache usage is recorded by the providers themselves
+        self.prompt_cache_stats = primary.prompt_cache_stats
+        # No hedging until the primary has this many latency samples for the task
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        ratio = float(Config.AI_HEDGE_BUDGET_RATIO or 0.05) if hedge_budget_ratio is None else hedge_budget_ratio
+        self.hedge_budget = RetryBudget(ratio=ratio, min_balance=0.0, max_balance=10.0)
+        self.failover_error_threshold = int(failover_error_threshold or Config.AI_FAILOVER_ERROR_THRESHOLD or 5)
+        self.failover_window_seconds = float(failover_window_seconds or Config.AI_FAILOVER_WINDOW_SECONDS or 30)
+        self.failover_cooldown_seconds = float(failover_cooldown_seconds or Config.AI_FAILOVER_COOLDOWN_SECONDS or 60)
+        self.hedge_stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_exhausted': 0, 'fallbacks': 0, 'failovers': 0}
+        self._primary_errors = deque()
+        self._failed_over_until = 0.0
+        self._failover_lock = threading.Lock()
+
+    @property
+    def supports_message_batches(self) -> bool:
+        return self.primary.supports_message_batches
+
+    @property
+    def failed_over(self) -> bool:
+        """Whether the secondary is currently serving every call after a burst of primary errors."""
+        return time.monotonic() < self._failed_over_until
+
+    def _record_primary_error(self) -> None:
+        now = time.monotonic()
+        with self._failover_lock:
+            if now < self._failed_over_until:
+                return
+            self._primary_errors.append(now)
+            while self._primary_errors[0] < now - self.failover_window_seconds:
+                self._primary_errors.popleft()
+            if len(self._primary_errors) < self.failover_error_threshold:
+                return
+            self._primary_errors.clear()
+            self._failed_over_until = now + self.failover_cooldown_seconds
+            self.hedge_stats['failovers'] += 1
+        print(f"{type(self.primary).__name__} failed {self.failover_error_threshold} times within "
+              f"{self.failover_window_seconds:.0f}s, failing over to {type(self.secondary).__name__} "
+              f"for {self.failover_cooldown_seconds:.0f}s")
+
+    def _hedge_delay(self, task: Optional[str]) -> Optional[float]:
+        """Seconds to wait for the primary before hedging (its recent p95 for the task), or None if unknown."""
+        latency_ms, samples = self.primary.latency_percentile(task or 'other', self.hedge_percentile)
+        if latency_ms is None or samples < self.hedge_min_samples:
+            return None
+        return latency_ms / 1000
+
+    def model_for(self, task: Optional[str] = None) -> str:
+        return (self.secondary if self.failed_over else self.primary).model_for(task)
+
+    def route_report(self) -> List[Dict[str, Any]]:
+        return self.primary.route_report() + self.secondary.route_report()
+
+    async def aclose(self) -> None:
+        await self.primary.aclose()
+        await self.secondary.aclose()
+
+    async def _attempt(self, service: BaseAIService, method: str, args: tuple, kwargs: dict) -> Tuple[Any, bool]:
+        """Call `method` on one provider; returns (result, valid)."""
+        errors = []
+        token = _provider_errors.set(errors)
+        try:
+            result = await getattr(service, method)(*args, **kwargs)
+        finally:
+            _provider_errors.reset(token)
+        return result, not errors and is_valid_result(method, result)
+
+    async def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """Run `method` with hedging and fallback; returns the first valid answer (or the first failure)."""
+        self.hedge_stats['calls'] += 1
+        self.hedge_budget.record_request()
+        if self.failed_over:
+            first, second, hedge_delay = self.secondary, self.primary, None
+        else:
+            first, second, hedge_delay = self.primary, self.secondary, self._hedge_delay(_current_task.get())
+
+        def start(service):
+            return asyncio.ensure_future(self._attempt(service, method, args, kwargs))
+
+        in_flight = {start(first): first}
+        second_started = hedged = False
+        failure = None
+        try:
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, timeout=None if second_started else hedge_delay,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than the primary's p95: duplicate the call if the budget allows
+                    hedge_delay = None
+                    if self.hedge_budget.try_spend():
+                        second_started = hedged = True
+                        self.hedge_stats['hedged'] += 1
+                        in_flight[start(second)] = second
+                    else:
+                        self.hedge_stats['budget_exhausted'] += 1
+                    continue
+                for finished in done:
+                    service = in_flight.pop(finished)
+                    try:
+                        result, valid = finished.result()
+                    except Exception:
+                        valid = False
+                    if valid:
+                        if hedged and service is second:
+                            self.hedge_stats['hedge_wins'] += 1
+                        return result
+                    if service is self.primary:
+                        self._record_primary_error()
+                    failure = failure or finished
+                if not in_flight and not second_started:
+                    # The first provider failed before the hedge point: ask the other one right away
+                    second_started = True
+                    self.hedge_stats['fallbacks'] += 1
+                    in_flight[start(second)] = second
+            result, _ = failure.result()
+            return result
+        finally:
+            for loser in in_flight:
+                loser.cancel()
+
+    @routed_task('generate_tags')
+    async def generate_tags_async(self, product: Any) -> Tuple[Any, List[str]]:
+        return await self._call('generate_tags_async', product)
+
+    @routed_task('analyze_product_for_collection')
+    async def analyze_product_for_collection_async(self, product: Any) -> Tuple[Any, Optional[str]]:
+        return await self._call('analyze_product_for_collection_async', product)
+
+    @routed_task('generate_collection_description')
+    async def generate_collection_description_async(self, tag_name: str, product_count: int, product_examples: List[Dict[str, str]]) -> str:
+        return await self._call('generate_collection_description_async', tag_name, product_count, product_examples)
+
+    @routed_task('generate_collection_meta_description')
+    async def generate_collection_meta_description_async(self, tag_name: str, product_titles_text: str) -> str:
+        return await self._call('generate_collection_meta_description_async', tag_name, product_titles_text)
+
+    @routed_task('generate_keyword_map')
+    async def generate_keyword_map_async(self, concept: str) -> Dict[str, Any]:
+        return await self._call('generate_keyword_map_async', concept)
+
+    @routed_task('generate_outline')
+    async def generate_outline_async(self, context: Dict[str, Any]) -> List[str]:
+        return await self._call('generate_outline_async', context)
+
+    @routed_task('generate_content_block')
+    async def generate_content_block_async(self, context: Dict[str, Any], prompt_override: Optional[str] = None,
+                                           on_delta: Optional[Callable[[str], None]] = None) -> str:
+        if on_delta:
+            # A streamed block is already on screen as it arrives, so it is never duplicated or retried elsewhere
+            service = self.secondary if self.failed_over else self.primary
+            return await service.generate_content_block_async(context, prompt_override, on_delta=on_delta)
+        return await self._call('generate_content_block_async', context, prompt_override)
+
+    async def complete_async(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                             cached_prefix: Optional[str] = None) -> str:
+        return await self._call('complete_async', system_prompt, user_prompt, max_tokens, temperature, cached_prefix=cached_prefix)
+
+    async def submit_tag_batch(self, products: List[Any]) -> Dict[str, Any]:
+        return await self.primary.submit_tag_batch(products)
+
+    async def get_tag_batch_status(self, batch_id: str) -> Dict[str, Any]:
+        return await self.primary.get_tag_batch_status(batch_id)
+
+    async def iter_tag_batch_results(self, batch_id: str) -> AsyncIterator[Tuple[str, Optional[List[str]]]]:
+        async for result in self.primary.iter_tag_batch_results(batch_id):
+            yield result
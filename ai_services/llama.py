@@ -0,0 +1,479 @@
+"""
+LlamaService: local models behind an OpenAI-compatible HTTP API (Ollama, llama.cpp server, vLLM).
+
+Calls go to {base_url}/chat/completions over one pooled httpx client per event loop.
+Local servers batch concurrent requests themselves (vLLM continuous batching, llama.cpp
+parallel slots), so keeping enough requests in flight on warm connections is most of the
+win. Servers that accept a list of prompts on /completions (vLLM, llama.cpp) can also
+take micro-batches: concurrent calls arriving within a short window are sent as one
+request. Servers that reject list prompts (Ollama) are detected on the first batch and
+fall back to one chat request per prompt.
+"""
+
+import asyncio
+import json
+import weakref
+from typing import List, Tuple, Dict, Any, Optional, Callable, Awaitable
+
+import httpx
+
+from .base import BaseAIService, routed_task
+from .cache import cached_completion
+from .claude import (
+    DEFAULT_CLAUDE_TAG_PROMPT, DEFAULT_CLAUDE_COLLECTION_ANALYSIS_PROMPT, DEFAULT_CLAUDE_COLLECTION_DESC_PROMPT,
+    DEFAULT_CLAUDE_META_DESC_PROMPT, DEFAULT_CLAUDE_KEYWORD_MAP_PROMPT, DEFAULT_CLAUDE_OUTLINE_PROMPT,
+    DEFAULT_CLAUDE_CONTENT_BLOCK_PROMPT, CLAUDE_TAG_SYSTEM_PROMPT, BLOG_SYSTEM_PROMPT,
+)
+from config import Config
+
+# The Claude prompts are plain instructions with no provider-specific markup, so local
+# instruction-tuned models get the same prompts (and custom prompt overrides) as Claude
+DEFAULT_LLAMA_TAG_PROMPT = DEFAULT_CLAUDE_TAG_PROMPT
+DEFAULT_LLAMA_COLLECTION_ANALYSIS_PROMPT = DEFAULT_CLAUDE_COLLECTION_ANALYSIS_PROMPT
+DEFAULT_LLAMA_COLLECTION_DESC_PROMPT = DEFAULT_CLAUDE_COLLECTION_DESC_PROMPT
+DEFAULT_LLAMA_META_DESC_PROMPT = DEFAULT_CLAUDE_META_DESC_PROMPT
+DEFAULT_LLAMA_KEYWORD_MAP_PROMPT = DEFAULT_CLAUDE_KEYWORD_MAP_PROMPT
+DEFAULT_LLAMA_OUTLINE_PROMPT = DEFAULT_CLAUDE_OUTLINE_PROMPT
+DEFAULT_LLAMA_CONTENT_BLOCK_PROMPT = DEFAULT_CLAUDE_CONTENT_BLOCK_PROMPT
+
+# Status codes meaning the server does not take list prompts on /completions
+BATCH_UNSUPPORTED_STATUSES = (400, 404, 405, 422, 501)
+
+
+class PromptBatcher:
+    """
+    Collects prompts submitted concurrently on one event loop into micro-batches.
+
+    Prompts with the same key (max_tokens, temperature) that arrive within `window`
+    seconds, up to `max_size` of them, are handed to `send_batch` together; each caller
+    gets the completion for its own prompt. A prompt is any value `send_batch` understands.
+    """
+
+    def __init__(self, send_batch: Callable[[Tuple[Any, ...], List[Any]], Awaitable[List[str]]],
+                 max_size: int = 8, window: float = 0.01):
+        self.send_batch = send_batch
+        self.max_size = max_size
+        self.window = window
+        self._pending: Dict[Tuple[Any, ...], List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Tuple[Any, ...], asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    async def submit(self, key: Tuple[Any, ...], prompt: Any) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        group = self._pending.setdefault(key, [])
+        group.append((prompt, future))
+        if len(group) >= self.max_size:
+            self._flush(key)
+        elif len(group) == 1:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key: Tuple[Any, ...]) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        group = self._pending.pop(key, None)
+        if group:
+            task = asyncio.ensure_future(self._run(key, group))
+            # Keep a reference so the task is not garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Tuple[Any, ...], group: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await self.send_batch(key, [prompt for prompt, _ in group])
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(group, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class LlamaService(BaseAIService):
+    """Local LLM implementation (OpenAI-compatible API) for product tagging and collection generation."""
+
+    DEFAULT_MODEL = "llama3.1"
+    DEFAULT_BASE_URL = "http://localhost:11434/v1"
+
+    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None, custom_prompts: Optional[Dict[str, str]] = None,
+                 base_url: Optional[str] = None, pool_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 batch_window_ms: Optional[float] = None):
+        """
+        Initialize the local LLM service.
+
+        Args:
+            base_url: OpenAI-compatible API root including the version, e.g. http://localhost:11434/v1.
+            pool_size: Maximum pooled HTTP connections shared by concurrent calls.
+            batch_size: Prompts per /completions micro-batch; 1 disables batching.
+            batch_window_ms: How long the first prompt of a micro-batch waits for company.
+        """
+        resolved_api_key = api_key or Config.LLAMA_API_KEY # Local servers usually accept any key
+        resolved_model_name = model_name or self.DEFAULT_MODEL
+        super().__init__(api_key=resolved_api_key, model_name=resolved_model_name, custom_prompts=custom_prompts)
+        self.base_url = (base_url or Config.LLAMA_API_BASE_URL or self.DEFAULT_BASE_URL).rstrip('/')
+        self.pool_size = int(pool_size or Config.AI_HTTP_POOL_SIZE or 20)
+        self.batch_size = int(batch_size or Config.LLAMA_BATCH_SIZE or 1)
+        self.batch_window = float(batch_window_ms if batch_window_ms is not None else (Config.LLAMA_BATCH_WINDOW_MS or 10)) / 1000.0
+        # None until the first micro-batch shows whether the server takes list prompts
+        self.batching_supported: Optional[bool] = None
+        self.batching_stats = {'batches': 0, 'prompts': 0, 'fallbacks': 0}
+        # One client (and batcher) per event loop; see ClaudeService for why clients are per loop
+        self._http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, PromptBatcher]" = weakref.WeakKeyDictionary()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the pooled client for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        client = self._http_clients.get(loop)
+        if client is None:
+            for stale_loop in [l for l in self._http_clients if l.is_closed()]:
+                self._http_clients.pop(stale_loop, None)
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            # Local generation can be slow on modest hardware, hence the long read timeout
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(600.0, connect=10.0),
+            )
+            self._http_clients[loop] = client
+        return client
+
+    def _get_batcher(self) -> PromptBatcher:
+        loop = asyncio.get_running_loop()
+        batcher = self._batchers.get(loop)
+        if batcher is None:
+            batcher = PromptBatcher(self._send_prompt_batch, max_size=self.batch_size, window=self.batch_window)
+            self._batchers[loop] = batcher
+        return batcher
+
+    async def aclose(self) -> None:
+        """Close the client (and its connection pool) bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        self._batchers.pop(loop, None)
+        client = self._http_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def _is_rate_limit_error(self, error: Exception) -> bool:
+        """429s, and 503s from servers whose request queue is full, mean back off and retry."""
+        return isinstance(error, httpx.HTTPStatusError) and error.response.status_code in (429, 503)
+
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        response = getattr(error, 'response', None)
+        try:
+            return float(response.headers.get('retry-after')) if response is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    def _record_usage(self, usage: Optional[Dict[str, Any]], model: Optional[str] = None) -> None:
+        """Servers with prefix caching (vLLM) report reused prompt tokens in prompt_tokens_details."""
+        if not usage:
+            return
+        cached = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+        self.record_prompt_cache_usage(input_tokens=max(0, (usage.get('prompt_tokens') or 0) - cached),
+                                       cache_read_input_tokens=cached,
+                                       output_tokens=usage.get('completion_tokens') or 0,
+                                       model=model)
+
+    @staticmethod
+    def _system_text(system_prompt: str, cached_prefix: Optional[str] = None) -> str:
+        """
+        The static prefix goes into the system message, ahead of the per-call prompt, so the
+        prompt starts with identical tokens across calls and the server's prefix cache can reuse them.
+        """
+        return f"{system_prompt}\n\n{cached_prefix}" if cached_prefix else system_prompt
+
+    @staticmethod
+    def _render_prompt(system_text: str, user_prompt: str) -> str:
+        """Plain-text prompt for /completions, which takes no chat messages."""
+        return f"{system_text}\n\n{user_prompt}\n\nAnswer:\n"
+
+    async def _post(self, request: Dict[str, Any], path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        async def send():
+            response = await self._get_client().post(path, json=body)
+            response.raise_for_status()
+            return response.json()
+        return await self._execute(request, send)
+
+    async def _chat_completion(self, system_text: str, user_prompt: str, max_tokens: int, temperature: float,
+                               model: Optional[str] = None) -> str:
+        body = {
+            "model": model or self.active_model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": [
+                {"role": "system", "content": system_text},
+                {"role": "user", "content": user_prompt}
+            ]
+        }
+        data = await self._post(body, "/chat/completions", body)
+        self._record_usage(data.get('usage'), body["model"])
+        choices = data.get('choices') or []
+        if not choices:
+            print(f"Warning: Received empty or unexpected response from local model: {data}")
+            return ""
+        return ((choices[0].get('message') or {}).get('content') or "").strip()
+
+    async def _send_prompt_batch(self, key: Tuple[Any, ...], messages: List[Tuple[str, str]]) -> List[str]:
+        """
+        Send one micro-batch of (system_text, user_prompt) pairs as a list prompt to /completions.
+        Results come back in prompt order; without batching support each pair becomes a chat call.
+        """
+        model, max_tokens, temperature = key
+        if self.batching_supported is not False:
+            prompts = [self._render_prompt(system_text, user_prompt) for system_text, user_prompt in messages]
+            body = {"model": model, "prompt": prompts, "max_tokens": max_tokens, "temperature": temperature}
+            try:
+                data = await self._post({"model": model, "batch_size": len(prompts)}, "/completions", body)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in BATCH_UNSUPPORTED_STATUSES or self.batching_supported:
+                    raise
+                if self.batching_supported is None:
+                    print(f"Local model server does not accept batched prompts ({e.response.status_code}), using chat completions")
+                self.batching_supported = False
+            else:
+                choices = sorted(data.get('choices') or [], key=lambda choice: choice.get('index', 0))
+                if len(choices) == len(prompts):
+                    self.batching_supported = True
+                    self.batching_stats['batches'] += 1
+                    self.batching_stats['prompts'] += len(prompts)
+                    self._record_usage(data.get('usage'), model)
+                    return [(choice.get('text') or "").strip() for choice in choices]
+                print(f"Local model returned {len(choices)} completions for {len(prompts)} prompts, using chat completions")
+                self.batching_supported = False
+        self.batching_stats['fallbacks'] += len(messages)
+        return await asyncio.gather(*(
+            self._chat_completion(system_text, user_prompt, max_tokens, temperature, model) for system_text, user_prompt in messages
+        ))
+
+    @cached_completion
+    async def _call_llama_api(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                              cached_prefix: Optional[str] = None) -> str:
+        """
+        Helper method to call the local model.
+
+        Args:
+            cached_prefix: Static instructions/context shared across calls, sent at the start of the system message.
+        """
+        system_text = self._system_text(system_prompt, cached_prefix)
+        try:
+            if self.batch_size > 1 and self.batching_supported is not False:
+                # Prompts for different (routed) models never share a batch
+                return await self._get_batcher().submit((self.active_model, max_tokens, temperature), (system_text, user_prompt))
+            return await self._chat_completion(system_text, user_prompt, max_tokens, temperature)
+        except httpx.HTTPStatusError as e:
+            print(f"Local model API status error: {e.response.status_code} - {e.response.text[:200]}")
+            raise
+        except httpx.HTTPError as e:
+            print(f"Local model API connection error: {e}")
+            raise
+        except Exception as e:
+            print(f"An unexpected error occurred during local model API call: {e}")
+            raise
+
+    async def complete_async(self, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                             cached_prefix: Optional[str] = None) -> str:
+        """Generic completion used by shared pipelines (e.g. packed tagging)."""
+        return await self._call_llama_api(system_prompt, user_prompt, max_tokens, temperature, cached_prefix=cached_prefix)
+
+    @routed_task('generate_tags')
+    async def generate_tags_async(self, product: Any) -> Tuple[Any, List[str]]:
+        """Generate tags for a product using the local model asynchronously."""
+        print(f"Generating local model tags for product: {product.title}")
+        instructions, prompt = self.split_prompt_template(
+            self.get_prompt('generate_tags', DEFAULT_LLAMA_TAG_PROMPT),
+            product_title=product.title,
+            product_description=self.prompt_description(product, 'generate_tags')
+        )
+        try:
+            tags_text = await self._call_llama_api(
+                system_prompt=CLAUDE_TAG_SYSTEM_PROMPT,
+                user_prompt=prompt,
+                cached_prefix=instructions,
+                max_tokens=500,
+                temperature=0.2
+            )
+            tags = self.clean_tags(tags_text)
+            print(f"Final local model tags for {product.title}: {tags}")
+            return product, tags
+        except Exception as e:
+            print(f"Error generating local model tags for {product.title}: {e}")
+            return product, ["error generating tags"]
+
+    @routed_task('analyze_product_for_collection')
+    async def analyze_product_for_collection_async(self, product: Any) -> Tuple[Any, Optional[str]]:
+        """Analyze a product to determine its primary collection/category using the local model."""
+        print(f"Analyzing product for collection using local model: {product.title}")
+        instructions, prompt = self.split_prompt_template(
+            self.get_prompt('analyze_product_for_collection', DEFAULT_LLAMA_COLLECTION_ANALYSIS_PROMPT),
+            product_title=product.title,
+            product_description=self.prompt_description(product, 'analyze_product_for_collection'),
+            product_tags=', '.join([tag.name for tag in product.tags]) if product.tags else 'None'
+        )
+        system_prompt = "You are a product categorization expert that determines specific, meaningful categories for products, avoiding generic terms."
+        try:
+            category = await self._call_llama_api(
+                system_prompt=system_prompt,
+                user_prompt=prompt,
+                cached_prefix=instructions,
+                max_tokens=50,
+                temperature=0.1
+            )
+            # Small models tend to wrap the answer in quotes or add a trailing period
+            category = category.strip().strip('"\'.').lower()
+            if category in self.generic_tags:
+                print(f"Local model suggested generic category '{category}', using default.")
+                return product, "uncategorized product"
+            if ' ' not in category:
+                category = f"{category} category"
+            print(f"Local model determined category for {product.title}: {category}")
+            return product, category
+        except Exception as e:
+            print(f"Error analyzing product for collection with local model: {e}")
+            return product, None
+
+    @routed_task('generate_collection_description')
+    async def generate_collection_description_async(self, tag_name: str, product_count: int, product_examples: List[Dict[str, str]]) -> str:
+        """Generate a description for a collection using the local model."""
+        print(f"Generating local model collection description for: {tag_name}")
+        default_desc = f"<p>A curated selection of {product_count} products related to {tag_name}.</p>"
+        instructions, prompt = self.split_prompt_template(
+            self.get_prompt('generate_collection_description', DEFAULT_LLAMA_COLLECTION_DESC_PROMPT),
+            tag_name=tag_name,
+            product_count=product_count,
+            product_examples_json=json.dumps(product_examples, indent=2)
+        )
+        system_prompt = "You are a creative copywriter specializing in e-commerce collection descriptions that are engaging, informative, and optimized for conversion."
+        try:
+            description = await self._call_llama_api(
+                system_prompt=system_prompt,
+                user_prompt=prompt,
+                cached_prefix=instructions,
+                max_tokens=1000,
+                temperature=0.7
+            )
+            if not description or not ('<p>' in description or '<h2>' in description or '<h3>' in description):
+                print(f"Warning: Local model description for '{tag_name}' seems invalid, returning default.")
+                return default_desc
+            return description
+        except Exception as e:
+            print(f"Error generating local model collection description for {tag_name}: {e}")
+            return default_desc
+
+    @routed_task('generate_collection_meta_description')
+    async def generate_collection_meta_description_async(self, tag_name: str, product_titles_text: str) -> str:
+        """Generate a meta description for a collection using the local model."""
+        print(f"Generating local model meta description for: {tag_name}")
+        default_meta = f"Explore our {tag_name} collection featuring {product_titles_text}. Find the perfect {tag_name} for your needs."[:160]
+        instructions, prompt = self.split_prompt_template(
+            self.get_prompt('generate_collection_meta_description', DEFAULT_LLAMA_META_DESC_PROMPT),
+            tag_name=tag_name,
+            product_titles_text=product_titles_text
+        )
+        system_prompt = "You are an SEO expert who creates compelling meta descriptions that drive clicks while staying within character limits."
+        try:
+            meta_description = await self._call_llama_api(
+                system_prompt=system_prompt,
+                user_prompt=prompt,
+                cached_prefix=instructions,
+                max_tokens=60,
+                temperature=0.4
+            )
+            if len(meta_description) > 170:
+                meta_description = meta_description[:160].rsplit(' ', 1)[0] + '...'
+            if not meta_description:
+                print(f"Warning: Local model returned empty meta description for '{tag_name}', using default.")
+                return default_meta
+            return meta_description
+        except Exception as e:
+            print(f"Error generating local model meta description for {tag_name}: {e}")
+            return default_meta
+
+    @routed_task('generate_keyword_map')
+    async def generate_keyword_map_async(self, concept: str) -> Dict[str, Any]:
+        """Generate a semantic keyword map based on a store concept using the local model."""
+        print(f"Generating local model keyword map for concept: {concept[:50]}...")
+        default_map = {}
+        if not concept:
+            print("Concept is empty, cannot generate keyword map.")
+            return default_map
+        instructions, prompt = self.split_prompt_template(
+            self.get_prompt('generate_keyword_map', DEFAULT_LLAMA_KEYWORD_MAP_PROMPT), concept=concept
+        )
+        system_prompt = "You are an SEO expert generating structured keyword data in JSON format based on a provided concept."
+        try:
+            response_text = await self._call_llama_api(
+                system_prompt=system_prompt,
+                user_prompt=prompt,
+                cached_prefix=instructions,
+                max_tokens=1000,
+                temperature=0.3
+            )
+            json_start = response_text.find('{')
+            json_end = response_text.rfind('}') + 1
+            if json_start == -1 or json_end <= json_start:
+                print("Error: Could not find JSON object in local model response.")
+                return default_map
+            keyword_map = json.loads(response_text[json_start:json_end])
+            if isinstance(keyword_map, dict) and all(k in keyword_map for k in ["core_concepts", "related_topics", "long_tail_keywords", "audience_descriptors"]):
+                return keyword_map
+            print("Error: Parsed JSON does not match expected structure.")
+            return default_map
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON from local model response: {e}")
+            return default_map
+        except Exception as e:
+            print(f"Error generating local model keyword map for concept '{concept[:50]}...': {e}")
+            return default_map
+
+    @routed_task('generate_outline')
+    async def generate_outline_async(self, context: Dict[str, Any]) -> List[str]:
+        """Generate a blog post outline (list of section headings) using the local model."""
+        tag_name = context.get('tag_name', 'Topic')
+        print(f"LlamaService: Generating outline with context: {tag_name}")
+        default_outline = [f"What Makes {tag_name} Special", f"Choosing the Right {tag_name}", f"Getting the Most from {tag_name}"]
+        instructions, task = self.split_prompt_template(self.get_prompt('generate_outline', DEFAULT_LLAMA_OUTLINE_PROMPT), tag_name=tag_name)
+        try:
+            response_text = await self._call_llama_api(
+                system_prompt=BLOG_SYSTEM_PROMPT,
+                user_prompt=task,
+                cached_prefix=f"{self.build_blog_context_prefix(context)}\n\n{instructions}",
+                max_tokens=500,
+                temperature=0.5
+            )
+            json_start = response_text.find('[')
+            json_end = response_text.rfind(']') + 1
+            outline = json.loads(response_text[json_start:json_end]) if json_start != -1 and json_end > json_start else None
+            if isinstance(outline, list) and outline and all(isinstance(item, str) for item in outline):
+                return [item.strip() for item in outline if item.strip()]
+            print(f"Warning: Could not parse local model outline for '{tag_name}', using default outline.")
+            return default_outline
+        except json.JSONDecodeError as e:
+            print(f"Error decoding local model outline JSON: {e}")
+            return default_outline
+
+    @routed_task('generate_content_block')
+    async def generate_content_block_async(self, context: Dict[str, Any], prompt_override: Optional[str] = None,
+                                           on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Generate a block of content for a blog post section using the local model (not streamed: on_delta gets the whole block)."""
+        section_topic = context.get('section_topic') or context.get('outline_point', 'this section')
+        print(f"LlamaService: Generating content block for: {section_topic}")
+        instructions, task = self.split_prompt_template(
+            self.get_prompt('generate_content_block', DEFAULT_LLAMA_CONTENT_BLOCK_PROMPT),
+            section_topic=section_topic
+        )
+        content = await self._call_llama_api(
+            system_prompt=BLOG_SYSTEM_PROMPT,
+            user_prompt=prompt_override or task,
+            cached_prefix=f"{self.build_blog_context_prefix(context)}\n\n{instructions}",
+            max_tokens=1500,
+            temperature=0.7
+        )
+        if on_delta:
+            on_delta(content)
+        return content
@@ -0,0 +1,239 @@
+"""
+Local keyword tagger: TF-IDF over a store's catalog plus noun-phrase candidates.
+
+No network calls. Candidate phrases are 2-3 word runs of content words from the title
+and description; stopwords, punctuation and HTML block boundaries end a phrase (a cheap
+stand-in for noun-phrase chunking). Document frequencies come from the catalog the
+tagger was fitted on, so store-wide boilerplate ("free shipping", "easy returns")
+scores low or is dropped while phrases that set a product apart score high.
+
+Text is tokenized in large chunks and every phrase is encoded as one integer built from
+its word ids, so counting, idf weighting and top-k selection are NumPy array operations
+over the whole catalog rather than per-product Python loops.
+
+The service uses it as a first pass, as a fallback when the provider fails, or as a
+confidence gate deciding which products still need an AI call (see
+BaseAIService.iter_generate_tags with local_mode).
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each every few for from further get gets had has have having
+he her here hers him his how i if in into is it its itself just let like made make makes me meet more most my
+need no nor not now of off on once one only or other our ours out over own pairs perfect per rest same she should
+so some such than that the their theirs them then there these they this those through to too under until up us
+very was we well were what when where which while who whom why will with within without would you your yours
+designed
+""".split())
+
+# Token stream markers: the end of a title and the end of a product
+TITLE_END, DOC_END = "\x01", "\x02"
+# One pass over lowercased text: words (with inner hyphens/apostrophes), then HTML tags, entities
+# and any other single character, all of which end a phrase (the markers are matched this way too)
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*|<[^>]*>|&#?[a-z0-9]+;|[^\sa-z0-9]")
+
+# Phrase keys pack up to three word ids of WORD_BITS bits plus the phrase length into an int64
+WORD_BITS = 20
+MAX_WORDS = 1 << WORD_BITS
+CHUNK_SIZE = 5000
+
+
+class LocalTagger:
+    """
+    TF-IDF phrase tagger fitted on a catalog.
+
+    Args:
+        clean_tags: The service's tag cleaner (BaseAIService.clean_tags); selected phrases
+            go through it so local tags follow the same rules as AI tags.
+        max_tags: Tags kept per product.
+        title_weight: Term-frequency weight of a phrase occurrence in the title.
+        max_df: Phrases in more than this share of the catalog are treated as boilerplate.
+            Not applied when the tagger fitted on the products it tags: in a small or uniform
+            selection the shared phrases are the product type, not boilerplate.
+    """
+
+    def __init__(self, clean_tags: Optional[Callable[[str], List[str]]] = None, max_tags: int = 8,
+                 title_weight: float = 3.0, max_df: float = 0.5):
+        self.clean_tags = clean_tags
+        self.max_tags = max_tags
+        self.title_weight = title_weight
+        self.max_df = max_df
+        # Id 0 is the phrase break every non-word token maps to
+        self.words: List[str] = ["", TITLE_END, DOC_END]
+        self.word_ids: Dict[str, int] = {word: index for index, word in enumerate(self.words)}
+        self.is_content: List[bool] = [False, False, False]
+        self.df_keys = np.zeros(0, dtype=np.int64)
+        self.df_counts = np.zeros(0, dtype=np.int64)
+        self.num_documents = 0
+        self.fitted_on_catalog = False
+
+    def _register(self, tokens: List[str]) -> None:
+        """Add unseen tokens to the vocabulary; non-word tokens all map to the phrase break (id 0)."""
+        for token in set(tokens).difference(self.word_ids):
+            if not (token[0].isalnum()) or len(self.words) >= MAX_WORDS:
+                self.word_ids[token] = 0
+                continue
+            self.word_ids[token] = len(self.words)
+            self.words.append(token)
+            self.is_content.append(len(token) > 1 and token not in STOPWORDS and not token.isdigit())
+
+    def _tokenize(self, products: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """Word ids of all products' text with markers, plus the product index of every token."""
+        id_chunks = []
+        for start in range(0, len(products), CHUNK_SIZE):
+            pieces = []
+            for product in products[start:start + CHUNK_SIZE]:
+                pieces.extend((product.title or "", TITLE_END, product.description or "", DOC_END))
+            tokens = TOKEN_RE.findall(" ".join(pieces).lower())
+            self._register(tokens)
+            id_chunks.append(np.fromiter(map(self.word_ids.__getitem__, tokens), dtype=np.int64, count=len(tokens)))
+        word_ids = np.concatenate(id_chunks) if id_chunks else np.zeros(0, dtype=np.int64)
+        # A product's tokens come before its DOC_END marker
+        doc_ends = word_ids == self.word_ids[DOC_END]
+        docs = np.cumsum(doc_ends) - doc_ends
+        return word_ids, docs
+
+    def _phrase_counts(self, products: List[Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Weighted phrase counts per product.
+
+        Returns:
+            (docs, keys, term_frequency, title_words) where the first three describe one row per
+            distinct (product, phrase) pair and title_words counts each product's title content words.
+        """
+        word_ids, docs = self._tokenize(products)
+        content = np.array(self.is_content, dtype=bool)[word_ids]
+        # Markers alternate TITLE_END, DOC_END, so an even number of markers before a token means it is in a title
+        markers = (word_ids == self.word_ids[TITLE_END]) | (word_ids == self.word_ids[DOC_END])
+        in_title = ((np.cumsum(markers) - markers) % 2) == 0
+        weights = np.where(in_title, self.title_weight, 1.0)
+        title_words = np.bincount(docs[content & in_title], minlength=len(products))
+
+        all_docs, all_keys, all_weights = [], [], []
+        n = len(word_ids)
+        for size in (2, 3):
+            if n < size:
+                continue
+            valid = content[:n - size + 1].copy()
+            keys = word_ids[:n - size + 1].copy()
+            for offset in range(1, size):
+                valid &= content[offset:n - size + 1 + offset]
+                keys = (keys << WORD_BITS) | word_ids[offset:n - size + 1 + offset]
+            all_docs.append(docs[:n - size + 1][valid])
+            all_keys.append((keys[valid] << 2) | size)
+            all_weights.append(weights[:n - size + 1][valid])
+        if not all_docs:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0), title_words
+        docs, keys, weights = np.concatenate(all_docs), np.concatenate(all_keys), np.concatenate(all_weights)
+
+        # Collapse repeated (product, phrase) rows, summing their weights. Phrases get dense ids
+        # first so (product, phrase) fits one int64 and a single sort groups the rows by product.
+        unique_keys, phrase_index = np.unique(keys, return_inverse=True)
+        pairs = docs * len(unique_keys) + phrase_index
+        order = np.argsort(pairs, kind='stable')
+        pairs, weights = pairs[order], weights[order]
+        first = np.ones(len(pairs), dtype=bool)
+        first[1:] = pairs[1:] != pairs[:-1]
+        starts = np.flatnonzero(first)
+        pairs = pairs[starts]
+        return pairs // len(unique_keys), unique_keys[pairs % len(unique_keys)], np.add.reduceat(weights, starts), title_words
+
+    def fit(self, products: List[Any]) -> 'LocalTagger':
+        """Count in how many catalog products each phrase occurs."""
+        _, keys, _, _ = self._phrase_counts(products)
+        self._fit_counts(keys, len(products))
+        self.fitted_on_catalog = True
+        return self
+
+    def _fit_counts(self, keys: np.ndarray, num_documents: int) -> None:
+        self.df_keys, self.df_counts = np.unique(keys, return_counts=True)
+        self.num_documents = num_documents
+
+    def _phrase_text(self, key: int) -> str:
+        size = key & 3
+        key >>= 2
+        words = []
+        for _ in range(size):
+            words.append(self.words[key & (MAX_WORDS - 1)])
+            key >>= WORD_BITS
+        return " ".join(reversed(words))
+
+    def tag(self, products: List[Any]) -> List[Tuple[List[str], float]]:
+        """
+        Tag products with their highest scoring phrases (fitting on them if not fitted yet).
+
+        Returns:
+            One (tags, confidence) pair per product, in input order. Confidence is the share
+            of the title's content words covered by the tags, scaled down when fewer than
+            three tags were found; untitled or unusual products score low.
+        """
+        docs, keys, term_frequency, title_words = self._phrase_counts(products)
+        if not self.num_documents:
+            self._fit_counts(keys, len(products))
+        if not len(docs):
+            return [([], 0.0) for _ in products]
+
+        df = np.zeros(len(keys))
+        if len(self.df_keys):
+            positions = np.minimum(np.searchsorted(self.df_keys, keys), len(self.df_keys) - 1)
+            df = np.where(self.df_keys[positions] == keys, self.df_counts[positions], 0).astype(np.float64)
+        # Smoothed idf as in scikit-learn; catalog boilerplate above max_df never becomes a tag
+        idf = np.log((1.0 + self.num_documents) / (1.0 + df)) + 1.0
+        if self.fitted_on_catalog:
+            idf[df > self.max_df * self.num_documents] = 0.0
+        # Trigrams are more specific than bigrams; a small bonus favours them on ties
+        length_bonus = 1.0 + 0.1 * ((keys & 3) - 2)
+        scores = (1.0 + np.log(term_frequency)) * idf * length_bonus
+        from_title = term_frequency >= self.title_weight
+
+        # Per product, the best 2 * max_tags candidates by descending score. Rows are already grouped
+        # by product, so subtracting the score scaled into [0, 0.5] orders rows within each product.
+        order = np.argsort(docs - scores / (2.0 * scores.max() + 1e-9), kind='stable')
+        docs, keys, scores, from_title = docs[order], keys[order], scores[order], from_title[order]
+        rank = np.arange(len(docs)) - np.searchsorted(docs, docs)
+        keep = (rank < 2 * self.max_tags) & (scores > 0)
+        docs, keys, from_title = docs[keep], keys[keep], from_title[keep]
+
+        texts = {key: self._phrase_text(key) for key in np.unique(keys).tolist()}
+        if self.clean_tags is not None and texts:
+            # Cleaning rules are per tag, so one pass over the distinct phrases covers every product
+            allowed = set(self.clean_tags(", ".join(texts.values())))
+            texts = {key: text for key, text in texts.items() if text in allowed}
+        phrases = {key: (text, text.split()) for key, text in texts.items()}
+
+        entries = [phrases.get(key) for key in keys.tolist()]
+        title_flags = from_title.tolist()
+        bounds = np.searchsorted(docs, np.arange(len(products) + 1)).tolist()
+        return [
+            self._select(entries[bounds[i]:bounds[i + 1]], title_flags[bounds[i]:bounds[i + 1]], int(title_words[i]))
+            for i in range(len(products))
+        ]
+
+    def _select(self, entries: List[Optional[Tuple[str, List[str]]]], title_flags: List[bool],
+                title_word_count: int) -> Tuple[List[str], float]:
+        """Pick the top phrases, skipping bigrams inside a better scoring trigram, and rate title coverage."""
+        tags: List[str] = []
+        contained = set()
+        covered = set()
+        for entry, title_phrase in zip(entries, title_flags):
+            if entry is None or entry[0] in contained:
+                continue
+            text, words = entry
+            tags.append(text)
+            if len(words) == 3:
+                contained.add(f"{words[0]} {words[1]}")
+                contained.add(f"{words[1]} {words[2]}")
+            if title_phrase:
+                covered.update(words)
+            if len(tags) >= self.max_tags:
+                break
+        if not tags or not title_word_count:
+            return tags, 0.0
+        coverage = min(1.0, len(covered) / title_word_count)
+        return tags, round(coverage * min(1.0, len(tags) / 3.0), 3)
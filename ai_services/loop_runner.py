@@ -0,0 +1,155 @@
+"""
+One long-lived asyncio event loop on a background thread for synchronous callers.
+
+The sync wrappers on BaseAIService (generate_tags, generate_keyword_map, ...) used to
+create and close a new event loop per call, which threw away the pooled HTTP clients
+(they are bound to the loop that created them) and the in-memory single-flight state
+with it. Submitting coroutines to this shared loop instead keeps connections warm
+across requests.
+
+Coroutines run with a copy of the caller's context variables, so the Flask
+application context and per-request flags such as bypass_cache() still apply inside
+them. The loop is started lazily and restarted in a forked child process, where the
+parent's loop thread does not exist.
+
+Blocking work (SQLAlchemy queries and commits) must not run on the shared loop: it
+would stall every other coroutine on it. A caller that uses run_and_serve() instead of
+run() keeps serving such work on its own thread while it waits, and the coroutine hands
+it over with `await run_blocking(fn, ...)`.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import os
+import queue
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+# Set while a thread waits in BackgroundLoopRunner.run_and_serve(): the queue it takes blocking calls from
+_blocking_calls: contextvars.ContextVar[Optional[queue.Queue]] = contextvars.ContextVar('blocking_calls', default=None)
+
+
+class BackgroundLoopRunner:
+    """Runs coroutines on a dedicated event loop thread (thread-safe)."""
+
+    def __init__(self, name: str = "ai-event-loop"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The runner's event loop, started on first use."""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._start()
+            return self._loop
+
+    def _start(self) -> None:
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        thread = threading.Thread(target=self._run_loop, args=(loop, started), name=self.name, daemon=True)
+        thread.start()
+        started.wait()
+        self._loop, self._thread, self._pid = loop, thread, os.getpid()
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop, started: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        try:
+            loop.run_forever()
+        finally:
+            # Stopped: cancel whatever is still running, then close the loop
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """Schedule a coroutine on the background loop; returns a concurrent.futures.Future."""
+        if self.in_loop_thread():
+            raise RuntimeError("Cannot block on the background event loop from its own thread; await the coroutine instead")
+        context = contextvars.copy_context()
+        loop = self.loop
+
+        async def run_in_caller_context():
+            # create_task copies the current context, so creating it inside context.run hands the
+            # task the caller's context variables
+            return await context.run(loop.create_task, coro)
+
+        return asyncio.run_coroutine_threadsafe(run_in_caller_context(), loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the background loop and block until it finishes (or the timeout expires)."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def run_and_serve(self, coro: Awaitable[Any]) -> Any:
+        """
+        Run a coroutine on the background loop and block until it finishes, meanwhile running
+        the functions it passes to run_blocking() on this thread (e.g. with this thread's
+        database session) while the loop goes on serving other coroutines.
+        """
+        calls: queue.Queue = queue.Queue()
+        token = _blocking_calls.set(calls)
+        try:
+            future = self.submit(coro)
+        finally:
+            _blocking_calls.reset(token)
+        future.add_done_callback(lambda _: calls.put(None))
+        while True:
+            call = calls.get()
+            if call is None:
+                return future.result()
+            fn, args, kwargs, result = call
+            if result.set_running_or_notify_cancel():
+                try:
+                    result.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    result.set_exception(e)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the loop thread, cancelling any coroutines still running on it."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = self._pid = None
+        if loop is None or thread is None or not thread.is_alive():
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+
+_runner = BackgroundLoopRunner()
+atexit.register(_runner.stop)
+
+
+def get_loop_runner() -> BackgroundLoopRunner:
+    """The process-wide background loop runner shared by all AI services."""
+    return _runner
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Call a blocking function from a coroutine: on the thread waiting in run_and_serve() if
+    there is one, otherwise directly (e.g. in a view running on its own event loop).
+    """
+    calls = _blocking_calls.get()
+    if calls is None:
+        return fn(*args, **kwargs)
+    result: concurrent.futures.Future = concurrent.futures.Future()
+    calls.put((fn, args, kwargs, result))
+    return await asyncio.wrap_future(result)
@@ -0,0 +1,165 @@
+"""
+Near-duplicate product detection with MinHash and locality-sensitive hashing.
+
+Catalogs are full of near-identical products (the same shirt in 12 colors imported
+as 12 products). Each product's normalized title + description is reduced to word
+shingles, MinHash signatures are computed in one vectorized NumPy pass, and LSH
+banding proposes candidate pairs that are confirmed against the similarity
+threshold. Confirmed pairs are merged into clusters with union-find.
+
+Descriptions come with the store's boilerplate already removed (see
+product_descriptions.py), so shared footers don't make unrelated products look alike.
+
+Tagging calls the AI once per cluster representative and maps the result onto
+the other members (see BaseAIService.iter_generate_tags with dedupe=True).
+"""
+
+import html
+import re
+import zlib
+from collections import defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Modulus for the universal hash family (a * x + b) mod p; a Mersenne prime below 2**31
+# keeps a * x inside int64.
+MERSENNE_PRIME = (1 << 31) - 1
+
+TAG_RE = re.compile(r"<[^>]+>")
+NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_product_text(title: Optional[str], description: Optional[str]) -> str:
+    """Lowercase plain text of a product: HTML tags and entities removed, punctuation collapsed."""
+    text = f"{title or ''} {description or ''}"
+    text = html.unescape(TAG_RE.sub(" ", text)).lower()
+    return NON_WORD_RE.sub(" ", text).strip()
+
+
+def word_shingles(text: str, size: int = 3) -> Set[str]:
+    """Set of `size`-word shingles (the whole text for very short inputs)."""
+    words = text.split()
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def choose_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Pick (bands, rows) with bands * rows <= num_perm whose LSH S-curve midpoint,
+    (1 / bands) ** (1 / rows), is closest to the similarity threshold.
+    """
+    best = (num_perm, 1)
+    best_error = float('inf')
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index over product texts; keys are any hashables (e.g. product ids)."""
+
+    def __init__(self, threshold: float = 0.6, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = choose_bands(threshold, num_perm)
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self.keys: List[Hashable] = []
+        self.signatures: List[np.ndarray] = []
+
+    def signature(self, shingles: Set[str]) -> np.ndarray:
+        """MinHash signature (num_perm values) of a shingle set."""
+        if not shingles:
+            return np.full(self.num_perm, MERSENNE_PRIME, dtype=np.int64)
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.int64, count=len(shingles))
+        hashes %= MERSENNE_PRIME
+        # (num_perm, n_shingles) matrix of permuted hashes, min over shingles
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def add(self, key: Hashable, text: str) -> None:
+        self.add_shingles(key, word_shingles(text, self.shingle_size))
+
+    def add_shingles(self, key: Hashable, shingles: Set[str]) -> None:
+        self.keys.append(key)
+        self.signatures.append(self.signature(shingles))
+
+    def clusters(self) -> List[List[Hashable]]:
+        """Groups of keys whose estimated Jaccard similarity reaches the threshold (singletons included)."""
+        if not self.keys:
+            return []
+        signatures = np.vstack(self.signatures)
+        parent = list(range(len(self.keys)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(self.bands):
+            buckets: Dict[bytes, List[int]] = defaultdict(list)
+            band_slice = signatures[:, band * self.rows:(band + 1) * self.rows]
+            for index, row in enumerate(band_slice):
+                buckets[row.tobytes()].append(index)
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                # Confirm candidates against the first member of the bucket
+                head = members[0]
+                similarity = (signatures[members[1:]] == signatures[head]).mean(axis=1)
+                for other, score in zip(members[1:], similarity):
+                    if score >= self.threshold:
+                        root_a, root_b = find(head), find(other)
+                        if root_a != root_b:
+                            parent[root_b] = root_a
+
+        groups: Dict[int, List[Hashable]] = defaultdict(list)
+        for index, key in enumerate(self.keys):
+            groups[find(index)].append(key)
+        return list(groups.values())
+
+
+def cluster_products(products: Iterable[Any], threshold: float = 0.6, num_perm: int = 64,
+                     describe: Optional[Callable[[Any], Optional[str]]] = None) -> List[List[Any]]:
+    """
+    Cluster near-duplicate products, never across stores.
+
+    `describe(product)` gives the description to compare (default: product.description).
+    Pass one with the store's boilerplate removed (shipping footers, theme snippets, found
+    over the store's whole catalog), otherwise it makes unrelated products look alike.
+    Nothing is filtered based on the selection itself, so a selection made only of
+    variants of one item still clusters together.
+
+    Returns:
+        A list of clusters (lists of products); the first product of each cluster is its representative.
+    """
+    describe = describe or (lambda product: product.description)
+    by_store: Dict[Any, List[Any]] = defaultdict(list)
+    for product in products:
+        by_store[getattr(product, 'store_id', None)].append(product)
+
+    clusters: List[List[Any]] = []
+    for store_products in by_store.values():
+        index = NearDuplicateIndex(threshold=threshold, num_perm=num_perm)
+        for position, product in enumerate(store_products):
+            index.add(position, normalize_product_text(product.title, describe(product)))
+        clusters.extend([store_products[position] for position in group] for group in index.clusters())
+    return clusters
+
+
+def map_tags_to_member(tags: List[str], representative: Any, member: Any) -> List[str]:
+    """
+    Reuse a representative's tags for a near-duplicate member, dropping tags that mention
+    words only the representative has (e.g. its color), since they don't describe the member.
+    """
+    representative_words = set(normalize_product_text(representative.title, representative.description).split())
+    member_words = set(normalize_product_text(member.title, member.description).split())
+    distinguishing = representative_words - member_words
+    return [tag for tag in tags if not distinguishing.intersection(tag.split())]
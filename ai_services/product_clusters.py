@@ -0,0 +1,182 @@
+"""
+Cluster products for categorization with mini-batch k-means over TF-IDF vectors.
+
+A catalog has far fewer categories than products: every yoga mat lands in the same
+collection whatever its material or color. Each product's title (weighted) and
+description are turned into a hashed TF-IDF vector (words plus title bigrams),
+L2-normalized so a dot product is a cosine similarity. Spherical mini-batch k-means
+(Sculley, "Web-Scale K-Means Clustering") groups the vectors into about one cluster
+per `cluster_size` products, and each cluster's medoid (the member most similar to
+all the others) is the product that gets categorized.
+
+Document frequencies come from the store's whole catalog when it is given, not from
+the selection: in a selection of yoga mats, "yoga mat" is what the products have in
+common, not boilerplate. Store-wide description boilerplate is already stripped from
+the compacted descriptions.
+
+Members at least `threshold` similar to their medoid take its category; the others
+are outliers that still get their own AI call (see
+BaseAIService.iter_analyze_products_for_collections with clustered=True).
+"""
+
+import math
+import re
+import zlib
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Rows per block when comparing every product against every center
+ASSIGN_BLOCK_SIZE = 4096
+
+
+def product_features(title: Optional[str], description: Optional[str], title_weight: float = 3.0) -> Counter:
+    """Term counts of a product: title words and bigrams count `title_weight` times, description words once."""
+    title_words = [word for word in WORD_RE.findall((title or "").lower()) if not word.isdigit()]
+    features: Counter = Counter()
+    for word in title_words:
+        features[word] += title_weight
+    for first, second in zip(title_words, title_words[1:]):
+        features[f"{first} {second}"] += title_weight
+    for word in WORD_RE.findall((description or "").lower()):
+        if len(word) > 1 and not word.isdigit():
+            features[word] += 1
+    return features
+
+
+def tfidf_vectors(feature_sets: List[Counter], dimensions: int = 256,
+                  corpus: Optional[List[Counter]] = None) -> np.ndarray:
+    """
+    L2-normalized TF-IDF vectors with features hashed (with a random sign) into `dimensions`
+    buckets. Inverse document frequencies are computed over `corpus` (e.g. the feature sets
+    of the store's catalog), by default over `feature_sets` themselves.
+    """
+    corpus = feature_sets if corpus is None else corpus
+    document_frequency: Counter = Counter()
+    for features in corpus:
+        document_frequency.update(features.keys())
+    documents = len(corpus)
+    idf: Dict[str, Tuple[int, float]] = {}
+    for features in feature_sets:
+        for feature in features:
+            if feature not in idf:
+                hashed = zlib.crc32(feature.encode('utf-8'))
+                weight = math.log((1 + documents) / (1 + document_frequency[feature])) + 1.0
+                idf[feature] = (hashed % dimensions, weight if (hashed >> 31) & 1 else -weight)
+
+    total = len(feature_sets)
+    rows, columns, values = [], [], []
+    for row, features in enumerate(feature_sets):
+        for feature, count in features.items():
+            rows.append(row)
+            columns.append(idf[feature][0])
+            values.append((1.0 + math.log(count)) * idf[feature][1])
+    flat = np.array(rows, dtype=np.int64) * dimensions + np.array(columns, dtype=np.int64)
+    matrix = np.bincount(flat, weights=values, minlength=total * dimensions).reshape(total, dimensions).astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _label_sums(vectors: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(labels present, their member counts, the sum of their members' vectors), via one sort and reduceat."""
+    order = np.argsort(labels, kind='stable')
+    present, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+    return present, counts, np.add.reduceat(vectors[order].astype(np.float64), starts, axis=0)
+
+
+def minibatch_kmeans(vectors: np.ndarray, k: int, batch_size: int = 1024, epochs: float = 5.0,
+                     max_iterations: int = 100, seed: int = 0) -> np.ndarray:
+    """
+    Spherical mini-batch k-means on unit vectors; returns the (k, dimensions) unit centers.
+
+    Centers start at distinct random rows. Each iteration assigns a random mini-batch to its
+    most similar centers and moves every center to the running mean of all the points it
+    has been assigned so far (a per-center learning rate of 1 / count), then re-normalizes.
+    """
+    n = len(vectors)
+    k = max(1, min(k, n))
+    rng = np.random.RandomState(seed)
+    centers = vectors[rng.choice(n, size=k, replace=False)].copy()
+    counts = np.zeros(k, dtype=np.float64)
+    batch_size = min(batch_size, n)
+    iterations = max(1, min(max_iterations, math.ceil(epochs * n / batch_size)))
+    for _ in range(iterations):
+        batch = vectors[rng.randint(0, n, size=batch_size)]
+        touched, hits, sums = _label_sums(batch, np.argmax(batch @ centers.T, axis=1))
+        counts[touched] += hits
+        # Running mean: the old center keeps its share of the points, the batch adds its own
+        keep = (1.0 - hits / counts[touched])[:, None]
+        updated = centers[touched] * keep + sums / counts[touched][:, None]
+        centers[touched] = _normalize_rows(updated).astype(vectors.dtype)
+    return centers
+
+
+def assign(vectors: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Index of the most similar center of every vector, one matrix product per block of rows."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        labels[start:start + ASSIGN_BLOCK_SIZE] = np.argmax(vectors[start:start + ASSIGN_BLOCK_SIZE] @ centers.T, axis=1)
+    return labels
+
+
+def medoids(vectors: np.ndarray, labels: np.ndarray) -> Dict[int, int]:
+    """
+    Row index of each cluster's medoid: the member with the highest total similarity to the
+    cluster's members, i.e. argmax of x_i . sum(members), in one pass.
+    """
+    present, _, sums = _label_sums(vectors, labels)
+    scores = np.einsum('ij,ij->i', vectors, sums[np.searchsorted(present, labels)])
+    # Sort by (label, -score): the first row of every label is its medoid
+    order = np.lexsort((-scores, labels))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = labels[order][1:] != labels[order][:-1]
+    return {int(labels[row]): int(row) for row in order[first]}
+
+
+def cluster_for_categorization(products: List[Any], describe: Callable[[Any], str], cluster_size: int = 20,
+                               threshold: float = 0.5, dimensions: int = 256, seed: int = 0,
+                               catalog: Optional[List[Any]] = None) -> Tuple[List[Tuple[Any, List[Any]]], List[Any]]:
+    """
+    Cluster products (never across stores) so that one AI call per cluster can categorize it.
+    `describe(product)` gives the description text to vectorize (the one the prompt would use).
+    Document frequencies come from each store's products in `catalog`; without a catalog
+    (or products of that store in it) they come from the store's products being clustered.
+
+    Returns:
+        (groups, outliers): groups are (medoid, members) pairs, where the members are the other
+        products at least `threshold` similar to the medoid; outliers are the remaining products.
+    """
+    by_store: Dict[Any, List[Any]] = defaultdict(list)
+    for product in products:
+        by_store[getattr(product, 'store_id', None)].append(product)
+
+    catalog_by_store: Dict[Any, List[Any]] = defaultdict(list)
+    for product in catalog or []:
+        catalog_by_store[getattr(product, 'store_id', None)].append(product)
+
+    groups: List[Tuple[Any, List[Any]]] = []
+    outliers: List[Any] = []
+    for store_id, store_products in by_store.items():
+        corpus = [product_features(p.title, describe(p)) for p in catalog_by_store[store_id]] or None
+        vectors = tfidf_vectors([product_features(p.title, describe(p)) for p in store_products], dimensions, corpus)
+        centers = minibatch_kmeans(vectors, math.ceil(len(store_products) / max(cluster_size, 1)), seed=seed)
+        labels = assign(vectors, centers)
+        medoid_rows = medoids(vectors, labels)
+        members: Dict[int, List[Any]] = {label: [] for label in medoid_rows}
+        similarity = np.einsum('ij,ij->i', vectors, vectors[[medoid_rows[label] for label in labels]])
+        for row, (label, score) in enumerate(zip(labels.tolist(), similarity.tolist())):
+            if row == medoid_rows[label]:
+                continue
+            if score >= threshold:
+                members[label].append(store_products[row])
+            else:
+                outliers.append(store_products[row])
+        groups.extend((store_products[row], members[label]) for label, row in medoid_rows.items())
+    return groups, outliers
@@ -0,0 +1,191 @@
+"""
+Process-wide telemetry for AI provider calls.
+
+Every call that goes through BaseAIService._execute (all providers, streamed or not)
+is recorded per (provider, model, method): latency histogram of successful calls,
+retries, errors by exception type, token usage and response cache hits. `method` is
+the routed task the call was made for (generate_tags, generate_outline, ...).
+
+TELEMETRY holds the totals since the process started and is rendered in Prometheus
+text format on /metrics. telemetry_scope() additionally collects the calls made
+inside it (e.g. by one job task) into a separate AITelemetry, whose summary() is a
+dict of plain numbers that can be summed across tasks.
+"""
+
+import contextlib
+import contextvars
+import threading
+from typing import List, Tuple, Dict, Any, Optional, Iterator
+
+# Upper bounds (ms) of the latency histogram buckets; slower calls land in +Inf
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# Scoped collectors the current call also reports to (see telemetry_scope)
+_scopes: contextvars.ContextVar = contextvars.ContextVar('ai_telemetry_scopes', default=())
+
+Labels = Tuple[str, str, str]  # (provider, model, method)
+
+
+def bucket_label(bound: Optional[float]) -> str:
+    return '+Inf' if bound is None else f"{bound:g}"
+
+
+def histogram_quantile(buckets: Dict[str, int], fraction: float) -> Optional[float]:
+    """
+    Estimate a latency quantile from per-bucket counts ({'50': n, ..., '+Inf': n}), interpolating
+    linearly inside the bucket like Prometheus does. Calls in +Inf count as the largest finite bound.
+    """
+    total = sum(buckets.values())
+    if not total:
+        return None
+    rank = fraction * total
+    seen, lower = 0, 0.0
+    for bound in LATENCY_BUCKETS_MS:
+        count = buckets.get(bucket_label(bound), 0)
+        if count and seen + count >= rank:
+            return lower + (bound - lower) * (rank - seen) / count
+        seen += count
+        lower = float(bound)
+    return lower
+
+
+def summarize(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Add estimated p50/p95 latency, mean latency and error rate to a (summed) summary()."""
+    calls = summary.get('calls', 0)
+    successes = calls - summary.get('errors', 0)
+    buckets = summary.get('latency_buckets', {})
+    p50, p95 = histogram_quantile(buckets, 0.5), histogram_quantile(buckets, 0.95)
+    return {
+        **summary,
+        'p50_ms': round(p50, 1) if p50 is not None else None,
+        'p95_ms': round(p95, 1) if p95 is not None else None,
+        'mean_ms': round(summary.get('latency_ms_sum', 0) / successes, 1) if successes > 0 else None,
+        'error_rate': round(summary.get('errors', 0) / calls, 4) if calls else 0.0,
+    }
+
+
+class AITelemetry:
+    """Counters and latency histograms per (provider, model, method). Thread-safe."""
+
+    def __init__(self):
+        self.series: Dict[Labels, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, labels: Labels) -> Dict[str, Any]:
+        # Caller holds _lock
+        entry = self.series.get(labels)
+        if entry is None:
+            entry = self.series[labels] = {
+                'calls': 0, 'errors': 0, 'retries': 0, 'cache_hits': 0,
+                'input_tokens': 0, 'output_tokens': 0, 'cache_read_input_tokens': 0,
+                'latency_ms_sum': 0.0,
+                'latency_buckets': {bucket_label(bound): 0 for bound in LATENCY_BUCKETS_MS + (None,)},
+                'errors_by_type': {},
+            }
+        return entry
+
+    def record_call(self, labels: Labels, latency_ms: float = 0.0, error_type: Optional[str] = None, retries: int = 0) -> None:
+        """One provider call: its latency if it succeeded, else the exception type; plus rate-limit retries."""
+        with self._lock:
+            entry = self._entry(labels)
+            entry['calls'] += 1
+            entry['retries'] += retries
+            if error_type:
+                entry['errors'] += 1
+                entry['errors_by_type'][error_type] = entry['errors_by_type'].get(error_type, 0) + 1
+                return
+            entry['latency_ms_sum'] += latency_ms
+            bound = next((bound for bound in LATENCY_BUCKETS_MS if latency_ms <= bound), None)
+            entry['latency_buckets'][bucket_label(bound)] += 1
+
+    def record_usage(self, labels: Labels, input_tokens: int = 0, output_tokens: int = 0,
+                     cache_read_input_tokens: int = 0) -> None:
+        with self._lock:
+            entry = self._entry(labels)
+            entry['input_tokens'] += input_tokens
+            entry['output_tokens'] += output_tokens
+            entry['cache_read_input_tokens'] += cache_read_input_tokens
+
+    def record_cache_hit(self, labels: Labels) -> None:
+        """A response served from the persistent response cache, without a provider call."""
+        with self._lock:
+            self._entry(labels)['cache_hits'] += 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """One row per (provider, model, method) with its counters and estimated latency quantiles."""
+        with self._lock:
+            rows = [(labels, {**entry, 'latency_buckets': dict(entry['latency_buckets']),
+                              'errors_by_type': dict(entry['errors_by_type'])})
+                    for labels, entry in self.series.items()]
+        return [{'provider': provider, 'model': model, 'method': method,
+                 **summarize(dict(entry, latency_ms_sum=round(entry['latency_ms_sum'], 1)))}
+                for (provider, model, method), entry in sorted(rows)]
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals over all series, as nested dicts of numbers (summable across job tasks)."""
+        total = AITelemetry()._entry(('', '', ''))
+        with self._lock:
+            for entry in self.series.values():
+                for key, value in entry.items():
+                    if isinstance(value, dict):
+                        for name, count in value.items():
+                            total[key][name] = total[key].get(name, 0) + count
+                    else:
+                        total[key] += value
+        total['latency_ms_sum'] = round(total['latency_ms_sum'], 1)
+        return total
+
+    def render_prometheus(self) -> str:
+        """The metrics in Prometheus text exposition format."""
+        counters = (
+            ('ai_requests_total', 'calls', 'Provider calls (after retries)'),
+            ('ai_request_retries_total', 'retries', 'Rate-limit retries'),
+            ('ai_response_cache_hits_total', 'cache_hits', 'Responses served from the response cache'),
+        )
+        lines = []
+        rows = self.snapshot()
+
+        def labels_text(row, **extra):
+            labels = {'provider': row['provider'], 'model': row['model'], 'method': row['method'], **extra}
+            return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+        for name, key, help_text in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f"{name}{{{labels_text(row)}}} {row[key]}" for row in rows]
+        lines += ["# HELP ai_request_errors_total Failed provider calls by exception type", "# TYPE ai_request_errors_total counter"]
+        for row in rows:
+            lines += [f"ai_request_errors_total{{{labels_text(row, error_type=error_type)}}} {count}"
+                      for error_type, count in sorted(row['errors_by_type'].items())]
+        lines += ["# HELP ai_tokens_total Tokens reported by the provider", "# TYPE ai_tokens_total counter"]
+        for row in rows:
+            for kind in ('input', 'output', 'cache_read_input'):
+                lines.append(f"ai_tokens_total{{{labels_text(row, kind=kind)}}} {row[f'{kind}_tokens']}")
+        lines += ["# HELP ai_request_latency_ms Latency of successful provider calls", "# TYPE ai_request_latency_ms histogram"]
+        for row in rows:
+            cumulative = 0
+            for bound in LATENCY_BUCKETS_MS + (None,):
+                cumulative += row['latency_buckets'][bucket_label(bound)]
+                lines.append(f"ai_request_latency_ms_bucket{{{labels_text(row, le=bucket_label(bound))}}} {cumulative}")
+            lines.append(f"ai_request_latency_ms_sum{{{labels_text(row)}}} {row['latency_ms_sum']:.1f}")
+            lines.append(f"ai_request_latency_ms_count{{{labels_text(row)}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+# Totals for the whole process
+TELEMETRY = AITelemetry()
+
+
+def collectors() -> Tuple[AITelemetry, ...]:
+    """The process-wide collector plus any scopes active in the current context."""
+    return (TELEMETRY,) + _scopes.get()
+
+
+@contextlib.contextmanager
+def telemetry_scope() -> Iterator[AITelemetry]:
+    """Also collect the AI calls made inside the block (including from coroutines it starts) into a new AITelemetry."""
+    scope = AITelemetry()
+    token = _scopes.set(_scopes.get() + (scope,))
+    try:
+        yield scope
+    finally:
+        _scopes.reset(token)
@@ -0,0 +1,86 @@
+"""
+Compact product descriptions before they go into a prompt.
+
+Shopify body_html carries markup, inline styles and store-wide boilerplate (shipping
+and returns footers, support blurbs) that cost input tokens on every call without
+telling the model anything about the product. compact_description() turns body_html
+into plain text lines (block elements and list items become lines, scripts and styles
+are dropped, entities decoded, whitespace collapsed) and removes boilerplate sentences.
+
+Boilerplate is found by frequency analysis: a sentence that appears in at least
+`min_share` of a store's descriptions (and in at least `min_count` of them) says
+nothing specific about any one product. truncate_to_tokens() then cuts the text to a
+task's token budget at a word boundary.
+"""
+
+import html
+import re
+from collections import Counter
+from typing import FrozenSet, Iterable, List, Optional
+
+# Elements whose content is never visible text
+HIDDEN_RE = re.compile(r"<(script|style|noscript|template)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+# Tags that start a new line: block elements, line breaks and list items
+BLOCK_TAG_RE = re.compile(r"</?(p|div|br|li|ul|ol|h[1-6]|tr|table|section|article|blockquote|hr)\b[^>]*>", re.IGNORECASE)
+TAG_RE = re.compile(r"<[^>]+>")
+SPACE_RE = re.compile(r"[ \t\r\f\v\u00a0]+")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+NORMALIZE_RE = re.compile(r"[^a-z0-9$%]+")
+
+# A sentence in at least this share of a store's descriptions (and this many of them) is boilerplate
+BOILERPLATE_MIN_SHARE = 0.5
+BOILERPLATE_MIN_COUNT = 20
+
+
+def strip_html(text: Optional[str]) -> str:
+    """Plain text of body_html: one line per block element or list item, whitespace collapsed."""
+    if not text:
+        return ""
+    text = COMMENT_RE.sub(" ", HIDDEN_RE.sub(" ", text))
+    text = BLOCK_TAG_RE.sub("\n", text)
+    text = html.unescape(TAG_RE.sub("", text))
+    lines = (SPACE_RE.sub(" ", line).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def split_sentences(line: str) -> List[str]:
+    return [sentence for sentence in SENTENCE_END_RE.split(line) if sentence]
+
+
+def sentence_key(sentence: str) -> str:
+    """Case- and punctuation-insensitive form of a sentence, for counting repeats across products."""
+    return NORMALIZE_RE.sub(" ", sentence.lower()).strip()
+
+
+def find_boilerplate(descriptions: Iterable[Optional[str]], min_share: float = BOILERPLATE_MIN_SHARE,
+                     min_count: int = BOILERPLATE_MIN_COUNT) -> FrozenSet[str]:
+    """Keys (see sentence_key) of sentences repeated across enough of the given body_html descriptions."""
+    counts: Counter = Counter()
+    total = 0
+    for description in descriptions:
+        total += 1
+        counts.update({sentence_key(sentence) for line in strip_html(description).split("\n")
+                       for sentence in split_sentences(line)})
+    threshold = max(min_count, min_share * total)
+    return frozenset(key for key, count in counts.items() if key and count >= threshold)
+
+
+def compact_description(description: Optional[str], boilerplate: FrozenSet[str] = frozenset()) -> str:
+    """Plain text of body_html with boilerplate sentences removed."""
+    lines = []
+    for line in strip_html(description).split("\n"):
+        kept = [sentence for sentence in split_sentences(line) if sentence_key(sentence) not in boilerplate]
+        if kept:
+            lines.append(" ".join(kept))
+    return "\n".join(lines)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cut `text` to about `budget` tokens (4 characters each, like estimate_tokens) at a word boundary."""
+    max_chars = budget * 4
+    if not text or budget <= 0 or len(text) <= max_chars:
+        return text or ""
+    cut = text[:max_chars]
+    boundary = max(cut.rfind(" "), cut.rfind("\n"))
+    return (cut[:boundary] if boundary > 0 else cut).rstrip() + " ..."
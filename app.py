@@ -1,22 +1,31 @@
 import os
 # import anthropic # No longer directly needed here
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, g, session
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, g, session, current_app, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate # Add Migrate import
 from flask_wtf.csrf import CSRFProtect
 from sqlalchemy import func
-from models import db, Product, Tag, Collection, EnvVar, product_tags, Store, CleanupRule, SEODefaults, BlogPost # Added BlogPost
+from models import db, Product, Tag, Collection, EnvVar, product_tags, Store, CleanupRule, SEODefaults, BlogPost, AITagBatch, Job # Added BlogPost
 from forms import ProductForm, EnvVarForm, CollectionForm, TagForm, AutoTagForm, CreateCollectionsForm, StoreForm, StoreSelectForm, CleanupRuleForm, BlogPostForm # Added CleanupRuleForm, BlogPostForm
 # Need to create BlogPostForm later
 import asyncio # Add asyncio for async route
 # from claude_integration import ClaudeTaggingService # Replaced by ai_services
-from ai_services import get_ai_service # Import the factory function
+from ai_services import get_ai_service, get_loop_runner # Import the factory function
+from ai_services.telemetry import TELEMETRY
+from product_descriptions import refresh_compact_descriptions
+from tag_batches import submit_tag_batch_job, sync_tag_batch
+from tag_canonicalization import propose_tag_merges, apply_tag_merges
+from blog_generation import build_blog_context, create_post_with_outline, generate_post_content, rank_tags_for_blog, resume_post
+from job_queue import enqueue_auto_tag_job, enqueue_blog_posts_job, enqueue_create_collections_job, enqueue_export_collections_job, enqueue_shopify_import_job, ensure_embedded_workers
 import re # Added re import
 from shopify_integration import ShopifyIntegration
 from store_management import get_current_store, set_current_store, filter_query_by_store, get_all_stores
 from config import Config
 # from auto_migrate import run_migrations # Remove old migration import
 import json
+import queue
+import threading
+import time
 import re # Make sure re is imported if not already done by previous step
 from models import Product, Collection, Store # Ensure these are imported if not already
 
@@ -109,6 +118,148 @@ def apply_cleanup_rules(input_text):
     
     return cleaned_text.strip() # Remove leading/trailing whitespace
 
+# --- Collection helpers shared by the routes and background jobs ---
+def create_collection_for_tag(tag, product_count, store, collection_seo_defaults=None, exclude_imported_tags=False):
+    """Create (and add to the session) a collection for a tag, or return None if the tag is skipped."""
+    # Skip tags with no products or only one product
+    if product_count <= 1:
+        print(f"Skipping tag '{tag.name}' with only {product_count} product(s)")
+        return None
+
+    # Skip tags that don't have at least 2 words
+    if len(tag.name.split()) < 2:
+        print(f"Skipping single-word tag: {tag.name}")
+        return None
+
+    # Skip tags that contain underscores
+    if '_' in tag.name:
+        print(f"Skipping tag with underscore: {tag.name}")
+        return None
+
+    # If exclude_imported_tags is True, skip tags that were imported from Shopify
+    if exclude_imported_tags and ('imported' in tag.name.lower() or 'shopify' in tag.name.lower()):
+        print(f"Skipping imported tag: {tag.name}")
+        return None
+
+    # Check if a collection already exists for this tag (filtered by store)
+    collection_query = Collection.query.filter_by(tag_id=tag.id)
+    if store:
+        collection_query = collection_query.filter_by(store_id=store.id)
+    if collection_query.first():
+        return None
+
+    # Generate SEO-friendly slug
+    base_slug = tag.name.lower().replace(' ', '-')
+    slug = base_slug
+    counter = 1
+    while Collection.query.filter_by(slug=slug).first():
+        slug = f"{base_slug}-{counter}"
+        counter += 1
+
+    # Create the collection object (without SEO fields initially)
+    collection = Collection(
+        name=f"{tag.name.title()} Collection", # Use a simple name for now, defaults will override title
+        slug=slug,
+        tag=tag,
+        store_id=store.id if store else None
+        # description will be generated by defaults if template exists
+    )
+
+    # Add products to the collection
+    for product in tag.products:
+        collection.products.append(product)
+
+    # --- Apply SEO Defaults ---
+    if collection_seo_defaults:
+        seo_field_template_map = {
+            'meta_title': collection_seo_defaults.title_template,
+            'meta_description': collection_seo_defaults.description_template,
+            'og_title': collection_seo_defaults.og_title_template,
+            'og_description': collection_seo_defaults.og_description_template,
+            'twitter_title': collection_seo_defaults.twitter_title_template,
+            'twitter_description': collection_seo_defaults.twitter_description_template,
+            # Also apply to the main 'description' field if a template exists
+            'description': collection_seo_defaults.description_template,
+        }
+
+        for field_name, template_string in seo_field_template_map.items():
+            # No need to check current_value, as it's a new object
+            if template_string:
+                generated_value = generate_seo_field(collection, field_name, template_string, store)
+                setattr(collection, field_name, generated_value)
+    # --- End Apply SEO Defaults ---
+
+    db.session.add(collection)
+    return collection
+
+def optimize_collection_seo(collection, products):
+    """Rewrite a collection's name, description and meta description with SEO-optimized copy before export."""
+    product_examples = products[:3]
+    example_text = ""
+    if product_examples:
+        # Apply cleanup rules to titles before joining
+        cleaned_titles = [apply_cleanup_rules(p.title) for p in product_examples]
+        example_text = "Featuring " + ", ".join(cleaned_titles)
+        if len(products) > 3:
+            example_text += f" and {len(products) - 3} more items"
+
+    if collection.tag:
+        display_name = collection.tag.name.title()
+        subject = collection.tag.name
+        collection.name = f"{display_name} Collection | Shop Premium {display_name}"
+    else:
+        display_name = subject = collection.name.replace(" Collection", "").strip()
+        collection.name = f"{display_name} Collection | Shop Premium {display_name}"
+
+    collection.description = f"""
+                <h1>Premium {display_name} Collection</h1>
+                <p>Discover our exclusive collection of {subject} products, carefully curated to bring you the finest selection. {example_text}.</p>
+                <h2>Why Shop Our {display_name} Collection?</h2>
+                <ul>
+                    <li>Handpicked selection of premium {subject} products</li>
+                    <li>High-quality materials and expert craftsmanship</li>
+                    <li>Trendy and timeless designs for every style</li>
+                    <li>Fast shipping and excellent customer service</li>
+                </ul>
+                <h2>About Our {display_name} Products</h2>
+                <p>Each item in our {subject} collection is selected for its quality, style, and value. Whether you're looking for everyday essentials or statement pieces, you'll find the perfect {subject} to suit your needs.</p>
+                <p>Shop our {subject} collection today and experience the difference quality makes.</p>
+                """
+    collection.meta_description = f"Shop our premium {subject} collection. {example_text}. Free shipping on qualifying orders. Shop now!"
+
+def export_collection_with_products(shopify_service, collection, store, optimize_seo=False):
+    """
+    Export a collection to Shopify and record its Shopify ID. Smart collections (with a tag) are
+    exported with every product carrying the tag. Returns True on success.
+    """
+    if collection.tag:
+        # Get all products with this tag
+        products = Product.query.join(Product.tags).filter(Tag.id == collection.tag_id).all()
+
+        # Temporarily store the products in the collection for export
+        original_products = collection.products
+        collection.products = products
+        if optimize_seo:
+            optimize_collection_seo(collection, products)
+
+        # Pass current_store for context
+        result = shopify_service.export_collection_to_shopify(collection, current_store=store)
+
+        # Restore original products
+        collection.products = original_products
+    else:
+        if optimize_seo:
+            optimize_collection_seo(collection, collection.products)
+        # Pass current_store for context
+        result = shopify_service.export_collection_to_shopify(collection, current_store=store)
+
+    if 'error' in result:
+        return False
+    # Update collection with Shopify ID
+    if 'custom_collection' in result and 'id' in result['custom_collection']:
+        collection.shopify_id = str(result['custom_collection']['id'])
+    return True
+
 def create_app():
     """Create and configure the Flask application."""
     app = Flask(__name__)
@@ -349,6 +500,7 @@ def create_app():
             # --- End Apply SEO Defaults ---
                             
             db.session.add(product)
+            refresh_compact_descriptions([product])
             # Commit *after* applying defaults
             db.session.commit()
             
@@ -528,8 +680,11 @@ def create_app():
             flash('No products selected for auto-tagging', 'warning')
             return redirect(url_for('products'))
         
+        # Local tagging runs without the provider; 'fallback' falls back to it when the provider fails
+        local_mode = (request.form.get('local_tagger') or Config.AI_LOCAL_TAGGER or 'off').lower()
+        
         # Check if the configured AI service has an API key
-        if not (ai_service and ai_service.api_key):
+        if not ai_service or (not ai_service.api_key and local_mode not in ('local', 'fallback')):
             flash(f'AI Provider ({Config.AI_PROVIDER}) API key not set. Please set it in environment variables.', 'danger')
             return redirect(url_for('env_vars'))
         
@@ -544,85 +699,127 @@ def create_app():
             flash('No valid products found for auto-tagging', 'warning')
             return redirect(url_for('products'))
         
-        flash(f'Started auto-tagging {len(products)} products. This may take a while for large batches...', 'info')
-        
-        # Process products in batches asynchronously
-        # Use the configured AI service
-        results = await ai_service.batch_generate_tags(products, batch_size=50)
-        
-        tagged_count = 0
-        total_tags_added = 0
-        
-        for product, tags in results:
-            if tags and tags != ["error_generating_tags"] and tags != ["api_key_missing"]:
-                print(f"Adding tags to product {product.id}: {tags}")
-                tags_added = 0
-                
-                for tag_name in tags:
-                    # Check if tag exists for this store, create if not
-                    tag_query = Tag.query.filter_by(name=tag_name)
-                    if g.current_store:
-                        tag_query = tag_query.filter_by(store_id=g.current_store.id)
-                    
-                    tag = tag_query.first()
-                    if not tag:
-                        # Double check if tag exists with this name for any store
-                        existing_tag = Tag.query.filter_by(name=tag_name).first()
-                        if existing_tag:
-                            # Tag exists but for a different store, create a new one for this store
-                            print(f"Tag {tag_name} exists for another store, creating for current store")
-                            # Set is_app_managed=True when creating the tag
-                            tag = Tag(name=f"{tag_name}", store_id=g.current_store.id if g.current_store else None, is_app_managed=True)
-                        else:
-                            print(f"Creating new tag: {tag_name}")
-                             # Set is_app_managed=True when creating the tag
-                            tag = Tag(name=tag_name, is_app_managed=True)
-                            if g.current_store:
-                                tag.store_id = g.current_store.id
-                        
-                        db.session.add(tag)
-                        try:
-                            db.session.flush()  # Flush to get the tag ID
-                        except Exception as e:
-                            print(f"Error creating tag {tag_name}: {str(e)}")
-                            db.session.rollback()
-                            continue
-                    
-                    # Add tag to product if not already added
-                    if tag not in product.tags:
-                        print(f"Adding tag {tag.name} to product {product.title}")
-                        product.tags.append(tag)
-                        tags_added += 1
-                
-                if tags_added > 0:
-                    tagged_count += 1
-                    total_tags_added += tags_added
+        # Offline backend: submit one provider batch now, results are applied when it ends
+        if request.form.get('backend') == 'message_batch':
+            if not ai_service.supports_message_batches:
+                flash(f'AI Provider ({Config.AI_PROVIDER}) does not support batch tagging. Use interactive tagging instead.', 'danger')
+                return redirect(url_for('products'))
+            try:
+                batch = await submit_tag_batch_job(ai_service, products, g.current_store.id if g.current_store else None)
+            except Exception as e:
+                flash(f'Error submitting tagging batch: {str(e)}', 'danger')
+                return redirect(url_for('products'))
+            finally:
+                await ai_service.aclose()
+            flash(f'Submitted {len(products)} products as batch {batch.batch_id}. Tags will be applied once the batch has finished.', 'info')
+            return redirect(url_for('tag_batches'))
+        
+        # Tagging and the Shopify export run in background workers (see job_queue.py); the request
+        # only queues the job, so large selections no longer tie up the web worker
+        options = {
+            # Packed mode sends several products per request so the instructions are only paid for once
+            'packed': bool(request.form.get('pack_products')) or Config.AI_PACKED_TAGGING.lower() == 'true',
+            # Near-duplicate products reuse the tags of their cluster's representative
+            'dedupe': bool(request.form.get('dedupe_products')) or Config.AI_DEDUP_ENABLED.lower() == 'true',
+            'local_mode': local_mode,
+            # Re-tagging on request should ask the AI again instead of replaying cached answers
+            'refresh_cache': bool(request.form.get('refresh_cache')),
+        }
+        job = enqueue_auto_tag_job([product.id for product in products], g.current_store.id if g.current_store else None, options)
+        ensure_embedded_workers(current_app._get_current_object())
         
-        db.session.commit()
+        flash(f'Queued auto-tagging of {len(products)} products as job #{job.id}. Tags are applied (and exported to Shopify) in the background.', 'info')
+        return redirect(url_for('jobs'))
+    
+    @app.route('/jobs')
+    def jobs():
+        """List background jobs for the current store."""
+        jobs_query = Job.query
+        if g.current_store:
+            jobs_query = jobs_query.filter_by(store_id=g.current_store.id)
+        jobs = jobs_query.order_by(Job.created_at.desc()).limit(100).all()
+        return render_template('jobs.html', jobs=jobs)
+    
+    @app.route('/jobs/events')
+    def job_events():
+        """
+        Stream progress of the current store's active jobs as server-sent events.
+
+        Each changed job is sent as a 'progress' event (see Job.progress()), including its
+        final state; an 'idle' event follows once no job is queued or running and ends the
+        stream. ?job_id=... limits the stream to specific jobs.
+        """
+        job_ids = request.args.getlist('job_id', type=int)
+        store_id = g.current_store.id if g.current_store else None
+        interval = float(Config.JOB_EVENTS_INTERVAL or 1)
+
+        def snapshot(watched):
+            # End the previous read transaction so each poll sees the workers' latest commits
+            db.session.rollback()
+            jobs_query = Job.query
+            if store_id:
+                jobs_query = jobs_query.filter_by(store_id=store_id)
+            if job_ids:
+                jobs_query = jobs_query.filter(Job.id.in_(job_ids))
+            else:
+                jobs_query = jobs_query.filter(db.or_(Job.status.in_(('queued', 'running')), Job.id.in_(watched)))
+            return [job.progress() for job in jobs_query.order_by(Job.id).all()]
+
+        def generate():
+            # Browsers reconnect after `retry` ms if the stream drops (or times out below)
+            yield 'retry: 3000\n\n'
+            sent = {}
+            started = last_write = time.monotonic()
+            while True:
+                progress = snapshot(list(sent))
+                for job in progress:
+                    if sent.get(job['id']) != job:
+                        sent[job['id']] = job
+                        last_write = time.monotonic()
+                        yield f"event: progress\ndata: {json.dumps(job)}\n\n"
+                if not any(job['status'] in ('queued', 'running') for job in progress):
+                    yield 'event: idle\ndata: {}\n\n'
+                    return
+                if time.monotonic() - started > 300:
+                    # Hand the worker thread back now and then; the browser reconnects
+                    return
+                if time.monotonic() - last_write > 15:
+                    last_write = time.monotonic()
+                    yield ': keepalive\n\n'
+                time.sleep(interval)
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    @app.route('/products/auto-tag/batches')
+    def tag_batches():
+        """List offline tagging batches for the current store."""
+        batches_query = AITagBatch.query
+        if g.current_store:
+            batches_query = batches_query.filter_by(store_id=g.current_store.id)
+        batches = batches_query.order_by(AITagBatch.created_at.desc()).all()
+        return render_template('tag_batches.html', batches=batches)
+    
+    @app.route('/products/auto-tag/batches/<int:id>/sync', methods=['POST'])
+    async def sync_tag_batch_route(id):
+        """Poll a tagging batch and apply its results if it has finished."""
+        batch = AITagBatch.query.get_or_404(id)
+        if g.current_store and batch.store_id != g.current_store.id:
+            flash('Batch not found for the current store', 'danger')
+            return redirect(url_for('tag_batches'))
         
-        # Export tagged products to Shopify
-        if Config.SHOPIFY_ACCESS_TOKEN and Config.SHOPIFY_STORE_URL:
-            export_count = 0
-            export_errors = 0
-            
-            flash(f'Exporting {tagged_count} tagged products to Shopify...', 'info')
-            
-            for product, _ in results:
-                if product.tags:  # Only export products that have tags
-                    result = shopify_service.export_product_to_shopify(product)
-                    if 'error' not in result:
-                        export_count += 1
-                    else:
-                        export_errors += 1
-            
-            if export_errors > 0:
-                flash(f'Warning: {export_errors} products failed to export to Shopify', 'warning')
-            
-            flash(f'Successfully auto-tagged {tagged_count} products and exported {export_count} to Shopify', 'success')
+        try:
+            batch = await sync_tag_batch(ai_service, batch)
+        finally:
+            await ai_service.aclose()
+        
+        if batch.status == 'applied':
+            flash(f'Batch finished: {batch.applied_count} products received new tags ({batch.errored_count} requests failed).', 'success')
+        elif batch.status == 'failed':
+            flash(f'Error applying batch results: {batch.error_message}', 'danger')
         else:
-            flash(f'Successfully auto-tagged {tagged_count} products. Shopify integration not configured, skipping export.', 'success')
-        
-        return redirect(url_for('products'))
+            flash(f'Batch is still processing ({batch.succeeded_count + batch.errored_count} of {batch.request_count} requests done).', 'info')
+        return redirect(url_for('tag_batches'))
     
     @app.route('/collections')
     def collections():
@@ -843,127 +1040,27 @@ def create_app():
         return redirect(url_for('collections'))
     
     @app.route('/collections/create-from-tags', methods=['POST'])
-    async def create_collections_from_tags(): # Re-apply async just in case
-        """Create collections from all tags asynchronously."""
+    def create_collections_from_tags():
+        """Queue creating collections from all tags as a background job."""
         form = CreateCollectionsForm()
         exclude_imported_tags = form.exclude_imported_tags.data
         
         if exclude_imported_tags:
             print("Only using tags generated by Claude (excluding imported tags)")
         
-        created_count = 0
-        skipped_count = 0
-        
-        # Get tags with product counts (filtered by store)
-        tag_query = db.session.query(
-            Tag, func.count(product_tags.c.product_id).label('product_count')
-        ).outerjoin(product_tags).group_by(Tag.id)
-        
+        # Eligibility (product count, single-word tags, existing collections) is checked per tag by the job
+        tag_query = db.session.query(Tag.id)
         if g.current_store:
             tag_query = tag_query.filter(Tag.store_id == g.current_store.id)
+        tag_ids = [tag_id for (tag_id,) in tag_query.all()]
         
-        tag_counts = tag_query.all()
-        
-        # Fetch SEO defaults for collections once before the loop
-        collection_seo_defaults = None
-        if g.current_store:
-            collection_seo_defaults = SEODefaults.query.filter_by(store_id=g.current_store.id, entity_type='collection').first()
-
-        # First, create collections from existing tags
-        for tag, product_count in tag_counts:
-            # Skip tags with no products or only one product
-            if product_count <= 1:
-                print(f"Skipping tag '{tag.name}' with only {product_count} product(s)")
-                skipped_count += 1
-                continue
-            
-            # Skip tags that don't have at least 2 words
-            if len(tag.name.split()) < 2:
-                print(f"Skipping single-word tag: {tag.name}")
-                skipped_count += 1
-                continue
-            
-            # Skip tags that contain underscores
-            if '_' in tag.name:
-                print(f"Skipping tag with underscore: {tag.name}")
-                skipped_count += 1
-                continue
-            
-            # If exclude_imported_tags is True, skip tags that were imported from Shopify
-            if exclude_imported_tags and ('imported' in tag.name.lower() or 'shopify' in tag.name.lower()):
-                print(f"Skipping imported tag: {tag.name}")
-                skipped_count += 1
-                continue
-                
-            # Check if a collection already exists for this tag (filtered by store)
-            collection_query = Collection.query.filter_by(tag_id=tag.id)
-            if g.current_store:
-                collection_query = collection_query.filter_by(store_id=g.current_store.id)
-            
-            existing_collection = collection_query.first()
-            if not existing_collection:
-                # Generate SEO-friendly slug (keep this part)
-                base_slug = tag.name.lower().replace(' ', '-')
-                slug = base_slug
-                slug_query = Collection.query.filter_by(slug=slug)
-                counter = 1
-                while slug_query.first():
-                    slug = f"{base_slug}-{counter}"
-                    counter += 1
-                    slug_query = Collection.query.filter_by(slug=slug)
-
-                # Create the collection object (without SEO fields initially)
-                collection = Collection(
-                    name=f"{tag.name.title()} Collection", # Use a simple name for now, defaults will override title
-                    slug=slug,
-                    tag=tag,
-                    store_id=g.current_store.id if g.current_store else None
-                    # description will be generated by defaults if template exists
-                )
-                
-                # Add products to the collection
-                for product in tag.products:
-                    collection.products.append(product)
-
-                # --- Apply SEO Defaults ---
-                if collection_seo_defaults:
-                    seo_field_template_map = {
-                        'meta_title': collection_seo_defaults.title_template,
-                        'meta_description': collection_seo_defaults.description_template,
-                        'og_title': collection_seo_defaults.og_title_template,
-                        'og_description': collection_seo_defaults.og_description_template,
-                        'twitter_title': collection_seo_defaults.twitter_title_template,
-                        'twitter_description': collection_seo_defaults.twitter_description_template,
-                        # Also apply to the main 'description' field if a template exists
-                        'description': collection_seo_defaults.description_template,
-                    }
-                    
-                    for field_name, template_string in seo_field_template_map.items():
-                        # No need to check current_value, as it's a new object
-                        if template_string:
-                            generated_value = generate_seo_field(collection, field_name, template_string, g.current_store)
-                            setattr(collection, field_name, generated_value)
-                # --- End Apply SEO Defaults ---
-
-                db.session.add(collection)
-                created_count += 1
-            else:
-                skipped_count += 1
-                
-        # Commit all new collections at the end
-        if created_count > 0:
-            try:
-                db.session.commit()
-                flash(f'Successfully created {created_count} new collections from tags.', 'success')
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Error creating collections: {str(e)}', 'danger')
-        else:
+        if not tag_ids:
             flash('No new collections were created.', 'info')
-            
-        if skipped_count > 0:
-            flash(f'Skipped {skipped_count} tags (already had collections, too few products, single word, or excluded).', 'info')
-
+            return redirect(url_for('collections'))
+        
+        job = enqueue_create_collections_job(tag_ids, g.current_store.id if g.current_store else None, exclude_imported_tags)
+        ensure_embedded_workers(current_app._get_current_object())
+        flash(f'Creating collections from {len(tag_ids)} tags as job #{job.id}. Tags that are too generic or already have a collection are skipped.', 'info')
         return redirect(url_for('collections'))
 
     @app.route('/collections/<int:id>')
@@ -1226,6 +1323,48 @@ def create_app():
 
         return render_template('tags.html', tags=tags, pagination=pagination, search=search, filter_no_products=filter_no_products)
     
+    @app.route('/tags/merge')
+    def tag_merges():
+        """Propose merging near-synonymous tags of the current store into canonical tags."""
+        threshold = request.args.get('threshold', type=float)
+        proposals = propose_tag_merges(g.current_store.id if g.current_store else None, threshold)
+        return render_template('tag_merges.html', proposals=proposals,
+                               threshold=threshold or float(Config.TAG_MERGE_THRESHOLD or 0.9))
+    
+    @app.route('/tags/merge/apply', methods=['POST'])
+    def apply_tag_merges_route():
+        """Merge the selected proposals: products, collections and blog posts move to the canonical tag."""
+        mapping = {}
+        for value in request.form.getlist('merge'):
+            # Each selected proposal is "canonical_id:duplicate_id,duplicate_id"
+            canonical_id, _, duplicate_ids = value.partition(':')
+            for duplicate_id in duplicate_ids.split(','):
+                if duplicate_id.isdigit() and canonical_id.isdigit():
+                    mapping[int(duplicate_id)] = int(canonical_id)
+        
+        if not mapping:
+            flash('No tag merges selected.', 'warning')
+            return redirect(url_for('tag_merges'))
+        
+        # Only merge tags of the current store
+        tag_ids = set(mapping) | set(mapping.values())
+        tags_query = db.session.query(Tag.id).filter(Tag.id.in_(tag_ids))
+        if g.current_store:
+            tags_query = tags_query.filter(Tag.store_id == g.current_store.id)
+        valid_ids = {tag_id for tag_id, in tags_query.all()}
+        mapping = {old: new for old, new in mapping.items() if old in valid_ids and new in valid_ids}
+        
+        try:
+            result = apply_tag_merges(mapping)
+        except Exception as e:
+            flash(f'Error merging tags: {str(e)}', 'danger')
+            return redirect(url_for('tag_merges'))
+        
+        flash(f'Merged {result["tags_deleted"]} tags: {result["product_links_removed"]} product tag links rewritten '
+              f'({result["product_links_added"]} after removing duplicates), {result["collections_updated"]} collections and '
+              f'{result["blog_posts_updated"]} blog posts updated.', 'success')
+        return redirect(url_for('tag_merges'))
+    
     @app.route('/tags/<int:id>/delete', methods=['POST'])
     def delete_tag(id):
         """Delete a single tag."""
@@ -1378,6 +1517,17 @@ def create_app():
         collections = collections_query.all()
         return jsonify([collection.to_dict() for collection in collections])
     
+    @app.route('/metrics')
+    def metrics():
+        """
+        AI call telemetry for this process in Prometheus text format: calls, retries, errors by type,
+        tokens, response cache hits and a latency histogram per provider, model and method.
+        ?format=json returns the same series as JSON, with estimated p50/p95 latency.
+        """
+        if request.args.get('format') == 'json':
+            return jsonify(TELEMETRY.snapshot())
+        return Response(TELEMETRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+    
     @app.route('/debug/stores')
     def debug_stores():
         """Debug endpoint to check stores."""
@@ -1455,13 +1605,10 @@ def create_app():
             redirect_target = 'stores' if g.current_store else 'env_vars'
             return redirect(url_for(redirect_target))
         
-        # Now call the import function, which uses the set context
-        result = shopify_service.import_products_from_shopify(db, current_store=g.current_store)
-        
-        if 'error' in result:
-            flash(f'Error importing products from Shopify: {result["error"]}', 'danger')
-        else:
-            flash(f'Successfully imported {result["imported"]} products from Shopify', 'success')
+        # The import runs in a background worker, which sets the same store context
+        job = enqueue_shopify_import_job('products', g.current_store.id)
+        ensure_embedded_workers(current_app._get_current_object())
+        flash(f'Importing products from Shopify as job #{job.id}.', 'info')
         
         return redirect(url_for('products'))
     
@@ -1476,13 +1623,10 @@ def create_app():
             redirect_target = 'stores' if g.current_store else 'env_vars'
             return redirect(url_for(redirect_target))
         
-        # Now call the import function, which uses the set context
-        result = shopify_service.import_collections_from_shopify(db, current_store=g.current_store)
-        
-        if 'error' in result:
-            flash(f'Error importing collections from Shopify: {result["error"]}', 'danger')
-        else:
-            flash(f'Successfully imported {result["imported"]} collections and updated {result["updated"]} from Shopify', 'success')
+        # The import runs in a background worker, which sets the same store context
+        job = enqueue_shopify_import_job('collections', g.current_store.id)
+        ensure_embedded_workers(current_app._get_current_object())
+        flash(f'Importing collections from Shopify as job #{job.id}.', 'info')
         
         return redirect(url_for('collections'))
     
@@ -1586,100 +1730,10 @@ def create_app():
             flash('No collections available to export. All collections may already be exported to Shopify.', 'warning')
             return redirect(url_for('collections'))
         
-        success_count = 0
-        error_count = 0
-        
-        for collection in collections:
-            # For smart collections (with a tag), we need to make sure all products with this tag
-            # are included in the collection when exporting to Shopify
-            if collection.tag:
-                # Get all products with this tag
-                products = Product.query.join(Product.tags).filter(Tag.id == collection.tag_id).all()
-                
-                # Temporarily store the products in the collection for export
-                original_products = collection.products
-                collection.products = products
-                
-                # Generate SEO-optimized content
-                product_examples = products[:3]
-                example_text = ""
-                if product_examples:
-                    # Apply cleanup rules to titles before joining
-                    cleaned_titles = [apply_cleanup_rules(p.title) for p in product_examples]
-                    example_text = "Featuring " + ", ".join(cleaned_titles)
-                    if len(products) > 3:
-                        example_text += f" and {len(products) - 3} more items"
-
-                # Update collection with SEO content
-                collection.name = f"{collection.tag.name.title()} Collection | Shop Premium {collection.tag.name.title()}"
-                collection.description = f"""
-                <h1>Premium {collection.tag.name.title()} Collection</h1>
-                <p>Discover our exclusive collection of {collection.tag.name} products, carefully curated to bring you the finest selection. {example_text}.</p>
-                <h2>Why Shop Our {collection.tag.name.title()} Collection?</h2>
-                <ul>
-                    <li>Handpicked selection of premium {collection.tag.name} products</li>
-                    <li>High-quality materials and expert craftsmanship</li>
-                    <li>Trendy and timeless designs for every style</li>
-                    <li>Fast shipping and excellent customer service</li>
-                </ul>
-                <h2>About Our {collection.tag.name.title()} Products</h2>
-                <p>Each item in our {collection.tag.name} collection is selected for its quality, style, and value. Whether you're looking for everyday essentials or statement pieces, you'll find the perfect {collection.tag.name} to suit your needs.</p>
-                <p>Shop our {collection.tag.name} collection today and experience the difference quality makes.</p>
-                """
-                collection.meta_description = f"Shop our premium {collection.tag.name} collection. {example_text}. Free shipping on qualifying orders. Shop now!"
-
-                # Pass current_store for context
-                result = shopify_service.export_collection_to_shopify(collection, current_store=g.current_store)
-                
-                # Restore original products
-                collection.products = original_products
-            else:
-                # For regular collections, optimize SEO content
-                product_examples = collection.products[:3]
-                example_text = ""
-                if product_examples:
-                    # Apply cleanup rules to titles before joining
-                    cleaned_titles = [apply_cleanup_rules(p.title) for p in product_examples]
-                    example_text = "Featuring " + ", ".join(cleaned_titles)
-                    if len(collection.products) > 3:
-                        example_text += f" and {len(collection.products) - 3} more items"
-
-                # Update collection with SEO content
-                base_name = collection.name.replace(" Collection", "").strip()
-                collection.name = f"{base_name} Collection | Shop Premium {base_name}"
-                collection.description = f"""
-                <h1>Premium {base_name} Collection</h1>
-                <p>Discover our exclusive collection of {base_name} products, carefully curated to bring you the finest selection. {example_text}.</p>
-                <h2>Why Shop Our {base_name} Collection?</h2>
-                <ul>
-                    <li>Handpicked selection of premium {base_name} products</li>
-                    <li>High-quality materials and expert craftsmanship</li>
-                    <li>Trendy and timeless designs for every style</li>
-                    <li>Fast shipping and excellent customer service</li>
-                </ul>
-                <h2>About Our {base_name} Products</h2>
-                <p>Each item in our {base_name} collection is selected for its quality, style, and value. Whether you're looking for everyday essentials or statement pieces, you'll find the perfect {base_name} to suit your needs.</p>
-                <p>Shop our {base_name} collection today and experience the difference quality makes.</p>
-                """
-                collection.meta_description = f"Shop our premium {base_name} collection. {example_text}. Free shipping on qualifying orders. Shop now!"
-
-                # Pass current_store for context
-                result = shopify_service.export_collection_to_shopify(collection, current_store=g.current_store)
-            
-            if 'error' not in result:
-                # Update collection with Shopify ID
-                if 'custom_collection' in result and 'id' in result['custom_collection']:
-                    collection.shopify_id = str(result['custom_collection']['id'])
-                    success_count += 1
-            else:
-                error_count += 1
-        
-        db.session.commit()
-        
-        if success_count > 0:
-            flash(f'Successfully exported {success_count} collections to Shopify', 'success')
-        if error_count > 0:
-            flash(f'Failed to export {error_count} collections to Shopify', 'warning')
+        # Exported (with SEO-optimized copy) in a background worker
+        job = enqueue_export_collections_job([collection.id for collection in collections], g.current_store.id, optimize_seo=True)
+        ensure_embedded_workers(current_app._get_current_object())
+        flash(f'Exporting {len(collections)} collections to Shopify as job #{job.id}.', 'info')
         
         return redirect(url_for('collections'))
     
@@ -1704,44 +1758,9 @@ def create_app():
             flash('No collections available to export. All collections may already be exported to Shopify.', 'warning')
             return redirect(url_for('collections'))
         
-        success_count = 0
-        error_count = 0
-        
-        for collection in collections:
-            # For smart collections (with a tag), we need to make sure all products with this tag
-            # are included in the collection when exporting to Shopify
-            if collection.tag:
-                # Get all products with this tag
-                products = Product.query.join(Product.tags).filter(Tag.id == collection.tag_id).all()
-                
-                # Temporarily store the products in the collection for export
-                original_products = collection.products
-                collection.products = products
-                
-                # Pass current_store for context
-                result = shopify_service.export_collection_to_shopify(collection, current_store=g.current_store)
-                
-                # Restore original products
-                collection.products = original_products
-            else:
-                # For regular collections, use the existing products
-                # Pass current_store for context
-                result = shopify_service.export_collection_to_shopify(collection, current_store=g.current_store)
-            
-            if 'error' not in result:
-                # Update collection with Shopify ID
-                if 'custom_collection' in result and 'id' in result['custom_collection']:
-                    collection.shopify_id = str(result['custom_collection']['id'])
-                    success_count += 1
-            else:
-                error_count += 1
-        
-        db.session.commit()
-        
-        if success_count > 0:
-            flash(f'Successfully exported {success_count} collections to Shopify', 'success')
-        if error_count > 0:
-            flash(f'Failed to export {error_count} collections to Shopify', 'warning')
+        job = enqueue_export_collections_job([collection.id for collection in collections], g.current_store.id)
+        ensure_embedded_workers(current_app._get_current_object())
+        flash(f'Exporting {len(collections)} collections to Shopify as job #{job.id}.', 'info')
         
         return redirect(url_for('collections'))
     
@@ -2131,166 +2150,138 @@ def create_app():
         # --- Start Multi-Stage Generation Logic ---
         new_post = None # Initialize in case of early failure
         try:
-            # 1. Gather Context
+            # 1-4. Gather context, generate the outline and save the preliminary post
             store = g.current_store
-            # TODO: Add product_examples and existing_blogs retrieval logic
-            # Example: Fetch top 5 product titles for the tag
-            product_examples_list = [p.title for p in Product.query.join(product_tags).join(Tag).filter(Tag.id == tag.id, Product.store_id == store.id).limit(5).all()]
-            # Example: Fetch recent 5 blog post titles for the store
-            existing_blogs_list = [b.title for b in BlogPost.query.filter_by(store_id=store.id).order_by(BlogPost.created_at.desc()).limit(5).all()]
-
-            context = {
-                'tag_name': tag.name,
-                'store_concept': store.concept,
-                'target_audience': store.target_audience,
-                'tone_of_voice': store.tone_of_voice,
-                'sitemap_url': store.sitemap_url,
-                'product_examples': product_examples_list,
-                'existing_blogs': existing_blogs_list
-            }
+            context = build_blog_context(tag, store)
+            new_post = await create_post_with_outline(ai_service, tag, store, context=context)
 
-            # 2. Construct Initial Prompt (Refined Placeholder)
-            initial_prompt = f"""Generate a detailed blog post outline about '{context['tag_name']}'.
-Store Concept: {context['store_concept']}
-Target Audience: {context['target_audience']}
-Tone of Voice: {context['tone_of_voice']}
-Consider these products: {', '.join(context['product_examples'])}
-Consider these existing posts: {', '.join(context['existing_blogs'])}
-Sitemap (if relevant): {context['sitemap_url']}
-Output the outline as a JSON list of strings."""
-            # TODO: Further refine prompt based on AI provider best practices
-
-            # 3. Generate Outline
-            # Ensure the AI service method is implemented to handle the context dict
-            outline = await ai_service.generate_outline_async(context)
-
-            # 4. Create Preliminary BlogPost Record
-            new_post = BlogPost(
-                title=f"Draft: {tag.name} Blog Post", # Placeholder title
-                content=f"Outline generated for '{tag.name}'. Content generation pending.", # Placeholder content
-                status='outline_generated', # Indicate outline is done, content pending
-                store_id=store.id,
-                source_tag_id=tag.id,
-                generated_by_model=ai_service.model_name,
-                prompt_text=initial_prompt, # Store the initial prompt
-                outline=outline # Store the generated outline (assuming it's JSON compatible)
-            )
-            db.session.add(new_post)
-            db.session.commit() # Commit to get the ID and save initial state
+            if request.form.get('stream'):
+                # The editor streams the content in (see stream_blog_post) as it is written
+                return redirect(url_for('edit_blog_post', id=new_post.id, stream=1))
 
-            # --- Start Content Generation Loop (Steps G-K) ---
-            if new_post and new_post.outline and new_post.status == 'outline_generated':
-                content_blocks = []
-                full_outline_str = json.dumps(new_post.outline, indent=2) # For context in prompts
+            # --- Start Content Generation (Steps G-L) ---
+            # Introduction, sections and conclusion are generated concurrently; each is saved as a
+            # section row as it arrives, and the post becomes a draft once all of them are done
+            await generate_post_content(ai_service, new_post, context)
 
-                # --- Generate Introduction (Implicit Step) ---
-                try:
-                    intro_context = context.copy() # Start with base context
-                    intro_context['section_topic'] = "Introduction"
-                    intro_context['full_outline'] = full_outline_str
-                    intro_prompt = f"""Write an engaging introduction for a blog post about '{context['tag_name']}'.
-Store Concept: {context['store_concept']}
-Target Audience: {context['target_audience']}
-Tone of Voice: {context['tone_of_voice']}
-Full Outline (for context):
-{full_outline_str}"""
-                    # TODO: Refine intro prompt structure based on AI service needs
-                    print(f"Generating introduction for: {tag.name}") # Debug log
-                    intro_block = await ai_service.generate_content_block_async(context=intro_context, prompt_override=intro_prompt)
-                    content_blocks.append(intro_block)
-                except Exception as block_error:
-                    print(f"Error generating introduction block: {block_error}")
-                    raise ValueError(f"Failed during introduction generation: {block_error}") # Propagate to main handler
-
-                # --- Loop Through Outline Sections (Step G) ---
-                for section_heading in new_post.outline:
-                    try:
-                        section_context = context.copy()
-                        section_context['section_topic'] = section_heading
-                        section_context['full_outline'] = full_outline_str
-                        section_prompt = f"""Write the content for the section titled '{section_heading}' of a blog post about '{context['tag_name']}'.
-Store Concept: {context['store_concept']}
-Target Audience: {context['target_audience']}
-Tone of Voice: {context['tone_of_voice']}
-Full Outline (for context):
-{full_outline_str}"""
-                        # TODO: Refine section prompt structure
-                        print(f"Generating content for section: {section_heading}") # Debug log
-                        content_block = await ai_service.generate_content_block_async(context=section_context, prompt_override=section_prompt)
-                        content_blocks.append(f"\n## {section_heading}\n\n{content_block}") # Add heading markdown
-                    except Exception as block_error:
-                        print(f"Error generating content block for '{section_heading}': {block_error}")
-                        # Decide whether to continue or fail the whole post
-                        raise ValueError(f"Failed during content generation for section '{section_heading}': {block_error}") # Propagate
-
-                # --- Generate Conclusion (Implicit Step) ---
-                try:
-                    conclusion_context = context.copy()
-                    conclusion_context['section_topic'] = "Conclusion"
-                    conclusion_context['full_outline'] = full_outline_str
-                    conclusion_prompt = f"""Write a compelling conclusion for the blog post about '{context['tag_name']}'. Summarize the key points based on the outline.
-Store Concept: {context['store_concept']}
-Target Audience: {context['target_audience']}
-Tone of Voice: {context['tone_of_voice']}
-Full Outline (for context):
-{full_outline_str}"""
-                    # TODO: Refine conclusion prompt
-                    print(f"Generating conclusion for: {tag.name}") # Debug log
-                    conclusion_block = await ai_service.generate_content_block_async(context=conclusion_context, prompt_override=conclusion_prompt)
-                    content_blocks.append(f"\n## Conclusion\n\n{conclusion_block}")
-                except Exception as block_error:
-                    print(f"Error generating conclusion block: {block_error}")
-                    raise ValueError(f"Failed during conclusion generation: {block_error}") # Propagate
-
-                # --- Combine Blocks & Generate Title (Step K) ---
-                final_content = "\n".join(content_blocks).strip()
-                # Simple placeholder title strategy
-                final_title = f"Blog Post about {tag.name}"
-                # TODO: Consider a placeholder call to a title generation function if needed later
-                # final_title = await ai_service.generate_title_async(context=context, full_content=final_content)
-
-                # --- Update BlogPost Record (Step L) ---
-                new_post.title = final_title
-                new_post.content = final_content
-                new_post.status = 'draft' # Update status to draft
-                db.session.commit() # Commit the final content and status
-
-                flash(f"Successfully generated draft blog post for tag '{tag.name}'.", "success")
-                return redirect(url_for('edit_blog_post', id=new_post.id))
-            elif new_post and new_post.status != 'outline_generated':
-                 # Should not happen if logic flows correctly, but handle defensively
-                 flash(f"Blog post (ID: {new_post.id}) was not in 'outline_generated' state. Cannot generate content.", "warning")
-                 return redirect(url_for('edit_blog_post', id=new_post.id))
-            else:
-                 # Outline generation likely failed earlier and was handled by the except block
-                 flash("Previous step (outline generation) may have failed. Cannot proceed.", "danger")
-                 # Redirect back to tags page or blog list
-                 return redirect(url_for('tags')) # Or 'blog_posts' if that exists
+            stats = ai_service.prompt_cache_stats
+            print(f"Prompt cache usage so far: {stats['cache_read_input_tokens']} cache-read / {stats['input_tokens']} uncached input tokens over {stats['requests']} requests")
 
-            # --- End Content Generation Loop ---
+            flash(f"Successfully generated draft blog post for tag '{tag.name}'.", "success")
+            return redirect(url_for('edit_blog_post', id=new_post.id))
 
         except Exception as e:
-            db.session.rollback() # Rollback any partial saves
+            db.session.rollback() # Rollback any uncommitted changes
             print(f"Error during blog post generation: {e}")
-            # Update the post status to 'failed' if it was created before the error
             if new_post and new_post.id:
-                # Re-fetch the object in the current session if necessary, or just update
+                # Finished sections are kept; the post can be resumed from the ones that are missing
                 post_to_fail = db.session.get(BlogPost, new_post.id)
-                if post_to_fail:
+                if post_to_fail and post_to_fail.status != 'failed':
                     post_to_fail.status = 'failed'
-                    # Update content to reflect failure stage (outline or content)
-                    failure_stage = "content generation" if post_to_fail.status == 'outline_generated' else "outline generation"
-                    post_to_fail.content = f"Blog post generation failed during {failure_stage}: {e}\n\nAttempted Prompt (Initial):\n{post_to_fail.prompt_text or 'N/A'}"
-                    # Optionally add more context like the outline if failure happened during content gen
-                    if failure_stage == "content generation" and post_to_fail.outline:
-                        try:
-                            outline_str = json.dumps(post_to_fail.outline, indent=2)
-                            post_to_fail.content += f"\n\nOutline:\n{outline_str}"
-                        except Exception:
-                            post_to_fail.content += "\n\nOutline: (Error displaying outline)"
-                    db.session.commit() # Correctly indented commit
+                    db.session.commit()
+                flash(f"Error generating blog post for tag '{tag.name}': {e}. Use Resume to regenerate only the missing sections.", "danger")
+                return redirect(url_for('edit_blog_post', id=new_post.id))
             flash(f"Error generating blog post for tag '{tag.name}': {e}", "danger")
             return redirect(url_for('tags')) # Redirect back
+        finally:
+            # This view runs on its own event loop; release the client pooled on it
+            await ai_service.aclose()
+
+    @app.route('/blog/generate/batch', methods=['POST'])
+    def generate_blog_posts_batch():
+        """Queue a job generating blog posts for the store's top tags (by product count) that have none yet."""
+        if not g.current_store:
+            flash("Please select a store first.", "warning")
+            return redirect(url_for('tags'))
+        if not ai_service or not ai_service.api_key:
+            flash(f"AI Service ({Config.AI_PROVIDER}) not configured or API key missing. Cannot generate blog posts.", "danger")
+            return redirect(url_for('tags'))
+
+        count = max(1, min(request.form.get('count', 5, type=int) or 5, 100))
+        ranked = rank_tags_for_blog(g.current_store.id, count)
+        if not ranked:
+            flash("Every tag with products already has a blog post.", "info")
+            return redirect(url_for('tags'))
+
+        job = enqueue_blog_posts_job([tag.id for tag, _ in ranked], g.current_store.id)
+        ensure_embedded_workers(current_app._get_current_object())
+        flash(f"Generating blog posts for {len(ranked)} tags ({', '.join(tag.name for tag, _ in ranked)}) as job #{job.id}.", "info")
+        return redirect(url_for('tags'))
+
+    @app.route('/blog/<int:id>/resume', methods=['POST'])
+    async def resume_blog_post(id):
+        """Regenerate only the missing or failed sections of a blog post, then assemble it."""
+        post = BlogPost.query.get_or_404(id)
+        if not g.current_store or post.store_id != g.current_store.id:
+            flash("Blog post not found in the current store.", "danger")
+            return redirect(url_for('blog_posts'))
+
+        if not ai_service or not ai_service.api_key:
+            flash(f"AI Service ({Config.AI_PROVIDER}) not configured or API key missing. Cannot generate blog post.", "danger")
+            return redirect(url_for('edit_blog_post', id=post.id))
+
+        try:
+            await resume_post(ai_service, post)
+            flash(f"Resumed and completed blog post '{post.title}'.", "success")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error resuming blog post {post.id}: {e}")
+            flash(f"Error resuming blog post: {e}", "danger")
+        finally:
+            await ai_service.aclose()
+        return redirect(url_for('edit_blog_post', id=post.id))
+
+    @app.route('/blog/<int:id>/generate/stream')
+    def stream_blog_post(id):
+        """
+        Generate (or resume) a blog post's content, streaming it as server-sent events.
+
+        Events: 'sections' (the post's sections once generation starts), 'delta' (a chunk of
+        a section's text, {position, text}), 'section' (a section finished or failed) and
+        finally 'done' ({status, title, content}) or 'error' ({message}). Generation runs on
+        the AI loop, with its database work on a thread of its own, and keeps going, saving
+        each section, if the browser disconnects.
+        """
+        post = BlogPost.query.get_or_404(id)
+        if not g.current_store or post.store_id != g.current_store.id:
+            return jsonify({'error': "Blog post not found in the current store."}), 404
+        if not ai_service or not ai_service.api_key:
+            return jsonify({'error': f"AI Service ({Config.AI_PROVIDER}) not configured or API key missing."}), 400
+
+        events = queue.Queue()
+        app_obj = current_app._get_current_object()
+
+        def run():
+            # Its own app context (and so its own DB session): this outlives the request
+            with app_obj.app_context():
+                try:
+                    streamed_post = db.session.get(BlogPost, id)
+                    # As in job_queue.TaskContext.run_ai: the coroutine's queries and commits run on this
+                    # thread (run_blocking), and commits leave the objects it reads on the loop loaded
+                    db.session().expire_on_commit = False
+                    get_loop_runner().run_and_serve(
+                        resume_post(ai_service, streamed_post, on_event=lambda event, payload: events.put((event, payload))))
+                    events.put(('done', {'status': streamed_post.status, 'title': streamed_post.title, 'content': streamed_post.content}))
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error streaming blog post {id}: {e}")
+                    events.put(('error', {'message': str(e)}))
+
+        threading.Thread(target=run, name=f"blog-stream-{id}", daemon=True).start()
+
+        def generate():
+            while True:
+                try:
+                    event, payload = events.get(timeout=15)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+                if event in ('done', 'error'):
+                    return
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
     # --- End Blog Post Routes ---
 
@@ -0,0 +1,594 @@
+"""
+Offline benchmarks for the AI services.
+
+Every benchmark runs against the local mock provider (mock_ai_server.py), seeded
+with products from the synthetic catalog, so results are reproducible and free.
+
+Usage:
+    python benchmark_ai.py client-pool --products 500 --latency-ms 50
+    python benchmark_ai.py rate-limit --products 300 --provider-concurrency 6
+    python benchmark_ai.py pipeline --products 500 --latency-ms 100 --slow-probability 0.02
+    python benchmark_ai.py packing --products 1000
+    python benchmark_ai.py compaction --products 500
+    python benchmark_ai.py cache --products 500
+    python benchmark_ai.py prompt-cache --products 500
+    python benchmark_ai.py single-flight --products 200 --users 4
+    python benchmark_ai.py clustering --products 20000 --latency-ms 20
+    python benchmark_ai.py llama-batching --products 500 --latency-ms 200
+    python benchmark_ai.py routing --products 300 --latency-ms 200
+    python benchmark_ai.py hedging --products 1000 --latency-ms 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import anthropic
+
+from ai_services.claude import ClaudeService
+from ai_services.llama import LlamaService
+from config import Config
+from mock_ai_server import MockAIState, start_server
+from synthetic_catalog import generate_catalog
+
+
+def load_sample_products(count, seed=42):
+    """Build lightweight product objects (title/description/tags) from the synthetic catalog."""
+    catalog = generate_catalog(num_products=count, num_custom_collections=0, num_smart_collections=0, seed=seed)
+    return [
+        SimpleNamespace(id=index + 1, shopify_id=str(p["id"]), store_id=1, title=p["title"],
+                        description=p["body_html"], tags=[])
+        for index, p in enumerate(catalog["products"])
+    ]
+
+
+def fetch_stats(server):
+    """Snapshot the mock server counters."""
+    with server.state.lock:
+        return json.loads(json.dumps(server.state.stats))
+
+
+class PerCallClientClaudeService(ClaudeService):
+    """Reproduces the previous behaviour: a new AsyncAnthropic client (and pool) for every call."""
+
+    async def _call_claude_api(self, system_prompt, user_prompt, max_tokens, temperature):
+        async with anthropic.AsyncAnthropic(api_key=self.api_key, base_url=self.base_url) as client:
+            response = await client.messages.create(
+                model=self.model_name,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=system_prompt,
+                messages=[{"role": "user", "content": user_prompt}],
+            )
+        return response.content[0].text.strip() if response.content else ""
+
+
+class NoPrefixCacheClaudeService(ClaudeService):
+    """Sends the static instructions without cache_control markers (no provider prompt caching)."""
+
+    def _system_blocks(self, system_prompt, cached_prefix=None):
+        return f"{system_prompt}\n\n{cached_prefix}" if cached_prefix else system_prompt
+
+
+class RawDescriptionClaudeService(ClaudeService):
+    """Reproduces the previous prompts: the raw body_html description, untruncated."""
+
+    def prompt_description(self, product, task=None):
+        return product.description
+
+
+class BatchGatherClaudeService(ClaudeService):
+    """Reproduces the previous batch_generate_tags: batches of 50, each gathered behind a barrier."""
+
+    async def batch_generate_tags(self, products, batch_size=50):
+        results = []
+        for i in range(0, len(products), batch_size):
+            semaphore = asyncio.Semaphore(self.max_concurrent_calls)
+
+            async def process_with_semaphore(prod):
+                async with semaphore:
+                    return await self.generate_tags_async(prod)
+
+            results.extend(await asyncio.gather(*[process_with_semaphore(p) for p in products[i:i + batch_size]]))
+        return results
+
+
+async def _run_tagging(service, products, **kwargs):
+    started = time.perf_counter()
+    results = await service.batch_generate_tags(products, **kwargs)
+    elapsed = time.perf_counter() - started
+    await service.aclose()
+    failures = sum(1 for _, tags in results if tags == ["error generating tags"])
+    return elapsed, failures
+
+
+def bench_client_pool(args):
+    """Compare a per-call client against the persistent pooled client."""
+    products = load_sample_products(args.products)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1))
+    report = {}
+    try:
+        for label, service_class in (("per_call_client", PerCallClientClaudeService), ("pooled_client", ClaudeService)):
+            server.state.reset()
+            service = service_class(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            elapsed, failures = asyncio.run(_run_tagging(service, products))
+            stats = fetch_stats(server)
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "products_per_second": round(len(products) / elapsed, 1),
+                "requests": stats["requests"],
+                "tcp_connections": stats["connections"],
+                "failures": failures,
+            }
+    finally:
+        server.shutdown()
+    return report
+
+
+def bench_rate_limit(args):
+    """Tag products against a provider that 429s above a fixed concurrency, with and without adaptive retries."""
+    products = load_sample_products(args.products)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                                max_concurrent=args.provider_concurrency, seed=1))
+    report = {}
+    try:
+        for label, max_retries in (("no_retries", 0), ("adaptive_with_backoff", 8)):
+            server.state.reset()
+            service = ClaudeService(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            service.max_retries = max_retries
+            service.retry_budget.balance = service.retry_budget.max_balance
+            elapsed, failures = asyncio.run(_run_tagging(service, products))
+            stats = fetch_stats(server)
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "products_dropped": failures,
+                "provider_429s": stats["rate_limited"],
+                "final_concurrency_limit": int(service.concurrency.limit),
+            }
+    finally:
+        server.shutdown()
+    return report
+
+
+def bench_pipeline(args):
+    """Batch-and-gather barrier vs. the sliding-window pipeline when some calls are slow."""
+    products = load_sample_products(args.products)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                                slow_probability=args.slow_probability, seed=1))
+    report = {}
+    try:
+        for label, service_class in (("batch_and_gather", BatchGatherClaudeService), ("sliding_window", ClaudeService)):
+            server.state.reset()
+            service = service_class(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            service.max_concurrent_calls = service.concurrency.max_limit = args.concurrency
+            service.concurrency.limit = float(args.concurrency)
+            elapsed, failures = asyncio.run(_run_tagging(service, products))
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "products_per_second": round(len(products) / elapsed, 1),
+                "failures": failures,
+            }
+    finally:
+        server.shutdown()
+    return report
+
+
+def bench_packing(args):
+    """One product per request vs. packed multi-product requests; reports usage per 1,000 products."""
+    products = load_sample_products(args.products)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1))
+    scale = 1000.0 / len(products)
+    report = {}
+    try:
+        for label, packed in (("one_per_request", False), ("packed", True)):
+            server.state.reset()
+            service = ClaudeService(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            elapsed, failures = asyncio.run(_run_tagging(service, products, packed=packed))
+            stats = fetch_stats(server)
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "requests_per_1000": round(stats["requests"] * scale),
+                "input_tokens_per_1000": round(stats["input_tokens"] * scale),
+                "output_tokens_per_1000": round(stats["output_tokens"] * scale),
+                "fallbacks": service.packing_stats["fallbacks"],
+                "failures": failures,
+            }
+    finally:
+        server.shutdown()
+    baseline, packed = report["one_per_request"], report["packed"]
+    report["saved_per_1000"] = {
+        key: baseline[f"{key}_per_1000"] - packed[f"{key}_per_1000"]
+        for key in ("requests", "input_tokens", "output_tokens")
+    }
+    return report
+
+
+def bench_compaction(args):
+    """Tagging input tokens with raw body_html vs. HTML stripped vs. stripped, boilerplate removed and budgeted."""
+    from ai_services.text_compaction import compact_description, find_boilerplate
+
+    products = load_sample_products(args.products)
+    boilerplate = find_boilerplate(product.description for product in products)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1))
+    scale = 1000.0 / len(products)
+    report = {}
+    try:
+        for label, service_class, compact in (("raw_html", RawDescriptionClaudeService, False),
+                                              ("html_stripped", ClaudeService, False),
+                                              ("compacted", ClaudeService, True)):
+            for product in products:
+                product.compact_description = compact_description(product.description, boilerplate) if compact else None
+            server.state.reset()
+            service = service_class(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            elapsed, failures = asyncio.run(_run_tagging(service, products))
+            stats = fetch_stats(server)
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "input_tokens_per_1000": round(stats["input_tokens"] * scale),
+                "failures": failures,
+            }
+    finally:
+        server.shutdown()
+    report["boilerplate_sentences"] = sorted(boilerplate)
+    report["input_tokens_saved"] = f"{1 - report['compacted']['input_tokens_per_1000'] / report['raw_html']['input_tokens_per_1000']:.0%}"
+    return report
+
+
+def bench_cache(args):
+    """Tag the same products twice with the response cache enabled (cold run, then warm re-run)."""
+    import tempfile
+    from ai_services.cache import get_response_cache
+
+    products = load_sample_products(args.products)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1))
+    Config.AI_CACHE_ENABLED = 'true'
+    Config.AI_CACHE_PATH = os.path.join(tempfile.mkdtemp(), "ai_cache.sqlite3")
+    report = {}
+    try:
+        for label in ("cold", "warm"):
+            server.state.reset()
+            service = ClaudeService(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            elapsed, failures = asyncio.run(_run_tagging(service, products))
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "provider_requests": fetch_stats(server)["requests"],
+                "failures": failures,
+            }
+        report["cache"] = get_response_cache().get_stats()
+    finally:
+        server.shutdown()
+    return report
+
+
+def bench_prompt_cache(args):
+    """Tag products with and without cache_control on the static instructions; reports billed input tokens."""
+    products = load_sample_products(args.products)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1))
+    report = {}
+    try:
+        for label, service_class in (("no_prefix_cache", NoPrefixCacheClaudeService), ("prefix_cache", ClaudeService)):
+            server.state.reset()
+            service = service_class(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            elapsed, failures = asyncio.run(_run_tagging(service, products))
+            stats = fetch_stats(server)
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "uncached_input_tokens": stats["input_tokens"],
+                "cache_read_input_tokens": service.prompt_cache_stats["cache_read_input_tokens"],
+                "cache_creation_input_tokens": service.prompt_cache_stats["cache_creation_input_tokens"],
+                # Cache reads are billed at 10% of the input price and cache writes at 125%
+                "billed_input_token_equivalent": round(stats["input_tokens"]
+                                                       + 0.1 * stats["cache_read_input_tokens"]
+                                                       + 1.25 * stats["cache_creation_input_tokens"]),
+                "failures": failures,
+            }
+    finally:
+        server.shutdown()
+    return report
+
+
+def bench_single_flight(args):
+    """Several 'users' tag the same products at the same time, each on its own event loop like Flask requests."""
+    import threading
+    from ai_services.base import SINGLE_FLIGHT
+
+    products = load_sample_products(args.products)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1))
+    report = {}
+    try:
+        for label, enabled in (("independent_calls", False), ("single_flight", True)):
+            server.state.reset()
+            service = ClaudeService(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            service.single_flight_enabled = enabled
+            threads = [threading.Thread(target=lambda: asyncio.run(_run_tagging(service, products))) for _ in range(args.users)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            report[label] = {
+                "seconds": round(time.perf_counter() - started, 3),
+                "tag_requests": args.users * len(products),
+                "provider_requests": fetch_stats(server)["requests"],
+                "coalesced": service.single_flight_stats["coalesced"],
+            }
+        report["single_flight_totals"] = dict(SINGLE_FLIGHT.stats)
+    finally:
+        server.shutdown()
+    return report
+
+
+def bench_dedupe(args):
+    """Tag every product vs. one product per near-duplicate cluster (color variants of the same item)."""
+    from ai_services.near_duplicates import cluster_products
+    from ai_services.text_compaction import compact_description, find_boilerplate
+
+    products = load_sample_products(args.products)
+    # As product_descriptions.py stores them: boilerplate found over the store's catalog is removed
+    boilerplate = find_boilerplate(product.description for product in products)
+    for product in products:
+        product.compact_description = compact_description(product.description, boilerplate)
+    started = time.perf_counter()
+    clusters = cluster_products(products, threshold=args.dedup_threshold, describe=ClaudeService.compacted_description)
+    clustering_seconds = time.perf_counter() - started
+    # Synthetic variants are titled "<base item> - <color>", so a cluster mixing base items is a false merge
+    mixed = sum(1 for cluster in clusters if len({p.title.rsplit(" - ", 1)[0] for p in cluster}) > 1)
+
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1))
+    report = {"clusters": len(clusters), "mixed_clusters": mixed, "clustering_seconds": round(clustering_seconds, 3)}
+    try:
+        for label, dedupe in (("every_product", False), ("deduplicated", True)):
+            server.state.reset()
+            service = ClaudeService(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            service.dedup_threshold = args.dedup_threshold
+            elapsed, failures = asyncio.run(_run_tagging(service, products, dedupe=dedupe))
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "provider_requests": fetch_stats(server)["requests"],
+                "calls_avoided": service.dedup_stats["calls_avoided"],
+                "failures": failures,
+            }
+    finally:
+        server.shutdown()
+    return report
+
+
+def bench_clustering(args):
+    """Categorize every product vs. one medoid per k-means cluster; reports AI calls and agreement with per-product answers."""
+    from ai_services.text_compaction import compact_description, find_boilerplate
+
+    products = load_sample_products(args.products)
+    # As product_descriptions.py stores them (store boilerplate removed); the catalog weighs the terms
+    boilerplate = find_boilerplate(product.description for product in products)
+    for product in products:
+        product.compact_description = compact_description(product.description, boilerplate)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1))
+    report = {}
+    categories = {}
+    try:
+        for label, clustered in (("every_product", False), ("clustered", True)):
+            server.state.reset()
+            service = ClaudeService(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            if args.cluster_threshold is not None:
+                service.category_cluster_threshold = args.cluster_threshold
+            started = time.perf_counter()
+            results = asyncio.run(service.batch_analyze_products_for_collections(products, clustered=clustered, catalog=products))
+            elapsed = time.perf_counter() - started
+            asyncio.run(service.aclose())
+            categories[label] = [category for _, category in results]
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "provider_requests": fetch_stats(server)["requests"],
+                "failures": sum(1 for category in categories[label] if category is None),
+            }
+            if clustered:
+                report[label].update(service.category_cluster_stats, threshold=service.category_cluster_threshold)
+    finally:
+        server.shutdown()
+    # Share of products whose clustered category matches the one they get when categorized on their own
+    matches = sum(1 for a, b in zip(categories["every_product"], categories["clustered"]) if a == b)
+    report["agreement"] = round(matches / max(len(products), 1), 4)
+    report["request_reduction"] = round(report["every_product"]["provider_requests"] / max(report["clustered"]["provider_requests"], 1), 1)
+    return report
+
+
+def bench_local_tagger(args):
+    """Fit and run the local TF-IDF tagger over the catalog; reports time and how many products 'gate' keeps local."""
+    products = load_sample_products(args.products)
+    service = ClaudeService(api_key="mock-key")
+    started = time.perf_counter()
+    results = service.build_local_tagger(products).tag(products) # Fitted on the catalog, so its boilerplate is cut
+    seconds = time.perf_counter() - started
+    confident = sum(1 for tags, confidence in results if tags and confidence >= service.local_tagger_min_confidence)
+    return {
+        "products": len(products),
+        "seconds": round(seconds, 3),
+        "products_per_second": round(len(products) / seconds),
+        "avg_tags": round(sum(len(tags) for tags, _ in results) / max(len(results), 1), 2),
+        "gate_min_confidence": service.local_tagger_min_confidence,
+        "gate_ai_calls_avoided": confident,
+        "sample": [{"title": p.title, "tags": tags, "confidence": c} for p, (tags, c) in list(zip(products, results))[:3]],
+    }
+
+
+def bench_llama_batching(args):
+    """
+    Tag products with the local model service: one chat request per prompt, micro-batched
+    list prompts on /completions, and a server that rejects list prompts (falls back to chat).
+    The server is modelled as having --provider-concurrency request slots.
+    """
+    products = load_sample_products(args.products)
+    report = {}
+    for label, batch_size, list_prompts in (("unbatched", 1, True), ("batched", args.batch_size, True),
+                                           ("batched_unsupported", args.batch_size, False)):
+        server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                                    list_prompts=list_prompts, seed=1))
+        try:
+            service = LlamaService(base_url=f"{base_url}/v1", model_name="mock-llama", pool_size=args.pool_size,
+                                   batch_size=batch_size)
+            service.max_concurrent_calls = args.provider_concurrency * batch_size
+            service.concurrency.limit = float(args.provider_concurrency)
+            service.concurrency.max_limit = args.provider_concurrency
+            elapsed, failures = asyncio.run(_run_tagging(service, products))
+            stats = fetch_stats(server)
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "products_per_second": round(len(products) / elapsed, 1),
+                "provider_requests": stats["requests"],
+                "by_endpoint": stats["by_endpoint"],
+                "batching": service.batching_stats,
+                "failures": failures,
+            }
+        finally:
+            server.shutdown()
+    return report
+
+
+async def _run_mixed_workload(service, products):
+    """Tags and categories for every product, meta descriptions for a few tags, and one blog post's blocks."""
+    started = time.perf_counter()
+    await service.batch_generate_tags(products)
+    await service.batch_analyze_products_for_collections(products)
+    tag_names = sorted({product.title.split()[-1].lower() for product in products})[:10]
+    await asyncio.gather(*(service.generate_collection_meta_description_async(tag, ", ".join(p.title for p in products[:5]))
+                           for tag in tag_names))
+    context = {'tag_name': tag_names[0], 'store_concept': "Outdoor gear", 'target_audience': "Hikers",
+               'tone_of_voice': "Friendly", 'product_examples': [p.title for p in products[:5]], 'existing_blogs': []}
+    outline = await service.generate_outline_async(context)
+    await asyncio.gather(*(service.generate_content_block_async(dict(context, section_topic=section)) for section in outline))
+    elapsed = time.perf_counter() - started
+    await service.aclose()
+    return elapsed
+
+
+def bench_routing(args):
+    """The same mixed workload on one model for every task vs. routed to a fast model for short outputs."""
+    from ai_services.base import percentile
+
+    products = load_sample_products(args.products)
+    server, base_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                                model_latency_factors={"haiku": 0.35}, seed=1))
+    report = {}
+    try:
+        for label, routes in (("single_model", {}), ("routed", ClaudeService.DEFAULT_MODEL_ROUTES)):
+            server.state.reset()
+            service = ClaudeService(api_key="mock-key", base_url=base_url, pool_size=args.pool_size)
+            service.model_routes = dict(routes)
+            elapsed = asyncio.run(_run_mixed_workload(service, products))
+            latencies = [latency for entry in service.route_stats.values() for latency in entry['latencies_ms']]
+            by_task = service.route_report()
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "calls": sum(row["calls"] for row in by_task),
+                "p50_ms": round(percentile(latencies, 0.5), 1),
+                "p95_ms": round(percentile(latencies, 0.95), 1),
+                "cost_usd": round(sum(row["cost_usd"] for row in by_task), 4),
+                "by_task": {row["task"]: {key: row[key] for key in ("model", "calls", "p50_ms", "cost_usd")} for row in by_task},
+            }
+    finally:
+        server.shutdown()
+    return report
+
+
+def bench_hedging(args):
+    """
+    Tag products on a primary with a slow tail (and then an outage), alone vs. hedged to a
+    secondary provider. Both providers are mock Claude endpoints with different model names
+    (so their calls don't coalesce); the secondary has no slow tail.
+    """
+    from ai_services.base import percentile
+    from ai_services.hedged import HedgedAIService
+
+    products = load_sample_products(args.products)
+    report = {}
+    for label, hedged, outage in (("primary_only", False, False), ("hedged", True, False), ("primary_outage", True, True)):
+        primary_server, primary_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                                               slow_probability=args.slow_probability,
+                                                               rate_limit_probability=1.0 if outage else 0.0, seed=1))
+        secondary_server, secondary_url = start_server(MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=2))
+        try:
+            primary = ClaudeService(api_key="mock-key", model_name="mock-primary", base_url=primary_url, pool_size=args.pool_size)
+            secondary = ClaudeService(api_key="mock-key", model_name="mock-secondary", base_url=secondary_url, pool_size=args.pool_size)
+            for provider in (primary, secondary):
+                provider.model_routes = {}
+                provider.max_retries = 0
+            service = HedgedAIService(primary, secondary, hedge_budget_ratio=args.hedge_budget) if hedged else primary
+            started = time.perf_counter()
+            # Products are tagged one at a time per worker, so each result's latency is its own call's
+            latencies = []
+
+            async def tag(product):
+                call_started = time.perf_counter()
+                result = await service.generate_tags_async(product)
+                latencies.append((time.perf_counter() - call_started) * 1000)
+                return result
+
+            async def run():
+                results = [result async for _, result in service._iter_completed(tag, products, args.concurrency)]
+                await service.aclose()
+                return results
+
+            results = asyncio.run(run())
+            elapsed = time.perf_counter() - started
+            report[label] = {
+                "seconds": round(elapsed, 3),
+                "p50_ms": round(percentile(latencies, 0.5), 1),
+                "p99_ms": round(percentile(latencies, 0.99), 1),
+                "max_ms": round(max(latencies), 1),
+                "failures": sum(1 for _, tags in results if tags == ["error generating tags"]),
+                "primary_requests": fetch_stats(primary_server)["requests"],
+                "secondary_requests": fetch_stats(secondary_server)["requests"],
+                "hedging": getattr(service, "hedge_stats", None),
+            }
+        finally:
+            primary_server.shutdown()
+            secondary_server.shutdown()
+    return report
+
+
+BENCHMARKS = {
+    "client-pool": bench_client_pool,
+    "rate-limit": bench_rate_limit,
+    "pipeline": bench_pipeline,
+    "packing": bench_packing,
+    "compaction": bench_compaction,
+    "cache": bench_cache,
+    "prompt-cache": bench_prompt_cache,
+    "single-flight": bench_single_flight,
+    "dedupe": bench_dedupe,
+    "clustering": bench_clustering,
+    "local-tagger": bench_local_tagger,
+    "llama-batching": bench_llama_batching,
+    "routing": bench_routing,
+    "hedging": bench_hedging,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run offline AI service benchmarks against the mock provider.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS), help="Benchmark to run")
+    parser.add_argument("--products", type=int, default=500, help="Number of synthetic products")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mock provider latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Mock provider latency jitter")
+    parser.add_argument("--pool-size", type=int, default=20, help="HTTP pool size for pooled clients")
+    parser.add_argument("--slow-probability", type=float, default=0.02, help="Share of mock calls that are 10x slower")
+    parser.add_argument("--concurrency", type=int, default=10, help="In-flight calls for the pipeline benchmark")
+    parser.add_argument("--users", type=int, default=4, help="Concurrent callers for the single-flight benchmark")
+    parser.add_argument("--dedup-threshold", type=float, default=0.6, help="Similarity threshold for the dedupe benchmark")
+    parser.add_argument("--cluster-threshold", type=float, default=None, help="Medoid similarity threshold for the clustering benchmark")
+    parser.add_argument("--batch-size", type=int, default=8, help="Prompts per micro-batch for the llama-batching benchmark")
+    parser.add_argument("--hedge-budget", type=float, default=0.1, help="Share of calls the hedging benchmark may duplicate")
+    parser.add_argument("--provider-concurrency", type=int, default=6, help="Mock provider 429s above this many in-flight calls")
+    args = parser.parse_args()
+
+    # Benchmarks compare provider traffic, so the response cache stays off unless a benchmark enables it
+    Config.AI_CACHE_ENABLED = 'false'
+    report = BENCHMARKS[args.benchmark](args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
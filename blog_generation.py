@@ -0,0 +1,407 @@
+"""
+Blog post generation from a tag: an outline, then one content block per part of the post.
+
+The introduction, each outline section and the conclusion only depend on the outline,
+not on each other, so they are generated concurrently (at most BLOG_SECTION_CONCURRENCY
+requests per post at a time) and assembled in outline order.
+
+Each block is a BlogPostSection row with its own status and content, and the post moves
+through these states:
+
+    outline_generated -> generating -> draft      every section done, content assembled
+                                    -> failed     some sections failed; resumable
+
+Resuming a failed (or abandoned) post regenerates only the sections that are not done;
+the final content is only assembled once every section is present.
+
+Batch generation (the generate_blog_posts job) covers a store's most used tags that have
+no post yet. Its posts share one semaphore for every AI request and a TokenBudget: a
+post only starts while the budget still covers its worst case.
+"""
+
+import asyncio
+import inspect
+import json
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+
+from ai_services.base import estimate_tokens
+from ai_services.loop_runner import run_blocking
+from models import db, BlogPost, BlogPostSection, Product, Store, Tag, product_tags
+from config import Config
+
+# A post still marked 'generating' after this long was abandoned (e.g. the process died) and may be resumed
+STALE_GENERATION_SECONDS = 900
+
+# Output token limits the AI services use for the outline and for each content block (worst case for budgeting)
+OUTLINE_MAX_TOKENS = 500
+BLOCK_MAX_TOKENS = 1500
+# Outline length assumed when reserving budget for a post before its outline exists
+EXPECTED_OUTLINE_SECTIONS = 5
+
+
+class TokenBudgetExceeded(Exception):
+    """A batch post was not started (or not continued) because the job's token budget cannot cover it."""
+
+
+class TokenBudget:
+    """
+    Estimated tokens (prompt plus output) a batch may spend; a limit of 0 means unlimited.
+    Work reserves its worst case before its requests are sent and settles to its estimated
+    actual use afterwards. Once a reservation is refused no later one is granted, so a
+    lower-ranked post never takes the place of a higher-ranked one.
+    """
+
+    def __init__(self, limit: int = 0, spent: int = 0):
+        self.limit = max(0, int(limit or 0))
+        self.spent = int(spent or 0)
+        self.exhausted = bool(self.limit) and self.spent >= self.limit
+
+    def reserve(self, tokens: int) -> bool:
+        if not self.limit:
+            self.spent += tokens
+            return True
+        if self.exhausted or self.spent + tokens > self.limit:
+            self.exhausted = True
+            return False
+        self.spent += tokens
+        return True
+
+    def settle(self, reserved: int, used: int) -> None:
+        self.spent += used - reserved
+
+
+def build_blog_context(tag: Tag, store: Any, exclude_post_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Store voice plus a few of the tag's products and recent post titles, shared by every
+    prompt of a post. exclude_post_id leaves the post being resumed out of the recent posts.
+    """
+    product_examples = [p.title for p in Product.query.join(product_tags).join(Tag)
+                        .filter(Tag.id == tag.id, Product.store_id == store.id).limit(5).all()]
+    blogs_query = BlogPost.query.filter_by(store_id=store.id)
+    if exclude_post_id:
+        blogs_query = blogs_query.filter(BlogPost.id != exclude_post_id)
+    existing_blogs = [b.title for b in blogs_query.order_by(BlogPost.created_at.desc()).limit(5).all()]
+    return {
+        'tag_name': tag.name,
+        'store_concept': store.concept,
+        'target_audience': store.target_audience,
+        'tone_of_voice': store.tone_of_voice,
+        'sitemap_url': store.sitemap_url,
+        'product_examples': product_examples,
+        'existing_blogs': existing_blogs,
+    }
+
+
+def build_outline_prompt(context: Dict[str, Any]) -> str:
+    """The outline request as stored on the post (prompt_text)."""
+    return f"""Generate a detailed blog post outline about '{context['tag_name']}'.
+Store Concept: {context['store_concept']}
+Target Audience: {context['target_audience']}
+Tone of Voice: {context['tone_of_voice']}
+Consider these products: {', '.join(context['product_examples'])}
+Consider these existing posts: {', '.join(context['existing_blogs'])}
+Sitemap (if relevant): {context['sitemap_url']}
+Output the outline as a JSON list of strings."""
+
+
+def rank_tags_for_blog(store_id: int, limit: int) -> List[Any]:
+    """
+    The store's `limit` tags with the most products that no blog post was generated from
+    yet, as (tag, product_count) rows, from one aggregate query.
+    """
+    has_post = db.session.query(BlogPost.id).filter(BlogPost.source_tag_id == Tag.id).exists()
+    product_count = func.count(product_tags.c.product_id)
+    return db.session.query(Tag, product_count).join(product_tags, product_tags.c.tag_id == Tag.id) \
+        .filter(Tag.store_id == store_id, ~has_post) \
+        .group_by(Tag.id).order_by(product_count.desc(), Tag.name).limit(limit).all()
+
+
+async def create_post_with_outline(ai_service: Any, tag: Tag, store: Any, context: Optional[Dict[str, Any]] = None,
+                                   job_id: Optional[int] = None) -> BlogPost:
+    """Generate the outline for a new post about `tag` and save the post as 'outline_generated'."""
+    context = context or await run_blocking(build_blog_context, tag, store)
+    outline = await ai_service.generate_outline_async(context)
+    post = BlogPost(
+        title=f"Draft: {tag.name} Blog Post", # Placeholder title
+        content=f"Outline generated for '{tag.name}'. Content generation pending.", # Placeholder content
+        status='outline_generated', # Indicate outline is done, content pending
+        store_id=store.id,
+        source_tag_id=tag.id,
+        generated_by_model=ai_service.model_for('generate_content_block'),
+        prompt_text=build_outline_prompt(context), # Store the initial prompt
+        outline=outline,
+        job_id=job_id
+    )
+    db.session.add(post)
+    await run_blocking(db.session.commit) # Commit to get the ID and save initial state
+    return post
+
+
+def plan_blocks(tag_name: str, outline: List[str]) -> List[Dict[str, Any]]:
+    """
+    The content blocks of a post in reading order: introduction, one per outline
+    section, conclusion. 'heading' is None for the introduction.
+    """
+    blocks = [{
+        'heading': None,
+        'topic': "Introduction",
+        # Store concept, audience, tone and outline travel in the context and are sent as the
+        # shared (cacheable) prompt prefix; the prompt only carries the section instruction
+        'prompt': f"Write an engaging introduction for the blog post about '{tag_name}'. Preview the sections in the outline without repeating them.",
+    }]
+    for section_heading in outline:
+        blocks.append({
+            'heading': section_heading,
+            'topic': section_heading,
+            'prompt': f"Write the content for the section titled '{section_heading}' of the blog post about '{tag_name}'.",
+        })
+    blocks.append({
+        'heading': "Conclusion",
+        'topic': "Conclusion",
+        'prompt': f"Write a compelling conclusion for the blog post about '{tag_name}'. Summarize the key points based on the outline.",
+    })
+    return blocks
+
+
+def create_sections(post: BlogPost, tag_name: str) -> List[BlogPostSection]:
+    """Add a pending section row per planned block of the post (not committed)."""
+    sections = [BlogPostSection(post_id=post.id, position=position, heading=block['heading'], topic=block['topic'],
+                                prompt=block['prompt'], status='pending', attempts=0)
+                for position, block in enumerate(plan_blocks(tag_name, post.outline or []))]
+    db.session.add_all(sections)
+    return sections
+
+
+def assemble_content(sections: List[BlogPostSection]) -> str:
+    """Join the finished sections in reading order, skipping the ones that are not done."""
+    parts = []
+    for section in sorted(sections, key=lambda section: section.position):
+        if section.status != 'done':
+            continue
+        if section.heading is None:
+            parts.append(section.content or "")
+        else:
+            parts.append(f"\n## {section.heading}\n\n{section.content or ''}") # Add heading markdown
+    return "\n".join(parts).strip()
+
+
+async def generate_sections(ai_service: Any, context: Dict[str, Any], outline: List[str], sections: List[BlogPostSection],
+                            concurrency: Optional[int] = None,
+                            on_section: Optional[Callable[[BlogPostSection, Any], Any]] = None,
+                            on_delta: Optional[Callable[[BlogPostSection, str], None]] = None,
+                            semaphore: Optional[asyncio.Semaphore] = None) -> Dict[int, Any]:
+    """
+    Generate the content of `sections` with at most `concurrency` requests in flight, or
+    under a `semaphore` shared with other posts (batch generation) instead.
+    on_section(section, content_or_exception) is called as each one finishes, in completion
+    order. With on_delta, sections are streamed and on_delta(section, text) gets every chunk.
+    Returns {position: content or the exception that section raised}; one failed section
+    does not stop the others.
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, int(concurrency or Config.BLOG_SECTION_CONCURRENCY or 4)))
+    full_outline = json.dumps(outline, indent=2) # For context in prompts
+
+    async def generate(section: BlogPostSection):
+        section_context = context.copy()
+        section_context['section_topic'] = section.topic
+        section_context['full_outline'] = full_outline
+        async with semaphore:
+            print(f"Generating content for section: {section.topic}") # Debug log
+            try:
+                if on_delta:
+                    content = await ai_service.generate_content_block_async(context=section_context, prompt_override=section.prompt,
+                                                                            on_delta=lambda text: on_delta(section, text))
+                else:
+                    content = await ai_service.generate_content_block_async(context=section_context, prompt_override=section.prompt)
+                return section, content
+            except Exception as e:
+                print(f"Error generating content block for '{section.topic}': {e}")
+                return section, e
+
+    results: Dict[int, Any] = {}
+    for finished in asyncio.as_completed([generate(section) for section in sections]):
+        section, content = await finished
+        results[section.position] = content
+        if on_section:
+            outcome = on_section(section, content)
+            if inspect.isawaitable(outcome):
+                await outcome
+    return results
+
+
+def claim_post_for_generation(post: BlogPost) -> bool:
+    """
+    Move a post to 'generating' unless another run is already generating it (a compare-and-set
+    UPDATE, like job leases). Abandoned runs older than STALE_GENERATION_SECONDS can be taken over.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=STALE_GENERATION_SECONDS)
+    claimed = BlogPost.query.filter(
+        BlogPost.id == post.id,
+        or_(BlogPost.status.in_(('outline_generated', 'failed')),
+            and_(BlogPost.status == 'generating', BlogPost.updated_at < stale_before)),
+    ).update({BlogPost.status: 'generating', BlogPost.updated_at: datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    db.session.refresh(post)
+    return bool(claimed)
+
+
+def section_payload(section: BlogPostSection) -> Dict[str, Any]:
+    """A section as reported to on_event listeners (content only once it is done)."""
+    return {'position': section.position, 'heading': section.heading, 'topic': section.topic,
+            'status': section.status, 'content': section.content if section.status == 'done' else None,
+            'error_message': section.error_message}
+
+
+async def generate_post_content(ai_service: Any, post: BlogPost, context: Dict[str, Any],
+                                concurrency: Optional[int] = None,
+                                on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                                semaphore: Optional[asyncio.Semaphore] = None) -> BlogPost:
+    """
+    Generate every section of the post that is not done yet, saving each as it arrives,
+    then assemble the content and move the post to 'draft'. If any section fails the post
+    is left 'failed' with its finished sections saved, and ValueError names the failed ones.
+
+    With on_event the sections are streamed, and on_event(event, payload) reports
+    'sections' (every section, once generation starts), 'delta' (a chunk of a section's
+    text) and 'section' (a section finished or failed).
+    """
+    def start_generation() -> List[BlogPostSection]:
+        if not claim_post_for_generation(post):
+            if post.status == 'generating':
+                raise ValueError(f"Blog post {post.id} is already being generated")
+            raise ValueError(f"Blog post {post.id} is already complete ({post.status})")
+        sections = BlogPostSection.query.filter_by(post_id=post.id).order_by(BlogPostSection.position).all()
+        if not sections:
+            sections = create_sections(post, context['tag_name'])
+        for section in sections:
+            if section.status != 'done':
+                section.status = 'generating'
+                section.attempts = (section.attempts or 0) + 1
+        db.session.commit()
+        return sections
+
+    # Database work goes through run_blocking so it stays off a shared event loop
+    sections = await run_blocking(start_generation)
+    todo = [section for section in sections if section.status != 'done']
+    if on_event:
+        on_event('sections', {'sections': [section_payload(section) for section in sections]})
+
+    def save_section(section: BlogPostSection, content: Any) -> None:
+        if isinstance(content, Exception):
+            section.status = 'failed'
+            section.error_message = str(content)
+        else:
+            section.status = 'done'
+            section.content = content
+            section.error_message = None
+            # Partial content stays readable on the post while the rest is generated
+            post.content = assemble_content(sections)
+        db.session.commit()
+
+    async def on_section(section: BlogPostSection, content: Any) -> None:
+        await run_blocking(save_section, section, content)
+        if on_event:
+            on_event('section', section_payload(section))
+
+    def on_delta(section: BlogPostSection, text: str) -> None:
+        on_event('delta', {'position': section.position, 'text': text})
+
+    await generate_sections(ai_service, context, post.outline or [], todo, concurrency=concurrency,
+                            on_section=on_section, on_delta=on_delta if on_event else None, semaphore=semaphore)
+
+    failed = [section.topic for section in sections if section.status != 'done']
+    if failed:
+        post.status = 'failed'
+        await run_blocking(db.session.commit)
+        raise ValueError(f"Failed during content generation for: {', '.join(failed)}")
+
+    # --- Combine Blocks & Generate Title (Step K) ---
+    post.content = assemble_content(sections)
+    # Simple placeholder title strategy
+    post.title = f"Blog Post about {context['tag_name']}"
+    # TODO: Consider a placeholder call to a title generation function if needed later
+    # post.title = await ai_service.generate_title_async(context=context, full_content=post.content)
+    post.status = 'draft'
+    await run_blocking(db.session.commit)
+    return post
+
+
+async def resume_post(ai_service: Any, post: BlogPost, concurrency: Optional[int] = None,
+                      on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> BlogPost:
+    """Regenerate only the missing or failed sections of a post (and its outline, if it has none)."""
+    if not post.source_tag:
+        raise ValueError(f"Blog post {post.id} has no source tag to regenerate it from")
+    store = await run_blocking(db.session.get, Store, post.store_id)
+    context = await run_blocking(build_blog_context, post.source_tag, store, exclude_post_id=post.id)
+    if not post.outline:
+        post.outline = await ai_service.generate_outline_async(context)
+        await run_blocking(db.session.commit)
+    return await generate_post_content(ai_service, post, context, concurrency=concurrency, on_event=on_event)
+
+
+def _section_prefix_tokens(ai_service: Any, context: Dict[str, Any], outline: List[str]) -> int:
+    return estimate_tokens(ai_service.build_blog_context_prefix(dict(context, full_outline=json.dumps(outline, indent=2))))
+
+
+def _sections_worst_case(ai_service: Any, context: Dict[str, Any], tag_name: str, outline: List[str],
+                         sections: Optional[List[BlogPostSection]] = None) -> Tuple[int, Dict[int, str]]:
+    """Worst-case tokens for the sections that are not done yet, and their prompts by position."""
+    if sections:
+        prompts = {section.position: section.prompt for section in sections if section.status != 'done'}
+    else:
+        prompts = {position: block['prompt'] for position, block in enumerate(plan_blocks(tag_name, outline))}
+    prefix_tokens = _section_prefix_tokens(ai_service, context, outline)
+    return sum(prefix_tokens + estimate_tokens(prompt) + BLOCK_MAX_TOKENS for prompt in prompts.values()), prompts
+
+
+async def generate_batch_post(ai_service: Any, tag: Tag, store: Any, post: Optional[BlogPost] = None,
+                              semaphore: Optional[asyncio.Semaphore] = None, budget: Optional[TokenBudget] = None,
+                              job_id: Optional[int] = None) -> BlogPost:
+    """
+    Generate one post of a batch, or continue `post` (a retry). Every AI request waits for
+    the shared `semaphore`. The post reserves its worst case from `budget` before its first
+    request (so posts started together reserve in the order they were started), and
+    TokenBudgetExceeded is raised if the budget cannot cover it.
+    """
+    budget = budget or TokenBudget()
+    semaphore = semaphore or asyncio.Semaphore(max(1, int(Config.BLOG_SECTION_CONCURRENCY or 4)))
+
+    if post is None:
+        context = await run_blocking(build_blog_context, tag, store)
+        outline_prompt_tokens = estimate_tokens(build_outline_prompt(context))
+        # The outline isn't known yet: assume EXPECTED_OUTLINE_SECTIONS sections of average length
+        expected_outline = [f"Choosing the Right {tag.name}"] * EXPECTED_OUTLINE_SECTIONS
+        reserved = outline_prompt_tokens + OUTLINE_MAX_TOKENS + _sections_worst_case(ai_service, context, tag.name, expected_outline)[0]
+        if not budget.reserve(reserved):
+            raise TokenBudgetExceeded(f"Token budget exhausted before the post about '{tag.name}' was started")
+        try:
+            async with semaphore:
+                post = await create_post_with_outline(ai_service, tag, store, context=context, job_id=job_id)
+        except Exception:
+            budget.settle(reserved, outline_prompt_tokens)
+            raise
+        outline_tokens = outline_prompt_tokens + estimate_tokens(json.dumps(post.outline or []))
+        worst_case, prompts = _sections_worst_case(ai_service, context, tag.name, post.outline or [])
+        # Swap the guess for the real outline; a longer outline may overrun the budget slightly
+        budget.settle(reserved, outline_tokens + worst_case)
+        reserved = worst_case
+    else:
+        context = await run_blocking(build_blog_context, tag, store, exclude_post_id=post.id)
+        sections = await run_blocking(lambda: post.sections)
+        reserved, prompts = _sections_worst_case(ai_service, context, tag.name, post.outline or [], sections)
+        if not budget.reserve(reserved):
+            raise TokenBudgetExceeded(f"Token budget exhausted before post {post.id} ('{tag.name}') was resumed")
+
+    prefix_tokens = _section_prefix_tokens(ai_service, context, post.outline or [])
+    try:
+        return await generate_post_content(ai_service, post, context, semaphore=semaphore)
+    finally:
+        # Only the sections this run sent count against the budget
+        sections = await run_blocking(lambda: post.sections)
+        used = sum(prefix_tokens + estimate_tokens(section.prompt) + estimate_tokens(section.content or '')
+                   for section in sections if section.position in prompts)
+        budget.settle(reserved, used)
@@ -23,11 +23,102 @@ class Config:
     # Llama Configuration (for local models via API like Ollama, LM Studio, etc.)
     LLAMA_API_BASE_URL = os.environ.get('LLAMA_API_BASE_URL', '') # e.g., 'http://localhost:11434/v1'
     LLAMA_API_KEY = os.environ.get('LLAMA_API_KEY', 'ollama') # Often not needed or a placeholder
+    # Prompts per /completions micro-batch for servers that take list prompts (vLLM, llama.cpp); 1 disables
+    LLAMA_BATCH_SIZE = os.environ.get('LLAMA_BATCH_SIZE', '1')
+    # How long the first prompt of a micro-batch waits for more prompts to join it
+    LLAMA_BATCH_WINDOW_MS = os.environ.get('LLAMA_BATCH_WINDOW_MS', '10')
+
+    # Anthropic endpoint override (e.g., a local mock server for benchmarks); empty uses the SDK default
+    ANTHROPIC_BASE_URL = os.environ.get('ANTHROPIC_BASE_URL', '')
+
+    # Maximum pooled HTTP connections per AI client (shared across concurrent calls)
+    AI_HTTP_POOL_SIZE = os.environ.get('AI_HTTP_POOL_SIZE', '20')
+
+    # Concurrency and retry behaviour for AI calls. Concurrency starts at the initial value
+    # and adapts (AIMD) between 1 and AI_MAX_CONCURRENT_CALLS based on rate-limit errors.
+    AI_MAX_CONCURRENT_CALLS = os.environ.get('AI_MAX_CONCURRENT_CALLS', '20')
+    AI_INITIAL_CONCURRENT_CALLS = os.environ.get('AI_INITIAL_CONCURRENT_CALLS', '10')
+    AI_MAX_RETRIES = os.environ.get('AI_MAX_RETRIES', '5')
+    AI_RETRY_BUDGET_RATIO = os.environ.get('AI_RETRY_BUDGET_RATIO', '0.2') # Retries allowed per request, on average
+
+    # Packed tagging: tag several products per request to avoid repeating the instruction block
+    AI_PACKED_TAGGING = os.environ.get('AI_PACKED_TAGGING', 'false')
+    AI_PACK_TOKEN_BUDGET = os.environ.get('AI_PACK_TOKEN_BUDGET', '6000') # Estimated input tokens per packed request
+    AI_PACK_MAX_PRODUCTS = os.environ.get('AI_PACK_MAX_PRODUCTS', '20')
+
+    # Near-duplicate detection (MinHash/LSH): tag one product per cluster of near-identical products
+    AI_DEDUP_ENABLED = os.environ.get('AI_DEDUP_ENABLED', 'false')
+    AI_DEDUP_THRESHOLD = os.environ.get('AI_DEDUP_THRESHOLD', '0.6') # Estimated Jaccard similarity of title + description shingles
+    AI_DEDUP_NUM_PERM = os.environ.get('AI_DEDUP_NUM_PERM', '64') # MinHash signature length
+
+    # Clustered categorization (mini-batch k-means on TF-IDF vectors): categorize one product per cluster
+    AI_CATEGORY_CLUSTER_SIZE = os.environ.get('AI_CATEGORY_CLUSTER_SIZE', '20') # Average products per cluster
+    AI_CATEGORY_CLUSTER_THRESHOLD = os.environ.get('AI_CATEGORY_CLUSTER_THRESHOLD', '0.4') # Cosine similarity to the medoid to reuse its category
+
+    # Local TF-IDF tagger: 'off', 'local' (no AI calls), 'gate' (AI only for low-confidence products) or 'fallback'
+    AI_LOCAL_TAGGER = os.environ.get('AI_LOCAL_TAGGER', 'off')
+    AI_LOCAL_TAGGER_MIN_CONFIDENCE = os.environ.get('AI_LOCAL_TAGGER_MIN_CONFIDENCE', '0.8') # Share of title words covered by local tags
+    AI_LOCAL_TAGGER_MAX_TAGS = os.environ.get('AI_LOCAL_TAGGER_MAX_TAGS', '8')
+
+    # Product descriptions in tagging and categorization prompts: HTML and store-wide boilerplate are
+    # stripped, then the text is cut to this many estimated tokens (0 = no limit)
+    AI_TAGS_DESCRIPTION_TOKENS = os.environ.get('AI_TAGS_DESCRIPTION_TOKENS', '300')
+    AI_CATEGORY_DESCRIPTION_TOKENS = os.environ.get('AI_CATEGORY_DESCRIPTION_TOKENS', '150')
+
+    # Tag canonicalization: minimum name similarity for merging a tag into a more used one
+    TAG_MERGE_THRESHOLD = os.environ.get('TAG_MERGE_THRESHOLD', '0.9')
+
+    # Blog generation: content blocks (introduction, sections, conclusion) of one post generated concurrently
+    BLOG_SECTION_CONCURRENCY = os.environ.get('BLOG_SECTION_CONCURRENCY', '4')
+    # Batch blog generation (top tags without a post): AI requests in flight across all posts of
+    # the job, and estimated tokens (prompt + output) the job may spend (0 = unlimited)
+    BLOG_BATCH_CONCURRENCY = os.environ.get('BLOG_BATCH_CONCURRENCY', '8')
+    BLOG_BATCH_TOKEN_BUDGET = os.environ.get('BLOG_BATCH_TOKEN_BUDGET', '200000')
+
+    # Persistent AI response cache (SQLite), keyed by provider, model and prompt parameters
+    AI_CACHE_ENABLED = os.environ.get('AI_CACHE_ENABLED', 'true')
+    AI_CACHE_PATH = os.environ.get('AI_CACHE_PATH', 'instance/ai_cache.sqlite3')
+    AI_CACHE_MAX_ENTRIES = os.environ.get('AI_CACHE_MAX_ENTRIES', '50000') # Least recently used entries are evicted above this
+    AI_CACHE_TTL_SECONDS = os.environ.get('AI_CACHE_TTL_SECONDS', '2592000') # 30 days; 0 disables expiry
+
+    # Provider batch API (offline bulk tagging): seconds between status polls
+    AI_BATCH_POLL_SECONDS = os.environ.get('AI_BATCH_POLL_SECONDS', '60')
+
+    # Background job queue (auto-tagging, imports, exports, ...). Jobs are split into tasks of JOB_CHUNK_SIZE items;
+    # a worker holds a task for JOB_LEASE_SECONDS (renewed as it makes progress) and failed tasks are
+    # retried up to JOB_MAX_ATTEMPTS times. Web processes run JOB_EMBEDDED_WORKERS worker threads
+    # (0 = rely on separate `python job_queue.py` worker processes).
+    JOB_CHUNK_SIZE = os.environ.get('JOB_CHUNK_SIZE', '50')
+    JOB_LEASE_SECONDS = os.environ.get('JOB_LEASE_SECONDS', '300')
+    JOB_MAX_ATTEMPTS = os.environ.get('JOB_MAX_ATTEMPTS', '3')
+    JOB_POLL_SECONDS = os.environ.get('JOB_POLL_SECONDS', '2')
+    JOB_EMBEDDED_WORKERS = os.environ.get('JOB_EMBEDDED_WORKERS', '1')
+    # Seconds between progress checks on the live job progress stream (/jobs/events)
+    JOB_EVENTS_INTERVAL = os.environ.get('JOB_EVENTS_INTERVAL', '1')
+
+    # Gemini context caching for long shared prompt prefixes. The API only caches fairly large
+    # prefixes and needs a versioned model name (e.g. 'gemini-1.5-flash-001'); smaller prefixes are sent inline.
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS = os.environ.get('GEMINI_CONTEXT_CACHE_MIN_TOKENS', '32768')
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS = os.environ.get('GEMINI_CONTEXT_CACHE_TTL_SECONDS', '3600')
+
+    # Hedging and failover (see ai_services/hedged.py): a second provider ('claude', 'gemini', 'llama') that gets a
+    # duplicate of calls running past the primary's p95 latency, and takes over after a burst of primary errors.
+    # Empty disables both. AI_HEDGE_BUDGET_RATIO is the share of calls that may be duplicated, on average.
+    AI_SECONDARY_PROVIDER = os.environ.get('AI_SECONDARY_PROVIDER', '').lower()
+    AI_SECONDARY_MODEL_NAME = os.environ.get('AI_SECONDARY_MODEL_NAME', '') # Empty uses the secondary provider's default
+    AI_HEDGE_BUDGET_RATIO = os.environ.get('AI_HEDGE_BUDGET_RATIO', '0.05')
+    AI_FAILOVER_ERROR_THRESHOLD = os.environ.get('AI_FAILOVER_ERROR_THRESHOLD', '5') # Primary errors within the window that trigger failover
+    AI_FAILOVER_WINDOW_SECONDS = os.environ.get('AI_FAILOVER_WINDOW_SECONDS', '30')
+    AI_FAILOVER_COOLDOWN_SECONDS = os.environ.get('AI_FAILOVER_COOLDOWN_SECONDS', '60') # How long the secondary serves every call
 
     # Optional Model Override
     # If set, this overrides the default model for the selected provider
     AI_MODEL_NAME = os.environ.get('AI_MODEL_NAME', None)
 
+    # Per-task model routing ("generate_tags=claude-3-5-haiku-20241022,generate_outline=..."), on top of
+    # the provider's defaults (fast model for tags, categories and meta descriptions); 'off' uses one model for everything
+    AI_MODEL_ROUTES = os.environ.get('AI_MODEL_ROUTES', '')
+
     # Custom Prompts (as JSON string in env var)
     AI_CUSTOM_PROMPT_JSON = os.environ.get('AI_CUSTOM_PROMPT_JSON', '{}')
     try:
@@ -52,11 +143,56 @@ class Config:
         'SHOPIFY_STORE_URL': '',
         'AI_PROVIDER': 'claude',
         'ANTHROPIC_API_KEY': '',
+        'ANTHROPIC_BASE_URL': '',
+        'AI_HTTP_POOL_SIZE': '20',
+        'AI_MAX_CONCURRENT_CALLS': '20',
+        'AI_INITIAL_CONCURRENT_CALLS': '10',
+        'AI_MAX_RETRIES': '5',
+        'AI_RETRY_BUDGET_RATIO': '0.2',
+        'AI_PACKED_TAGGING': 'false',
+        'AI_PACK_TOKEN_BUDGET': '6000',
+        'AI_PACK_MAX_PRODUCTS': '20',
+        'AI_DEDUP_ENABLED': 'false',
+        'AI_DEDUP_THRESHOLD': '0.6',
+        'AI_DEDUP_NUM_PERM': '64',
+        'AI_CATEGORY_CLUSTER_SIZE': '20',
+        'AI_CATEGORY_CLUSTER_THRESHOLD': '0.4',
+        'AI_LOCAL_TAGGER': 'off',
+        'AI_LOCAL_TAGGER_MIN_CONFIDENCE': '0.8',
+        'AI_LOCAL_TAGGER_MAX_TAGS': '8',
+        'AI_TAGS_DESCRIPTION_TOKENS': '300',
+        'AI_CATEGORY_DESCRIPTION_TOKENS': '150',
+        'TAG_MERGE_THRESHOLD': '0.9',
+        'BLOG_SECTION_CONCURRENCY': '4',
+        'BLOG_BATCH_CONCURRENCY': '8',
+        'BLOG_BATCH_TOKEN_BUDGET': '200000',
+        'AI_CACHE_ENABLED': 'true',
+        'AI_CACHE_PATH': 'instance/ai_cache.sqlite3',
+        'AI_CACHE_MAX_ENTRIES': '50000',
+        'AI_CACHE_TTL_SECONDS': '2592000',
+        'AI_BATCH_POLL_SECONDS': '60',
+        'JOB_CHUNK_SIZE': '50',
+        'JOB_LEASE_SECONDS': '300',
+        'JOB_MAX_ATTEMPTS': '3',
+        'JOB_POLL_SECONDS': '2',
+        'JOB_EMBEDDED_WORKERS': '1',
+        'JOB_EVENTS_INTERVAL': '1',
+        'GEMINI_CONTEXT_CACHE_MIN_TOKENS': '32768',
+        'GEMINI_CONTEXT_CACHE_TTL_SECONDS': '3600',
         'GEMINI_API_KEY': '',
         'GROK_API_KEY': '',
         'LLAMA_API_BASE_URL': '',
         'LLAMA_API_KEY': '',
+        'LLAMA_BATCH_SIZE': '1',
+        'LLAMA_BATCH_WINDOW_MS': '10',
         'AI_MODEL_NAME': '',
+        'AI_MODEL_ROUTES': '',
+        'AI_SECONDARY_PROVIDER': '',
+        'AI_SECONDARY_MODEL_NAME': '',
+        'AI_HEDGE_BUDGET_RATIO': '0.05',
+        'AI_FAILOVER_ERROR_THRESHOLD': '5',
+        'AI_FAILOVER_WINDOW_SECONDS': '30',
+        'AI_FAILOVER_COOLDOWN_SECONDS': '60',
         'AI_CUSTOM_PROMPT_JSON': '{}'
     }
     
@@ -65,15 +201,16 @@ class Config:
         pass
 
     @classmethod
-    def get_ai_api_key(cls):
-        """Returns the API key for the configured AI_PROVIDER."""
-        if cls.AI_PROVIDER == 'claude':
+    def get_ai_api_key(cls, provider=None):
+        """Returns the API key for `provider` (default: the configured AI_PROVIDER)."""
+        provider = provider or cls.AI_PROVIDER
+        if provider == 'claude':
             return cls.ANTHROPIC_API_KEY
-        elif cls.AI_PROVIDER == 'gemini':
+        elif provider == 'gemini':
             return cls.GEMINI_API_KEY
-        elif cls.AI_PROVIDER == 'grok':
+        elif provider == 'grok':
             return cls.GROK_API_KEY
-        elif cls.AI_PROVIDER == 'llama':
+        elif provider == 'llama':
             # Llama might use a specific key or none depending on the local setup
             return cls.LLAMA_API_KEY
         else:
@@ -0,0 +1,497 @@
+"""
+Local stand-in for the Shopify Admin REST API.
+
+Serves the endpoints ShopifyIntegration talks to (products, custom/smart
+collections, collects and collection products) from an in-memory catalog built by
+synthetic_catalog.py. It behaves like the real API where it matters for sync and
+load testing:
+
+- cursor pagination through `page_info` and a `Link` header with rel="next"/"previous"
+- leaky-bucket rate limiting with the `X-Shopify-Shop-Api-Call-Limit` header
+- 429 responses with `Retry-After` when the bucket overflows (or at random, if asked)
+- injected latency with jitter
+
+Point a store (or SHOPIFY_STORE_URL) at e.g. http://127.0.0.1:8765 to use it.
+
+Usage:
+    python fake_shopify_server.py --products 5000 --port 8765 --latency-ms 80 --token test-token
+"""
+
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from synthetic_catalog import BASE_COLLECT_ID, BASE_COLLECTION_ID, BASE_PRODUCT_ID, generate_catalog
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 250
+
+
+class LeakyBucket:
+    """Shopify REST leaky bucket: `capacity` requests, draining at `leak_rate` per second."""
+
+    def __init__(self, capacity=40, leak_rate=2.0):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.level = 0.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """Add one request to the bucket. Returns (accepted, used, retry_after_seconds)."""
+        with self.lock:
+            now = time.monotonic()
+            self.level = max(0.0, self.level - (now - self.updated_at) * self.leak_rate)
+            self.updated_at = now
+            if self.level + 1 > self.capacity:
+                retry_after = (self.level + 1 - self.capacity) / self.leak_rate
+                return False, int(self.capacity), retry_after
+            self.level += 1
+            return True, int(round(self.level)), 0.0
+
+
+class FakeShopifyState:
+    """In-memory store data plus the knobs that shape the server's behaviour."""
+
+    def __init__(self, catalog, access_token=None, latency_ms=0.0, jitter_ms=0.0,
+                 bucket_capacity=40, leak_rate=2.0, rate_limit_probability=0.0, seed=None):
+        self.lock = threading.RLock()
+        self.products = {p["id"]: p for p in catalog["products"]}
+        self.custom_collections = {c["id"]: c for c in catalog["custom_collections"]}
+        self.smart_collections = {c["id"]: c for c in catalog["smart_collections"]}
+        self.collects = {c["id"]: c for c in catalog["collects"]}
+        self.access_token = access_token
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_probability = rate_limit_probability
+        self.bucket = LeakyBucket(capacity=bucket_capacity, leak_rate=leak_rate)
+        self.rng = random.Random(seed)
+        self.next_product_id = max(self.products, default=BASE_PRODUCT_ID) + 1
+        self.next_collection_id = max(list(self.custom_collections) + list(self.smart_collections),
+                                      default=BASE_COLLECTION_ID) + 1
+        self.next_collect_id = max(self.collects, default=BASE_COLLECT_ID) + 1
+        self.stats = {"requests": 0, "throttled": 0, "injected_429": 0, "by_endpoint": {}}
+
+    @classmethod
+    def from_synthetic(cls, num_products=1000, num_custom_collections=20, num_smart_collections=10,
+                       catalog_seed=42, **kwargs):
+        """Build a state seeded from the synthetic catalog generator."""
+        catalog = generate_catalog(
+            num_products=num_products,
+            num_custom_collections=num_custom_collections,
+            num_smart_collections=num_smart_collections,
+            seed=catalog_seed,
+        )
+        return cls(catalog, **kwargs)
+
+    def record(self, endpoint):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["by_endpoint"][endpoint] = self.stats["by_endpoint"].get(endpoint, 0) + 1
+
+    def sleep_latency(self):
+        """Block for the configured latency plus jitter."""
+        if self.latency_ms <= 0 and self.jitter_ms <= 0:
+            return
+        with self.lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000.0)
+
+    def smart_collection_product_ids(self, collection):
+        """Evaluate a smart collection's tag rules against the catalog."""
+        conditions = [rule["condition"].lower() for rule in collection.get("rules", [])
+                      if rule.get("column") == "tag" and rule.get("relation") == "equals"]
+        matches = []
+        for product in self.products.values():
+            tags = {tag.strip().lower() for tag in (product.get("tags") or "").split(",")}
+            hits = [condition in tags for condition in conditions]
+            if hits and (any(hits) if collection.get("disjunctive") else all(hits)):
+                matches.append(product["id"])
+        return matches
+
+    def collection_product_ids(self, collection_id):
+        """Return the ordered product ids that belong to a custom or smart collection."""
+        if collection_id in self.smart_collections:
+            return self.smart_collection_product_ids(self.smart_collections[collection_id])
+        return [c["product_id"] for c in sorted(self.collects.values(), key=lambda c: c["position"])
+                if c["collection_id"] == collection_id and c["product_id"] in self.products]
+
+
+def encode_page_info(resource, offset, limit):
+    """Encode an opaque cursor the same way clients see it from Shopify (URL-safe, no padding)."""
+    raw = json.dumps({"r": resource, "o": offset, "l": limit}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_page_info(page_info):
+    """Decode a cursor produced by encode_page_info. Returns None when it is malformed."""
+    try:
+        padded = page_info + "=" * (-len(page_info) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return data["r"], int(data["o"]), int(data["l"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class FakeShopifyHandler(BaseHTTPRequestHandler):
+    """Request handler for the fake Admin API. `server.state` holds the FakeShopifyState."""
+
+    protocol_version = "HTTP/1.1"
+    routes = [
+        ("GET", r"^/admin/api/[^/]+/products\.json$", "list_products"),
+        ("POST", r"^/admin/api/[^/]+/products\.json$", "create_product"),
+        ("GET", r"^/admin/api/[^/]+/products/(\d+)\.json$", "get_product"),
+        ("PUT", r"^/admin/api/[^/]+/products/(\d+)\.json$", "update_product"),
+        ("DELETE", r"^/admin/api/[^/]+/products/(\d+)\.json$", "delete_product"),
+        ("GET", r"^/admin/api/[^/]+/custom_collections\.json$", "list_custom_collections"),
+        ("POST", r"^/admin/api/[^/]+/custom_collections\.json$", "create_custom_collection"),
+        ("GET", r"^/admin/api/[^/]+/smart_collections\.json$", "list_smart_collections"),
+        ("POST", r"^/admin/api/[^/]+/smart_collections\.json$", "create_smart_collection"),
+        ("GET", r"^/admin/api/[^/]+/collects\.json$", "list_collects"),
+        ("POST", r"^/admin/api/[^/]+/collects\.json$", "create_collect"),
+        ("GET", r"^/admin/api/[^/]+/collections/(\d+)/products\.json$", "list_collection_products"),
+        ("GET", r"^/__fake__/stats$", "get_stats"),
+    ]
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable; request logging is available via --verbose
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+    # --- Dispatch ---
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        parsed = urlparse(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        for route_method, pattern, handler_name in self.routes:
+            match = re.match(pattern, parsed.path)
+            if route_method == method and match:
+                break
+        else:
+            self._read_body()
+            self._send_json(404, {"errors": "Not Found"})
+            return
+
+        if handler_name == "get_stats":
+            self._read_body()
+            with self.state.lock:
+                self._send_json(200, json.loads(json.dumps(self.state.stats)), rate_limited=False)
+            return
+
+        self.state.record(f"{method} {handler_name}")
+        body = self._read_body()
+
+        if self.state.access_token and self.headers.get("X-Shopify-Access-Token") != self.state.access_token:
+            self._send_json(401, {"errors": "[API] Invalid API key or access token (unrecognized login or wrong password)"})
+            return
+
+        accepted, used, retry_after = self.state.bucket.try_acquire()
+        if not accepted:
+            with self.state.lock:
+                self.state.stats["throttled"] += 1
+            self._send_throttled(retry_after)
+            return
+        if self.state.rate_limit_probability:
+            with self.state.lock:
+                inject = self.state.rng.random() < self.state.rate_limit_probability
+                if inject:
+                    self.state.stats["injected_429"] += 1
+            if inject:
+                self._send_throttled(1.0)
+                return
+
+        self.call_limit = f"{used}/{self.state.bucket.capacity}"
+        self.state.sleep_latency()
+        getattr(self, handler_name)(*match.groups(), body=body)
+
+    # --- Helpers ---
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _send_json(self, status, payload, link=None, rate_limited=True):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if rate_limited and getattr(self, "call_limit", None):
+            self.send_header("X-Shopify-Shop-Api-Call-Limit", self.call_limit)
+        if link:
+            self.send_header("Link", link)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_throttled(self, retry_after):
+        self.call_limit = f"{self.state.bucket.capacity}/{self.state.bucket.capacity}"
+        data = json.dumps({"errors": "Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service."}).encode()
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Retry-After", f"{max(retry_after, 0.1):.1f}")
+        self.send_header("X-Shopify-Shop-Api-Call-Limit", self.call_limit)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _base_url(self):
+        host = self.headers.get("Host") or "%s:%s" % self.server.server_address[:2]
+        return f"http://{host}"
+
+    def _paginate(self, resource, items):
+        """Slice `items` according to limit/page_info and build the Link header."""
+        try:
+            limit = min(int(self.query.get("limit", DEFAULT_PAGE_LIMIT)), MAX_PAGE_LIMIT)
+        except ValueError:
+            limit = DEFAULT_PAGE_LIMIT
+        offset = 0
+        page_info = self.query.get("page_info")
+        if page_info:
+            decoded = decode_page_info(page_info)
+            if not decoded or decoded[0] != resource:
+                return None, None
+            offset = decoded[1]
+
+        page = items[offset:offset + limit]
+        path = urlparse(self.path).path
+        links = []
+        if offset + limit < len(items):
+            next_query = urlencode({"limit": limit, "page_info": encode_page_info(resource, offset + limit, limit)})
+            links.append(f'<{self._base_url()}{path}?{next_query}>; rel="next"')
+        if offset > 0:
+            previous_query = urlencode({"limit": limit, "page_info": encode_page_info(resource, max(0, offset - limit), limit)})
+            links.insert(0, f'<{self._base_url()}{path}?{previous_query}>; rel="previous"')
+        return page, ", ".join(links) or None
+
+    def _send_page(self, key, resource, items):
+        page, link = self._paginate(resource, items)
+        if page is None:
+            self._send_json(400, {"errors": {"page_info": ["Invalid value."]}})
+            return
+        self._send_json(200, {key: page}, link=link)
+
+    # --- Products ---
+
+    def list_products(self, body=None):
+        with self.state.lock:
+            items = sorted(self.state.products.values(), key=lambda p: p["id"])
+        self._send_page("products", "products", items)
+
+    def get_product(self, product_id, body=None):
+        product = self.state.products.get(int(product_id))
+        if not product:
+            self._send_json(404, {"errors": "Not Found"})
+            return
+        self._send_json(200, {"product": product})
+
+    def create_product(self, body=None):
+        data = (body or {}).get("product")
+        if not data or not data.get("title"):
+            self._send_json(422, {"errors": {"title": ["can't be blank"]}})
+            return
+        with self.state.lock:
+            product_id = self.state.next_product_id
+            self.state.next_product_id += 1
+            now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            product = {
+                "id": product_id,
+                "title": data["title"],
+                "body_html": data.get("body_html", ""),
+                "vendor": data.get("vendor", ""),
+                "product_type": data.get("product_type", ""),
+                "handle": data.get("handle") or "-".join(data["title"].lower().split()),
+                "tags": data.get("tags", ""),
+                "status": "active",
+                "variants": [dict(v, id=product_id * 10 + i, product_id=product_id)
+                             for i, v in enumerate(data.get("variants") or [{"price": "0.00"}])],
+                "images": [dict(img, id=product_id * 10 + i, product_id=product_id)
+                           for i, img in enumerate(data.get("images") or [])],
+                "created_at": now,
+                "updated_at": now,
+            }
+            self.state.products[product_id] = product
+        self._send_json(201, {"product": product})
+
+    def update_product(self, product_id, body=None):
+        data = (body or {}).get("product") or {}
+        with self.state.lock:
+            product = self.state.products.get(int(product_id))
+            if not product:
+                self._send_json(404, {"errors": "Not Found"})
+                return
+            for field in ("title", "body_html", "vendor", "product_type", "tags", "handle"):
+                if field in data:
+                    product[field] = data[field]
+            if "metafields" in data:
+                product["metafields"] = data["metafields"]
+            product["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        self._send_json(200, {"product": product})
+
+    def delete_product(self, product_id, body=None):
+        with self.state.lock:
+            if self.state.products.pop(int(product_id), None) is None:
+                self._send_json(404, {"errors": "Not Found"})
+                return
+        self._send_json(200, {})
+
+    # --- Collections ---
+
+    def list_custom_collections(self, body=None):
+        with self.state.lock:
+            items = sorted(self.state.custom_collections.values(), key=lambda c: c["id"])
+        self._send_page("custom_collections", "custom_collections", items)
+
+    def list_smart_collections(self, body=None):
+        with self.state.lock:
+            items = sorted(self.state.smart_collections.values(), key=lambda c: c["id"])
+        self._send_page("smart_collections", "smart_collections", items)
+
+    def _create_collection(self, key, target, body):
+        data = (body or {}).get(key)
+        if not data or not data.get("title"):
+            self._send_json(422, {"errors": {"title": ["can't be blank"]}})
+            return
+        with self.state.lock:
+            collection_id = self.state.next_collection_id
+            self.state.next_collection_id += 1
+            collection = dict(data, id=collection_id)
+            collection["handle"] = data.get("handle") or "-".join(data["title"].lower().split())
+            target[collection_id] = collection
+        self._send_json(201, {key: collection})
+
+    def create_custom_collection(self, body=None):
+        self._create_collection("custom_collection", self.state.custom_collections, body)
+
+    def create_smart_collection(self, body=None):
+        self._create_collection("smart_collection", self.state.smart_collections, body)
+
+    def list_collects(self, body=None):
+        with self.state.lock:
+            items = sorted(self.state.collects.values(), key=lambda c: c["id"])
+            collection_id = self.query.get("collection_id")
+            if collection_id:
+                items = [c for c in items if str(c["collection_id"]) == collection_id]
+        self._send_page("collects", "collects", items)
+
+    def create_collect(self, body=None):
+        data = (body or {}).get("collect") or {}
+        try:
+            collection_id = int(data.get("collection_id"))
+            product_id = int(data.get("product_id"))
+        except (TypeError, ValueError):
+            self._send_json(422, {"errors": {"collect": ["collection_id and product_id are required"]}})
+            return
+        with self.state.lock:
+            if collection_id not in self.state.custom_collections or product_id not in self.state.products:
+                self._send_json(422, {"errors": {"collect": ["collection or product not found"]}})
+                return
+            if any(c["collection_id"] == collection_id and c["product_id"] == product_id
+                   for c in self.state.collects.values()):
+                self._send_json(422, {"errors": {"product_id": ["already exists in this collection"]}})
+                return
+            collect_id = self.state.next_collect_id
+            self.state.next_collect_id += 1
+            collect = {"id": collect_id, "collection_id": collection_id, "product_id": product_id,
+                       "position": len(self.state.collects) + 1}
+            self.state.collects[collect_id] = collect
+        self._send_json(201, {"collect": collect})
+
+    def list_collection_products(self, collection_id, body=None):
+        collection_id = int(collection_id)
+        with self.state.lock:
+            if collection_id not in self.state.custom_collections and collection_id not in self.state.smart_collections:
+                self._send_json(404, {"errors": "Not Found"})
+                return
+            items = [self.state.products[pid] for pid in self.state.collection_product_ids(collection_id)]
+        self._send_page("products", f"collection:{collection_id}", items)
+
+
+def start_server(state, host="127.0.0.1", port=0, verbose=False):
+    """
+    Start the fake Admin API on a daemon thread.
+
+    Returns:
+        (server, base_url). Call server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), FakeShopifyHandler)
+    server.daemon_threads = True
+    server.state = state
+    server.verbose = verbose
+    thread = threading.Thread(target=server.serve_forever, name="fake-shopify", daemon=True)
+    thread.start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, f"http://{bound_host}:{bound_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Shopify Admin API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--products", type=int, default=1000, help="Number of synthetic products to seed")
+    parser.add_argument("--custom-collections", type=int, default=20)
+    parser.add_argument("--smart-collections", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the synthetic catalog")
+    parser.add_argument("--token", default=None, help="Require this X-Shopify-Access-Token (any token accepted if unset)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latency added to every API call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter applied to the latency")
+    parser.add_argument("--bucket-size", type=int, default=40, help="Leaky bucket capacity (Shopify standard plan: 40)")
+    parser.add_argument("--leak-rate", type=float, default=2.0, help="Requests drained from the bucket per second")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="Probability of an injected 429 per call")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    state = FakeShopifyState.from_synthetic(
+        num_products=args.products,
+        num_custom_collections=args.custom_collections,
+        num_smart_collections=args.smart_collections,
+        catalog_seed=args.seed,
+        access_token=args.token,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        bucket_capacity=args.bucket_size,
+        leak_rate=args.leak_rate,
+        rate_limit_probability=args.rate_limit_probability,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), FakeShopifyHandler)
+    server.daemon_threads = True
+    server.state = state
+    server.verbose = args.verbose
+    print(f"Fake Shopify Admin API serving {len(state.products)} products on http://{args.host}:{args.port}")
+    print(f"Stats: http://{args.host}:{args.port}/__fake__/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down fake Shopify server")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -59,6 +59,20 @@ class TagForm(FlaskForm):
 
 class AutoTagForm(FlaskForm):
     """Form for auto-tagging products."""
+    pack_products = BooleanField('Pack several products per AI request (fewer, cheaper calls)')
+    dedupe_products = BooleanField('Tag near-duplicate products (e.g. color variants) with one AI call')
+    refresh_cache = BooleanField('Ignore cached AI responses')
+    local_tagger = SelectField('Local tagger', choices=[
+        ('', 'Local tagger: default'),
+        ('off', 'AI only'),
+        ('gate', 'Local tags first, AI for uncertain products'),
+        ('fallback', 'AI, local tags where it fails'),
+        ('local', 'Local tags only (no AI calls)')
+    ], default='')
+    backend = SelectField('Execution', choices=[
+        ('interactive', 'Interactive (tag now)'),
+        ('message_batch', 'Message batch (offline, cheaper)')
+    ], default='interactive')
     submit = SubmitField('Auto-Tag Selected Products')
 
 class CreateCollectionsForm(FlaskForm):
@@ -115,7 +129,7 @@ class BlogPostForm(FlaskForm, SEOFormMixin):
    title = StringField('Title', validators=[DataRequired(), Length(max=255)])
    content = TextAreaField('Content', validators=[DataRequired()])
    status = SelectField('Status',
-                        choices=[('draft', 'Draft'), ('published', 'Published'), ('failed', 'Failed'), ('outline_generated', 'Outline Generated')],
+                        choices=[('draft', 'Draft'), ('published', 'Published'), ('failed', 'Failed'), ('outline_generated', 'Outline Generated'), ('generating', 'Generating')],
                         validators=[DataRequired()])
    # SEO fields (seo_title, meta_description, etc.) are inherited from SEOFormMixin
    submit = SubmitField('Save Blog Post')
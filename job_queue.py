@@ -0,0 +1,749 @@
+"""
+Durable background job queue backed by the jobs and job_tasks tables.
+
+A job (auto-tagging a selection of products, creating collections from tags, a Shopify
+import or export, generating blog posts for top tags) is split into tasks of up to
+JOB_CHUNK_SIZE items. Workers claim one task at a time by taking a lease: a
+conditional UPDATE that only succeeds if the task is still claimable, so two workers
+never run the same task. Long tasks renew their lease as they make progress; a task
+whose lease expires (crashed or stuck worker) becomes claimable again. Failed tasks,
+and items that failed inside a task, are retried with exponential backoff up to
+JOB_MAX_ATTEMPTS times before they count as failed. Job.progress() turns the counters
+into percent done, throughput and ETA for the live progress bars (/jobs/events). The AI
+calls each task makes are recorded (see ai_services/telemetry.py) and added to the job's
+result as an 'ai' summary: calls, errors, retries, tokens and latency percentiles.
+
+Run dedicated worker processes with:
+    python job_queue.py --processes 2
+Web processes also start JOB_EMBEDDED_WORKERS worker threads the first time they
+enqueue a job, so jobs still run when no separate worker is running.
+"""
+
+import argparse
+import asyncio
+import copy
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from flask import g
+from sqlalchemy import and_, func, or_
+
+from ai_services.base import FAILED_TAG_RESULTS, compute_backoff
+from ai_services.cache import bypass_cache
+from ai_services.loop_runner import get_loop_runner, run_blocking
+from ai_services.near_duplicates import cluster_products
+from ai_services.telemetry import summarize, telemetry_scope
+from product_descriptions import refresh_compact_descriptions
+from models import db, BlogPost, Job, JobTask, Product, Store, Tag, Collection, SEODefaults, product_tags
+from config import Config
+from tag_batches import apply_generated_tags
+
+
+class LeaseLost(Exception):
+    """The task's lease expired and another worker may have claimed it."""
+
+
+def enqueue_job(job_type: str, items: List[Any], store_id: Optional[int] = None,
+                options: Optional[Dict[str, Any]] = None, chunk_size: Optional[int] = None,
+                chunks: Optional[List[List[Any]]] = None) -> Job:
+    """
+    Create a job with one task per chunk of `items` (stored in each task payload as 'items').
+    `chunks` gives the split explicitly instead, e.g. to keep related items in one task.
+    """
+    chunk_size = int(chunk_size or Config.JOB_CHUNK_SIZE or 50)
+    if chunks is None:
+        chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+    max_attempts = int(Config.JOB_MAX_ATTEMPTS or 3)
+    job = Job(store_id=store_id, job_type=job_type, status='queued', options=options or {},
+              total_items=len(items), processed_count=0, failed_count=0)
+    db.session.add(job)
+    db.session.flush()
+    now = datetime.utcnow()
+    db.session.add_all([
+        JobTask(job_id=job.id, status='pending', payload={'items': chunk},
+                attempts=0, max_attempts=max_attempts, available_at=now)
+        for chunk in chunks if chunk
+    ])
+    db.session.commit()
+    print(f"Enqueued {job_type} job {job.id} with {len(items)} items")
+    return job
+
+
+def enqueue_auto_tag_job(product_ids: List[int], store_id: Optional[int] = None, options: Optional[Dict[str, Any]] = None) -> Job:
+    """
+    Queue auto-tagging (and Shopify export) of products.
+
+    Options: 'packed', 'dedupe', 'local_mode' and 'refresh_cache', as on the auto-tag form.
+    With 'dedupe', each near-duplicate cluster is kept within one task, so the cluster
+    still needs only one AI call.
+    """
+    product_ids = sorted(int(product_id) for product_id in product_ids)
+    chunks = _near_duplicate_chunks(product_ids) if (options or {}).get('dedupe') else None
+    return enqueue_job('auto_tag', product_ids, store_id, options, chunks=chunks)
+
+
+def _near_duplicate_chunks(product_ids: List[int]) -> List[List[int]]:
+    """
+    Split products into chunks of about JOB_CHUNK_SIZE without splitting a near-duplicate
+    cluster (a cluster larger than a chunk gets a chunk of its own).
+    """
+    chunk_size = int(Config.JOB_CHUNK_SIZE or 50)
+    products = Product.query.filter(Product.id.in_(product_ids)).all() if product_ids else []
+    if refresh_compact_descriptions(products):
+        db.session.commit()
+    clusters = cluster_products(products, threshold=float(Config.AI_DEDUP_THRESHOLD or 0.6),
+                                num_perm=int(Config.AI_DEDUP_NUM_PERM or 64),
+                                describe=lambda product: product.compact_description)
+    groups = [sorted(product.id for product in cluster) for cluster in clusters]
+    # Ids whose product no longer exists still go into a task, which counts them as processed
+    found = {product.id for product in products}
+    groups += [[product_id] for product_id in product_ids if product_id not in found]
+    chunks: List[List[int]] = [[]]
+    for group in sorted(groups):
+        if chunks[-1] and len(chunks[-1]) + len(group) > chunk_size:
+            chunks.append([])
+        chunks[-1].extend(group)
+    return chunks
+
+
+def enqueue_create_collections_job(tag_ids: List[int], store_id: Optional[int] = None, exclude_imported_tags: bool = False) -> Job:
+    """Queue creating a collection for each eligible tag."""
+    return enqueue_job('create_collections', sorted(int(tag_id) for tag_id in tag_ids), store_id,
+                       {'exclude_imported_tags': bool(exclude_imported_tags)})
+
+
+def enqueue_export_collections_job(collection_ids: List[int], store_id: Optional[int] = None, optimize_seo: bool = False) -> Job:
+    """Queue exporting collections to Shopify, optionally rewriting their copy for SEO first."""
+    return enqueue_job('export_collections', sorted(int(collection_id) for collection_id in collection_ids), store_id,
+                       {'optimize_seo': bool(optimize_seo)})
+
+
+def enqueue_blog_posts_job(tag_ids: List[int], store_id: int, concurrency: Optional[int] = None,
+                           token_budget: Optional[int] = None) -> Job:
+    """
+    Queue generating a blog post for each tag, in the given (rank) order. The job is a single
+    task: its posts share `concurrency` AI requests in flight and `token_budget` tokens, which
+    tasks running at the same time on different workers could not share.
+    """
+    tag_ids = [int(tag_id) for tag_id in tag_ids]
+    return enqueue_job('generate_blog_posts', tag_ids, store_id, {
+        'concurrency': int(concurrency or Config.BLOG_BATCH_CONCURRENCY or 8),
+        'token_budget': int(token_budget if token_budget is not None else (Config.BLOG_BATCH_TOKEN_BUDGET or 0)),
+    }, chunk_size=max(len(tag_ids), 1))
+
+
+def enqueue_shopify_import_job(entity: str, store_id: int) -> Job:
+    """
+    Queue a Shopify import of 'products' or 'collections'. The job starts with a single item
+    and learns its real total once the Shopify listing has been fetched.
+    """
+    if entity not in ('products', 'collections'):
+        raise ValueError(f"Unknown import type '{entity}'")
+    return enqueue_job(f'import_{entity}', [store_id], store_id, chunk_size=1)
+
+
+def _claimable(now: datetime):
+    return or_(
+        and_(JobTask.status == 'pending', JobTask.available_at <= now),
+        and_(JobTask.status == 'leased', JobTask.lease_expires_at < now),
+    )
+
+
+def claim_task(worker_id: str, lease_seconds: Optional[float] = None) -> Optional[JobTask]:
+    """Lease the oldest claimable task for `worker_id`, or return None if there is none."""
+    lease_seconds = float(lease_seconds or Config.JOB_LEASE_SECONDS or 300)
+    now = datetime.utcnow()
+    candidates = [task_id for (task_id,) in db.session.query(JobTask.id).filter(_claimable(now)).order_by(JobTask.id).limit(5)]
+    for task_id in candidates:
+        # Compare-and-set: only one worker's UPDATE still matches the claimable condition
+        claimed = JobTask.query.filter(JobTask.id == task_id, _claimable(now)).update({
+            JobTask.status: 'leased',
+            JobTask.lease_owner: worker_id,
+            JobTask.lease_expires_at: now + timedelta(seconds=lease_seconds),
+            JobTask.attempts: JobTask.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            task = db.session.get(JobTask, task_id)
+            db.session.refresh(task)
+            return task
+    return None
+
+
+def renew_lease(task: JobTask, worker_id: str, lease_seconds: Optional[float] = None) -> bool:
+    """Extend a held lease. Returns False if the lease was lost to another worker."""
+    lease_seconds = float(lease_seconds or Config.JOB_LEASE_SECONDS or 300)
+    renewed = JobTask.query.filter_by(id=task.id, status='leased', lease_owner=worker_id).update({
+        JobTask.lease_expires_at: datetime.utcnow() + timedelta(seconds=lease_seconds),
+    }, synchronize_session=False)
+    db.session.commit()
+    return bool(renewed)
+
+
+def record_job_progress(job_id: int, processed: int = 0, failed: int = 0) -> None:
+    """Add to a job's counters with an atomic UPDATE (several workers may share the job)."""
+    if processed or failed:
+        Job.query.filter_by(id=job_id).update({
+            Job.processed_count: Job.processed_count + processed,
+            Job.failed_count: Job.failed_count + failed,
+        }, synchronize_session=False)
+
+
+def reset_job_progress(job_id: int, total: int) -> None:
+    """Restart a single-task job's counters against a newly known total (e.g. a retried import)."""
+    Job.query.filter_by(id=job_id).update({
+        Job.total_items: total,
+        Job.processed_count: 0,
+        Job.failed_count: 0,
+    }, synchronize_session=False)
+
+
+def _without_reported(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in payload.items() if key != 'reported'}
+
+
+def _take_back_progress(task: JobTask) -> None:
+    """
+    Subtract what an unfinished attempt of the task added to the job counters: the attempt
+    failed or its worker died, so its items run again (or fail) and are counted then.
+    """
+    reported = (task.payload or {}).get('reported')
+    if reported:
+        record_job_progress(task.job_id, -reported.get('processed', 0), -reported.get('failed', 0))
+        task.payload = _without_reported(task.payload)
+
+
+def _finish_job_if_done(job_id: int) -> None:
+    """Close the job once none of its tasks are pending or leased, summing the task results."""
+    open_tasks = JobTask.query.filter(JobTask.job_id == job_id, JobTask.status.in_(('pending', 'leased'))).count()
+    if open_tasks:
+        return
+    job = db.session.get(Job, job_id)
+    tasks = JobTask.query.filter_by(job_id=job_id).all()
+    summary: Dict[str, Any] = {}
+    for task in tasks:
+        _add_numbers(summary, task.result or {})
+    if 'ai' in summary:
+        # AI call telemetry of all tasks: add latency percentiles and error rate for the job as a whole
+        summary['ai'] = summarize(summary['ai'])
+    job.result = summary
+    job.status = 'failed' if tasks and all(task.status == 'failed' for task in tasks) else 'completed'
+    errors = [task.last_error for task in tasks if task.status == 'failed' and task.last_error]
+    job.error_message = errors[0] if errors else None
+    job.completed_at = datetime.utcnow()
+    db.session.commit()
+    print(f"Job {job_id} {job.status}: {job.processed_count} processed, {job.failed_count} failed")
+
+
+class TaskContext:
+    """What a task handler gets: the job, the task, the AI service and a progress heartbeat."""
+
+    def __init__(self, job: Job, task: JobTask, worker_id: str, ai_service: Any):
+        self.job = job
+        self.task = task
+        self.worker_id = worker_id
+        self.ai_service = ai_service
+
+    def heartbeat(self, processed: int = 0, failed: int = 0) -> None:
+        """
+        Commit finished work, renew the lease and add the work to the job counters. The task
+        payload keeps what this attempt has reported, to take it back if the attempt fails.
+        """
+        if not renew_lease(self.task, self.worker_id):
+            raise LeaseLost(f"Lease on task {self.task.id} was lost")
+        if processed or failed:
+            reported = self.task.payload.get('reported') or {}
+            self.task.payload = {**self.task.payload, 'reported': {
+                'processed': reported.get('processed', 0) + processed,
+                'failed': reported.get('failed', 0) + failed,
+            }}
+            record_job_progress(self.job.id, processed, failed)
+            db.session.commit()
+
+    def restart_progress(self, total: int) -> None:
+        """Restart the (single-task) job's counters against a newly known total."""
+        reset_job_progress(self.job.id, total)
+        self.task.payload = _without_reported(self.task.payload)
+
+    def run_ai(self, coro: Awaitable[Any]) -> Any:
+        """
+        Run a coroutine on the shared AI event loop and wait for it, running its database work
+        (`await run_blocking(...)`) on this thread meanwhile. Commits don't expire loaded objects
+        until it is done, so the coroutine reading them doesn't query the database from the loop.
+        """
+        session = db.session()
+        expire_on_commit = session.expire_on_commit
+        session.expire_on_commit = False
+        try:
+            return get_loop_runner().run_and_serve(coro)
+        finally:
+            session.expire_on_commit = expire_on_commit
+
+    @property
+    def final_attempt(self) -> bool:
+        return (self.task.attempts or 0) >= (self.task.max_attempts or 1)
+
+
+# Local taggers fitted on a store's catalog by (job id, store id): fitted once per job in this
+# process instead of once per task. Fitted under the lock, then only used from the AI loop thread.
+_local_taggers: 'OrderedDict[tuple, Any]' = OrderedDict()
+_local_taggers_lock = threading.Lock()
+LOCAL_TAGGER_CACHE_SIZE = 4
+
+
+def _job_local_tagger(job: Job, ai_service: Any) -> Any:
+    """The job's local tagger, fitted on the store's catalog the first time one of its tasks needs it."""
+    key = (job.id, job.store_id)
+    with _local_taggers_lock:
+        tagger = _local_taggers.get(key)
+        if tagger is None:
+            # Titles and descriptions are all the tagger reads; skip loading full ORM rows
+            catalog_query = db.session.query(Product.title, Product.description)
+            if job.store_id:
+                catalog_query = catalog_query.filter(Product.store_id == job.store_id)
+            tagger = _local_taggers[key] = ai_service.build_local_tagger(catalog_query.all())
+            while len(_local_taggers) > LOCAL_TAGGER_CACHE_SIZE:
+                _local_taggers.popitem(last=False)
+        else:
+            _local_taggers.move_to_end(key)
+        return tagger
+
+
+def handle_auto_tag_task(context: TaskContext) -> Dict[str, Any]:
+    """
+    Tag a chunk of products, persisting tags as each product finishes, then export the
+    tagged products to Shopify. Products whose tagging failed are left in the payload
+    for a retry unless this is the last attempt.
+    """
+    job, task, ai_service = context.job, context.task, context.ai_service
+    options = job.options or {}
+    product_ids = task.payload.get('items') or []
+    products_query = Product.query.filter(Product.id.in_(product_ids))
+    if job.store_id:
+        products_query = products_query.filter_by(store_id=job.store_id)
+    products = products_query.all()
+    if len(products) < len(product_ids):
+        # Deleted since the job was queued; nothing to do for them
+        context.heartbeat(processed=len(product_ids) - len(products))
+    if refresh_compact_descriptions(products):
+        db.session.commit()
+
+    local_mode = (options.get('local_mode') or 'off').lower()
+    local_tagger = _job_local_tagger(job, ai_service) if local_mode in ('local', 'gate', 'fallback') else None
+
+    stats = {'tagged': 0, 'tags_added': 0, 'exported': 0, 'export_errors': 0}
+    failed: List[Product] = []
+
+    async def tag_products():
+        pending = 0
+        with bypass_cache(bool(options.get('refresh_cache'))):
+            async for product, tags in ai_service.iter_generate_tags(products, packed=bool(options.get('packed')),
+                                                                     dedupe=bool(options.get('dedupe')),
+                                                                     local_mode=local_mode, local_tagger=local_tagger):
+                if tags in FAILED_TAG_RESULTS:
+                    failed.append(product)
+                    continue
+                if tags:
+                    tags_added = await run_blocking(apply_generated_tags, product, tags, job.store_id)
+                    if tags_added > 0:
+                        stats['tagged'] += 1
+                        stats['tags_added'] += tags_added
+                pending += 1
+                # Commit periodically so finished work survives a failure later in the task
+                if pending >= 25:
+                    await run_blocking(context.heartbeat, processed=pending)
+                    pending = 0
+        await run_blocking(context.heartbeat, processed=pending)
+
+    if products:
+        calls_avoided_before = ai_service.dedup_stats['calls_avoided']
+        local_stats_before = dict(ai_service.local_tagger_stats)
+        context.run_ai(tag_products())
+        if options.get('dedupe'):
+            stats['calls_avoided'] = ai_service.dedup_stats['calls_avoided'] - calls_avoided_before
+        if local_tagger is not None:
+            stats['tagged_locally'] = ai_service.local_tagger_stats['local'] - local_stats_before['local']
+            stats['sent_to_ai'] = ai_service.local_tagger_stats['ai'] - local_stats_before['ai']
+            stats['local_fallbacks'] = ai_service.local_tagger_stats['fallbacks'] - local_stats_before['fallbacks']
+
+    failed_ids = {product.id for product in failed}
+    if Config.SHOPIFY_ACCESS_TOKEN and Config.SHOPIFY_STORE_URL:
+        from shopify_integration import ShopifyIntegration
+        shopify_service = ShopifyIntegration()
+        for product in products:
+            if product.id in failed_ids or not product.tags:
+                continue
+            result = shopify_service.export_product_to_shopify(product)
+            if 'error' not in result:
+                stats['exported'] += 1
+            else:
+                stats['export_errors'] += 1
+
+    if failed and not context.final_attempt:
+        stats['retry_items'] = sorted(failed_ids)
+    else:
+        context.heartbeat(processed=len(failed), failed=len(failed))
+    return stats
+
+
+def _job_store(job: Job) -> Optional[Store]:
+    """The job's store, also set as g.current_store for helpers that read it (cleanup rules, SEO templates)."""
+    store = db.session.get(Store, job.store_id) if job.store_id else None
+    g.current_store = store
+    return store
+
+
+def _shopify_service_for(store: Optional[Store]) -> Any:
+    from shopify_integration import ShopifyIntegration
+    shopify_service = ShopifyIntegration()
+    if not store or not shopify_service.set_store_context(store):
+        store_name = store.name if store else "No store selected"
+        raise ValueError(f'Shopify integration not configured for store "{store_name}"')
+    return shopify_service
+
+
+def handle_create_collections_task(context: TaskContext) -> Dict[str, Any]:
+    """Create collections for a chunk of tags, skipping ineligible tags and tags that already have one."""
+    from app import create_collection_for_tag
+
+    job, task = context.job, context.task
+    store = _job_store(job)
+    tag_ids = task.payload.get('items') or []
+    tag_query = db.session.query(Tag, func.count(product_tags.c.product_id)).outerjoin(product_tags) \
+        .filter(Tag.id.in_(tag_ids)).group_by(Tag.id)
+    if store:
+        tag_query = tag_query.filter(Tag.store_id == store.id)
+    tag_counts = tag_query.all()
+    if len(tag_counts) < len(tag_ids):
+        # Deleted since the job was queued
+        context.heartbeat(processed=len(tag_ids) - len(tag_counts))
+
+    collection_seo_defaults = None
+    if store:
+        collection_seo_defaults = SEODefaults.query.filter_by(store_id=store.id, entity_type='collection').first()
+
+    stats = {'created': 0, 'skipped': 0}
+    pending = 0
+    for tag, product_count in tag_counts:
+        collection = create_collection_for_tag(tag, product_count, store, collection_seo_defaults,
+                                               bool((job.options or {}).get('exclude_imported_tags')))
+        stats['created' if collection else 'skipped'] += 1
+        pending += 1
+        if pending >= 25:
+            context.heartbeat(processed=pending)
+            pending = 0
+    context.heartbeat(processed=pending)
+    return stats
+
+
+def handle_export_collections_task(context: TaskContext) -> Dict[str, Any]:
+    """Export a chunk of collections to Shopify; failed exports are retried unless this is the last attempt."""
+    from app import export_collection_with_products
+
+    job, task = context.job, context.task
+    store = _job_store(job)
+    shopify_service = _shopify_service_for(store)
+    collection_ids = task.payload.get('items') or []
+    collections_query = Collection.query.filter(Collection.id.in_(collection_ids))
+    if store:
+        collections_query = collections_query.filter_by(store_id=store.id)
+    collections = collections_query.all()
+    if len(collections) < len(collection_ids):
+        context.heartbeat(processed=len(collection_ids) - len(collections))
+
+    stats = {'exported': 0}
+    failed: List[int] = []
+    for collection in collections:
+        if export_collection_with_products(shopify_service, collection, store, bool((job.options or {}).get('optimize_seo'))):
+            stats['exported'] += 1
+            # Commit the Shopify ID right away so a retry doesn't export the collection twice
+            context.heartbeat(processed=1)
+        else:
+            failed.append(collection.id)
+
+    if failed and not context.final_attempt:
+        stats['retry_items'] = failed
+    else:
+        context.heartbeat(processed=len(failed), failed=len(failed))
+    return stats
+
+
+def handle_shopify_import_task(context: TaskContext) -> Dict[str, Any]:
+    """Import products or collections from Shopify, reporting progress per imported entity."""
+    job = context.job
+    store = _job_store(job)
+    shopify_service = _shopify_service_for(store)
+    reported = 0
+
+    def progress(done: int, total: int) -> None:
+        nonlocal reported
+        if done == 0:
+            context.restart_progress(total)
+            reported = 0
+        context.heartbeat(processed=done - reported)
+        reported = done
+
+    if job.job_type == 'import_collections':
+        result = shopify_service.import_collections_from_shopify(db, current_store=store, progress=progress)
+    else:
+        result = shopify_service.import_products_from_shopify(db, current_store=store, progress=progress)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return {key: value for key, value in result.items() if key in ('imported', 'updated')}
+
+
+def handle_generate_blog_posts_task(context: TaskContext) -> Dict[str, Any]:
+    """
+    Generate a blog post per tag concurrently under the job's shared concurrency and token
+    budget. Tags that got a post elsewhere meanwhile are skipped; posts this job started
+    and that failed are resumed on retry, and posts the budget can't cover are left as is.
+    """
+    from blog_generation import TokenBudget, TokenBudgetExceeded, generate_batch_post
+
+    job, task, ai_service = context.job, context.task, context.ai_service
+    store = _job_store(job)
+    options = job.options or {}
+    tag_ids = task.payload.get('items') or []
+    tags = {tag.id: tag for tag in Tag.query.filter(Tag.id.in_(tag_ids), Tag.store_id == job.store_id)}
+    posts = {post.source_tag_id: post for post in BlogPost.query.filter(BlogPost.source_tag_id.in_(tag_ids))}
+    # Tokens spent by earlier attempts (the job's only task, see enqueue_blog_posts_job)
+    spent = sum((other.result or {}).get('tokens_used', 0) for other in JobTask.query.filter_by(job_id=job.id))
+    budget = TokenBudget(options.get('token_budget') or 0, spent=spent)
+
+    stats = {'generated': 0, 'skipped': 0, 'over_budget': 0, 'failed': 0}
+    failed: List[int] = []
+
+    async def generate(semaphore: asyncio.Semaphore, tag_id: int):
+        tag, post = tags.get(tag_id), posts.get(tag_id)
+        if tag is None or (post and (post.job_id != job.id or post.status not in ('outline_generated', 'failed'))):
+            return tag_id, 'skipped', None
+        try:
+            await generate_batch_post(ai_service, tag, store, post=post, semaphore=semaphore, budget=budget, job_id=job.id)
+            return tag_id, 'generated', None
+        except TokenBudgetExceeded as e:
+            return tag_id, 'over_budget', e
+        except Exception as e:
+            return tag_id, 'failed', e
+
+    async def generate_all():
+        semaphore = asyncio.Semaphore(max(1, int(options.get('concurrency') or Config.BLOG_BATCH_CONCURRENCY or 8)))
+        # Tasks start (and reserve budget) in rank order; as_completed alone would not keep it
+        posts_in_flight = [asyncio.ensure_future(generate(semaphore, tag_id)) for tag_id in tag_ids]
+        for finished in asyncio.as_completed(posts_in_flight):
+            tag_id, outcome, error = await finished
+            if error:
+                print(f"Blog post for tag {tag_id} in job {job.id}: {outcome}: {error}")
+            if outcome == 'failed' and not context.final_attempt:
+                failed.append(tag_id)
+                continue
+            stats[outcome] += 1
+            await run_blocking(context.heartbeat, processed=1, failed=1 if outcome == 'failed' else 0)
+
+    context.run_ai(generate_all())
+    stats['tokens_used'] = budget.spent - spent
+    if failed:
+        stats['retry_items'] = failed
+    return stats
+
+
+# Task handlers by job type. A handler processes context.task and returns a dict of counters;
+# a 'retry_items' list in the result re-queues the task for just those items.
+TASK_HANDLERS: Dict[str, Callable[[TaskContext], Dict[str, Any]]] = {
+    'auto_tag': handle_auto_tag_task,
+    'create_collections': handle_create_collections_task,
+    'export_collections': handle_export_collections_task,
+    'import_products': handle_shopify_import_task,
+    'import_collections': handle_shopify_import_task,
+    'generate_blog_posts': handle_generate_blog_posts_task,
+}
+
+
+def _add_numbers(total: Dict[str, Any], values: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the numbers in `values` to `total`, recursing into nested dicts (e.g. the 'ai' telemetry summary)."""
+    for key, value in values.items():
+        if isinstance(value, dict):
+            _add_numbers(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def _merge_results(previous: Optional[Dict[str, Any]], result: Dict[str, Any]) -> Dict[str, Any]:
+    return _add_numbers(copy.deepcopy(previous or {}), result)
+
+
+def _retry_later(task: JobTask, error: Optional[str] = None) -> None:
+    delay = compute_backoff(task.attempts or 1, base_delay=15.0, max_delay=600.0)
+    task.status = 'pending'
+    task.lease_owner = None
+    task.lease_expires_at = None
+    task.available_at = datetime.utcnow() + timedelta(seconds=delay)
+    task.last_error = error
+    print(f"Retrying task {task.id} of job {task.job_id} in {delay:.0f}s (attempt {task.attempts}/{task.max_attempts})")
+
+
+def run_task(task: JobTask, worker_id: str, ai_service: Any) -> None:
+    """Run a leased task through its handler and record the outcome."""
+    job = db.session.get(Job, task.job_id)
+    if job.status == 'queued':
+        Job.query.filter_by(id=job.id, status='queued').update(
+            {Job.status: 'running', Job.started_at: datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        db.session.refresh(job)
+    # A retry after a failed or abandoned attempt: its items are about to be counted again
+    _take_back_progress(task)
+    db.session.commit()
+    handler = TASK_HANDLERS.get(job.job_type)
+    context = TaskContext(job, task, worker_id, ai_service)
+    try:
+        if handler is None:
+            raise ValueError(f"No handler for job type '{job.job_type}'")
+        with telemetry_scope() as ai_telemetry:
+            result = handler(context)
+    except LeaseLost as e:
+        print(f"Worker {worker_id}: {e}; leaving the task to its new owner")
+        db.session.rollback()
+        return
+    except Exception as e:
+        print(f"Error running task {task.id} of job {job.id}: {e}")
+        db.session.rollback()
+        task = db.session.get(JobTask, task.id)
+        _take_back_progress(task)
+        if handler is not None and task.attempts < task.max_attempts:
+            _retry_later(task, str(e))
+        else:
+            items = len(task.payload.get('items') or [])
+            task.status = 'failed'
+            task.last_error = str(e)
+            task.completed_at = datetime.utcnow()
+            record_job_progress(job.id, processed=items, failed=items)
+        db.session.commit()
+        _finish_job_if_done(job.id)
+        return
+
+    retry_items = result.pop('retry_items', None)
+    if ai_telemetry.series:
+        result['ai'] = ai_telemetry.summary()
+    task.result = _merge_results(task.result, result)
+    # The attempt finished: what it reported stands
+    task.payload = _without_reported(task.payload)
+    if retry_items:
+        task.payload = {**task.payload, 'items': retry_items}
+        _retry_later(task, f"{len(retry_items)} items failed")
+    else:
+        task.status = 'done'
+        task.lease_owner = None
+        task.completed_at = datetime.utcnow()
+    db.session.commit()
+    _finish_job_if_done(job.id)
+
+
+def run_next_task(worker_id: str, ai_service: Any) -> bool:
+    """Claim and run one task. Returns False when the queue had nothing to claim."""
+    task = claim_task(worker_id)
+    if task is None:
+        return False
+    if task.attempts > task.max_attempts:
+        # Lease expired on the last attempt (worker crashed mid-task): give up on it
+        _take_back_progress(task)
+        items = len(task.payload.get('items') or [])
+        task.status = 'failed'
+        task.last_error = task.last_error or 'Worker lease expired on the final attempt'
+        task.completed_at = datetime.utcnow()
+        record_job_progress(task.job_id, processed=items, failed=items)
+        db.session.commit()
+        _finish_job_if_done(task.job_id)
+        return True
+    print(f"Worker {worker_id} running task {task.id} of job {task.job_id} (attempt {task.attempts})")
+    run_task(task, worker_id, ai_service)
+    return True
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+def work(ai_service: Any = None, poll_seconds: Optional[float] = None, once: bool = False,
+         stop_event: Optional[threading.Event] = None) -> None:
+    """Worker loop: run tasks until the queue is empty (once=True) or forever. Needs an app context."""
+    if ai_service is None:
+        from ai_services import get_ai_service
+        ai_service = get_ai_service()
+    poll_seconds = float(poll_seconds or Config.JOB_POLL_SECONDS or 2)
+    worker_id = make_worker_id()
+    print(f"Job worker {worker_id} started")
+    while not (stop_event and stop_event.is_set()):
+        try:
+            ran = run_next_task(worker_id, ai_service)
+        except Exception as e:
+            # Database hiccups (e.g. a locked SQLite file) must not kill the worker
+            print(f"Job worker {worker_id} error: {e}")
+            db.session.rollback()
+            ran = False
+        finally:
+            # Don't hold on to identity-mapped rows between tasks
+            db.session.remove()
+        if not ran:
+            if once:
+                return
+            time.sleep(poll_seconds)
+
+
+_embedded_workers: List[threading.Thread] = []
+_embedded_lock = threading.Lock()
+
+
+def ensure_embedded_workers(app: Any, count: Optional[int] = None) -> None:
+    """Start worker threads inside this (web) process, once; JOB_EMBEDDED_WORKERS=0 disables them."""
+    count = int(count if count is not None else (Config.JOB_EMBEDDED_WORKERS or 0))
+    with _embedded_lock:
+        alive = [thread for thread in _embedded_workers if thread.is_alive()]
+        _embedded_workers[:] = alive
+        for index in range(len(alive), count):
+            def run():
+                with app.app_context():
+                    work()
+            thread = threading.Thread(target=run, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            _embedded_workers.append(thread)
+
+
+def _worker_process(poll_seconds: Optional[float], once: bool) -> None:
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        work(poll_seconds=poll_seconds, once=once)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to run")
+    parser.add_argument("--poll-seconds", type=float, default=None, help="Sleep between polls when the queue is empty")
+    parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        _worker_process(args.poll_seconds, args.once)
+        return
+    processes = [multiprocessing.Process(target=_worker_process, args=(args.poll_seconds, args.once), name=f"job-worker-{i}")
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("Stopping job workers")
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
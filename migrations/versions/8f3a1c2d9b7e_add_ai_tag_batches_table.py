@@ -0,0 +1,48 @@
+"""Add ai_tag_batches table for provider batch tagging jobs
+
+Revision ID: 8f3a1c2d9b7e
+Revises: 3dcd1fb07a00
+Create Date: 2026-10-19 09:12:41.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3a1c2d9b7e'
+down_revision = '3dcd1fb07a00'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ai_tag_batches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('store_id', sa.Integer(), nullable=True),
+        sa.Column('provider', sa.String(length=50), nullable=False),
+        sa.Column('model_name', sa.String(length=100), nullable=True),
+        sa.Column('batch_id', sa.String(length=255), nullable=False),
+        sa.Column('status', sa.String(length=50), nullable=False),
+        sa.Column('product_ids', sa.JSON(), nullable=False),
+        sa.Column('request_count', sa.Integer(), nullable=True),
+        sa.Column('succeeded_count', sa.Integer(), nullable=True),
+        sa.Column('errored_count', sa.Integer(), nullable=True),
+        sa.Column('applied_count', sa.Integer(), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['store_id'], ['stores.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('batch_id')
+    )
+    with op.batch_alter_table('ai_tag_batches', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_ai_tag_batches_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ai_tag_batches', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ai_tag_batches_status'))
+
+    op.drop_table('ai_tag_batches')
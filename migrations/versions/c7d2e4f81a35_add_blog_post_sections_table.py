@@ -0,0 +1,45 @@
+"""Add blog_post_sections table for resumable blog generation
+
+Revision ID: c7d2e4f81a35
+Revises: b41e7c9a2f10
+Create Date: 2026-10-19 16:21:08.301447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e4f81a35'
+down_revision = 'b41e7c9a2f10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blog_post_sections',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('heading', sa.String(length=255), nullable=True),
+        sa.Column('topic', sa.String(length=255), nullable=False),
+        sa.Column('prompt', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=50), nullable=False),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['post_id'], ['blog_posts.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('post_id', 'position', name='uq_blog_post_section_position')
+    )
+    with op.batch_alter_table('blog_post_sections', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_blog_post_sections_post_id'), ['post_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('blog_post_sections', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_blog_post_sections_post_id'))
+
+    op.drop_table('blog_post_sections')
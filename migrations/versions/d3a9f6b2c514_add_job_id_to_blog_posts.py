@@ -0,0 +1,30 @@
+"""Add job_id to blog_posts for batch blog generation
+
+Revision ID: d3a9f6b2c514
+Revises: c7d2e4f81a35
+Create Date: 2026-10-19 18:02:44.517203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a9f6b2c514'
+down_revision = 'c7d2e4f81a35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('job_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_blog_posts_job_id'), ['job_id'], unique=False)
+        batch_op.create_foreign_key('fk_blog_posts_job_id', 'jobs', ['job_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_blog_posts_job_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_blog_posts_job_id'))
+        batch_op.drop_column('job_id')
@@ -0,0 +1,26 @@
+"""Add compact_description to products for AI prompts
+
+Revision ID: e8b1c5a7d926
+Revises: d3a9f6b2c514
+Create Date: 2026-10-19 21:14:05.382641
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b1c5a7d926'
+down_revision = 'd3a9f6b2c514'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('compact_description', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_column('compact_description')
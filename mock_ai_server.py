@@ -0,0 +1,557 @@
+"""
+Local mock of the AI provider HTTP APIs used for offline benchmarks.
+
+Currently emulates the Anthropic Messages endpoint (POST /v1/messages, streamed as
+server-sent events when the body sets "stream": true), the
+Message Batches lifecycle (create, poll, JSONL results under /v1/messages/batches) and the
+OpenAI-compatible endpoints local model servers expose (POST /v1/chat/completions and
+/v1/completions, which takes a list of prompts unless disabled, like vLLM). Responses
+are deterministic and derived from the prompt, so tag, category and JSON prompts
+all get plausible answers. System blocks marked with cache_control are treated as
+a cacheable prefix and reported as cache creation/read tokens in usage. Latency,
+jitter, occasional slow tail calls and 429s (random, or whenever more than
+`max_concurrent` calls are in flight) are configurable.
+
+The server counts both requests and TCP connections, which makes connection
+reuse (or the lack of it) visible in benchmark output.
+
+Usage:
+    python mock_ai_server.py --port 8766 --latency-ms 300
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8766 python app.py
+    AI_PROVIDER=llama LLAMA_API_BASE_URL=http://127.0.0.1:8766/v1 python app.py
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from synthetic_catalog import PRODUCT_TYPES
+
+TAG_VOCABULARY = [
+    "everyday carry", "gift idea", "durable construction", "easy cleaning", "home essentials",
+    "outdoor adventures", "office upgrade", "minimalist design", "travel friendly", "premium finish",
+]
+
+
+class MockAIState:
+    """Behaviour knobs and counters shared by all mock handler threads."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate_limit_probability=0.0, max_concurrent=0,
+                 slow_probability=0.0, slow_factor=10.0, batch_processing_seconds=2.0,
+                 batch_error_probability=0.0, list_prompts=True, model_latency_factors=None, seed=None):
+        self.lock = threading.Lock()
+        self.latency_ms = latency_ms
+        # Latency multiplier for models whose name contains a key, e.g. {"haiku": 0.35} (smaller models answer faster)
+        self.model_latency_factors = model_latency_factors or {}
+        self.jitter_ms = jitter_ms
+        self.slow_probability = slow_probability
+        self.slow_factor = slow_factor
+        self.rate_limit_probability = rate_limit_probability
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.batch_processing_seconds = batch_processing_seconds
+        self.batch_error_probability = batch_error_probability
+        # Whether /v1/completions accepts a list of prompts (vLLM, llama.cpp) or only one (Ollama)
+        self.list_prompts = list_prompts
+        self.batches = {}
+        self.cached_prefixes = set()
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "connections": 0, "rate_limited": 0, "input_tokens": 0, "output_tokens": 0,
+                      "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0, "by_endpoint": {}}
+
+    def record(self, endpoint, input_tokens=0, output_tokens=0, cache_read_input_tokens=0, cache_creation_input_tokens=0):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["by_endpoint"][endpoint] = self.stats["by_endpoint"].get(endpoint, 0) + 1
+            self.stats["input_tokens"] += input_tokens
+            self.stats["output_tokens"] += output_tokens
+            self.stats["cache_read_input_tokens"] += cache_read_input_tokens
+            self.stats["cache_creation_input_tokens"] += cache_creation_input_tokens
+
+    def prompt_usage(self, system, user_text):
+        """
+        Emulate prompt caching: system blocks up to the last one marked with cache_control form
+        the cacheable prefix. Returns (input_tokens, cache_read_input_tokens, cache_creation_input_tokens).
+        """
+        blocks = system if isinstance(system, list) else ([{"type": "text", "text": system}] if system else [])
+        marked = [i for i, block in enumerate(blocks) if isinstance(block, dict) and block.get("cache_control")]
+        prefix_blocks = blocks[:marked[-1] + 1] if marked else []
+        prefix_text = "\n".join(block.get("text", "") for block in prefix_blocks)
+        rest_text = "\n".join(block.get("text", "") for block in blocks[len(prefix_blocks):] if isinstance(block, dict))
+        uncached = estimate_tokens(rest_text + user_text)
+        if not prefix_blocks:
+            return uncached, 0, 0
+        prefix_tokens = estimate_tokens(prefix_text)
+        with self.lock:
+            if prefix_text in self.cached_prefixes:
+                return uncached, prefix_tokens, 0
+            self.cached_prefixes.add(prefix_text)
+        return uncached, 0, prefix_tokens
+
+    def should_rate_limit(self):
+        with self.lock:
+            limited = bool(self.max_concurrent and self.in_flight >= self.max_concurrent)
+            if not limited and self.rate_limit_probability:
+                limited = self.rng.random() < self.rate_limit_probability
+            if limited:
+                self.stats["rate_limited"] += 1
+            return limited
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def exit(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def model_factor(self, model):
+        return next((factor for marker, factor in self.model_latency_factors.items() if marker in (model or "")), 1.0)
+
+    def sleep_latency(self, model=None):
+        if self.latency_ms <= 0 and self.jitter_ms <= 0:
+            return
+        with self.lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            factor = self.slow_factor if self.slow_probability and self.rng.random() < self.slow_probability else 1.0
+        time.sleep(max(0.0, self.latency_ms + jitter) * factor * self.model_factor(model) / 1000.0)
+
+    def reset(self):
+        with self.lock:
+            self.batches.clear()
+            self.cached_prefixes.clear()
+            for key in self.stats:
+                self.stats[key] = {} if isinstance(self.stats[key], dict) else 0
+
+
+def estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token), good enough for accounting."""
+    return max(1, len(text) // 4)
+
+
+def _flatten_content(content):
+    """Messages API content can be a string or a list of blocks; return plain text."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return ""
+
+
+def _fake_tags(title):
+    words = [w for w in re.findall(r"[a-z]+", title.lower()) if len(w) > 2]
+    pairs = [" ".join(words[i:i + 2]) for i in range(len(words) - 1)]
+    seed = sum(map(ord, title))
+    extras = [TAG_VOCABULARY[(seed + i) % len(TAG_VOCABULARY)] for i in range(3)]
+    return ", ".join(pairs + extras)
+
+
+def _fake_category(title):
+    """The product type of a synthetic catalog title (what a model would call its category), else its last two words."""
+    lowered = title.lower()
+    known = [product_type for product_type, _ in PRODUCT_TYPES if product_type in lowered]
+    if known:
+        return max(known, key=len)
+    words = [w for w in re.findall(r"[a-z]+", lowered) if len(w) > 2]
+    return " ".join(words[-2:]) if len(words) >= 2 else "general goods"
+
+
+def _packed_products(prompt):
+    """Return the product list of a packed (multi-product) prompt, or None."""
+    match = re.search(r"Products \(JSON[^\n]*\n(\[.*?\n\])", prompt, re.S)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+
+def fake_completion(prompt):
+    """Produce a deterministic, prompt-appropriate answer."""
+    packed = _packed_products(prompt)
+    if packed is not None:
+        return json.dumps({str(item.get("id")): _fake_tags(item.get("title", "")) for item in packed})
+    title_match = re.search(r"Product Title:\s*(.+)", prompt)
+    lowered = prompt.lower()
+    if "outline" in lowered and "json list" in lowered:
+        topic = re.search(r"(?:blog post about|Topic:) '([^']+)'", prompt)
+        topic = topic.group(1).title() if topic else "The Topic"
+        return json.dumps([f"Why {topic} Matters", f"Choosing {topic}", f"Caring for {topic}", f"Styling {topic}"])
+    if "json" in lowered and "core_concepts" in lowered:
+        return json.dumps({
+            "core_concepts": ["sample concept", "store theme"],
+            "related_topics": ["related topic one", "related topic two"],
+            "long_tail_keywords": ["best sample products online", "where to buy sample items"],
+            "audience_descriptors": ["online shoppers"],
+        })
+    if title_match:
+        if "category" in lowered and "tags" in lowered and "primary" in lowered:
+            return _fake_category(title_match.group(1))
+        return _fake_tags(title_match.group(1))
+    section = re.search(r"(?:section titled|Section:) '([^']+)'|Write an? \w+ (introduction|conclusion)", prompt)
+    if section:
+        topic = section.group(1) or section.group(2)
+        return (f"<p>Mock content about {topic}. It explains what matters most, compares a few options and "
+                f"closes with practical advice, so streamed output arrives as many small deltas.</p>")
+    return "<p>Mock generated content.</p>"
+
+
+class MockAIHandler(BaseHTTPRequestHandler):
+    """Request handler; `server.state` holds the MockAIState."""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def setup(self):
+        super().setup()
+        with self.server.state.lock:
+            self.server.state.stats["connections"] += 1
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            # The client hung up mid-request, e.g. a hedged call that lost the race was cancelled
+            pass
+
+    def log_message(self, format, *args):
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self._read_body()
+        if path == "/__mock__/stats":
+            with self.state.lock:
+                payload = json.loads(json.dumps(self.state.stats))
+            self._send_json(200, payload)
+            return
+        batch_match = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", path)
+        if batch_match:
+            if batch_match.group(2):
+                self.batch_results(batch_match.group(1))
+            else:
+                self.get_batch(batch_match.group(1))
+            return
+        self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": "Not found"}})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body() or {}
+        if path == "/__mock__/reset":
+            self.state.reset()
+            self._send_json(200, {"ok": True})
+            return
+        if path == "/v1/messages":
+            self.create_message(body)
+            return
+        if path == "/v1/messages/batches":
+            self.create_batch(body)
+            return
+        if path == "/v1/chat/completions":
+            self.create_chat_completion(body)
+            return
+        if path == "/v1/completions":
+            self.create_completion(body)
+            return
+        self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": "Not found"}})
+
+    # --- Helpers ---
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return None
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_rate_limited(self):
+        self._send_json(429, {"type": "error", "error": {"type": "rate_limit_error", "message": "Number of requests has exceeded your rate limit"}},
+                        headers={"retry-after": "1"})
+
+    # --- Anthropic Messages API ---
+
+    def create_message(self, body):
+        if self.state.should_rate_limit():
+            self._send_rate_limited()
+            return
+        if body.get("stream"):
+            self.stream_message(body)
+            return
+        self.state.enter()
+        try:
+            self.state.sleep_latency(body.get("model"))
+        finally:
+            self.state.exit()
+        system_text = _flatten_content(body.get("system"))
+        user_text = "\n".join(_flatten_content(m.get("content")) for m in body.get("messages", []))
+        text = fake_completion(f"{system_text}\n{user_text}")
+        input_tokens, cache_read, cache_creation = self.state.prompt_usage(body.get("system"), user_text)
+        output_tokens = estimate_tokens(text)
+        self.state.record("messages", input_tokens, output_tokens, cache_read, cache_creation)
+        self._send_json(200, {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "mock-model"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                      "cache_read_input_tokens": cache_read, "cache_creation_input_tokens": cache_creation},
+        })
+
+    def _send_event(self, event, payload):
+        data = f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode()
+        # Chunked transfer encoding, one chunk per event
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def stream_message(self, body):
+        """Messages API streaming: the configured latency is spread over the text deltas."""
+        system_text = _flatten_content(body.get("system"))
+        user_text = "\n".join(_flatten_content(m.get("content")) for m in body.get("messages", []))
+        text = fake_completion(f"{system_text}\n{user_text}")
+        input_tokens, cache_read, cache_creation = self.state.prompt_usage(body.get("system"), user_text)
+        output_tokens = estimate_tokens(text)
+        self.state.record("messages", input_tokens, output_tokens, cache_read, cache_creation)
+        deltas = re.findall(r"\S+\s*", text) or [text]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._send_event("message_start", {"type": "message_start", "message": {
+            "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant",
+            "model": body.get("model", "mock-model"), "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 1,
+                      "cache_read_input_tokens": cache_read, "cache_creation_input_tokens": cache_creation}}})
+        self._send_event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        self.state.enter()
+        try:
+            delay = self.state.latency_ms * self.state.model_factor(body.get("model")) / 1000.0 / len(deltas)
+            for delta in deltas:
+                time.sleep(delay)
+                self._send_event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                         "delta": {"type": "text_delta", "text": delta}})
+        finally:
+            self.state.exit()
+        self._send_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        self._send_event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                           "usage": {"output_tokens": output_tokens}})
+        self._send_event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # --- OpenAI-compatible API (local model servers) ---
+
+    def _wait_for_completion(self, model=None):
+        """Rate limit or sleep like a real call. Returns False if a 429 was sent."""
+        if self.state.should_rate_limit():
+            self._send_json(429, {"error": {"message": "Too many requests", "type": "rate_limit_error"}}, headers={"retry-after": "1"})
+            return False
+        self.state.enter()
+        try:
+            self.state.sleep_latency(model)
+        finally:
+            self.state.exit()
+        return True
+
+    def create_chat_completion(self, body):
+        if not self._wait_for_completion(body.get("model")):
+            return
+        prompt = "\n".join(_flatten_content(m.get("content")) for m in body.get("messages", []))
+        text = fake_completion(prompt)
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        self.state.record("chat_completions", input_tokens, output_tokens)
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock-model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": input_tokens, "completion_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+        })
+
+    def create_completion(self, body):
+        prompts = body.get("prompt")
+        if isinstance(prompts, list) and not self.state.list_prompts:
+            self._send_json(400, {"error": {"message": "prompt must be a string", "type": "invalid_request_error"}})
+            return
+        prompts = prompts if isinstance(prompts, list) else [prompts or ""]
+        # A batched request costs one round of latency: the server runs the prompts together
+        if not self._wait_for_completion(body.get("model")):
+            return
+        choices = []
+        input_tokens = output_tokens = 0
+        for index, prompt in enumerate(prompts):
+            text = fake_completion(prompt)
+            input_tokens += estimate_tokens(prompt)
+            output_tokens += estimate_tokens(text)
+            choices.append({"index": index, "text": text, "finish_reason": "stop"})
+        self.state.record("completions", input_tokens, output_tokens)
+        self._send_json(200, {
+            "id": f"cmpl-{uuid.uuid4().hex[:24]}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock-model"),
+            "choices": choices,
+            "usage": {"prompt_tokens": input_tokens, "completion_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+        })
+
+    # --- Anthropic Message Batches API ---
+
+    def _batch_payload(self, batch):
+        ended = time.time() >= batch["ends_at"]
+        succeeded = sum(1 for r in batch["results"] if r["result"]["type"] == "succeeded")
+        total = len(batch["results"])
+        host = self.headers.get("Host", "127.0.0.1")
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": succeeded if ended else 0,
+                "errored": total - succeeded if ended else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": batch["created_at"],
+            "ended_at": batch["ends_at"] if ended else None,
+            "results_url": f"http://{host}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+    def create_batch(self, body):
+        if self.state.should_rate_limit():
+            self._send_rate_limited()
+            return
+        results = []
+        for item in body.get("requests", []):
+            params = item.get("params", {})
+            with self.state.lock:
+                failed = bool(self.state.batch_error_probability) and self.state.rng.random() < self.state.batch_error_probability
+            if failed:
+                results.append({"custom_id": item.get("custom_id"),
+                                "result": {"type": "errored", "error": {"type": "api_error", "message": "Internal server error"}}})
+                continue
+            system_text = _flatten_content(params.get("system"))
+            user_text = "\n".join(_flatten_content(m.get("content")) for m in params.get("messages", []))
+            text = fake_completion(f"{system_text}\n{user_text}")
+            input_tokens, cache_read, cache_creation = self.state.prompt_usage(params.get("system"), user_text)
+            output_tokens = estimate_tokens(text)
+            self.state.record("batch_requests", input_tokens, output_tokens, cache_read, cache_creation)
+            results.append({"custom_id": item.get("custom_id"), "result": {"type": "succeeded", "message": {
+                "id": f"msg_{uuid.uuid4().hex[:24]}",
+                "type": "message",
+                "role": "assistant",
+                "model": params.get("model", "mock-model"),
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                          "cache_read_input_tokens": cache_read, "cache_creation_input_tokens": cache_creation},
+            }}})
+        now = time.time()
+        batch = {"id": f"msgbatch_{uuid.uuid4().hex[:24]}", "created_at": now,
+                 "ends_at": now + self.state.batch_processing_seconds, "results": results}
+        with self.state.lock:
+            self.state.batches[batch["id"]] = batch
+        self.state.record("batches")
+        self._send_json(200, self._batch_payload(batch))
+
+    def get_batch(self, batch_id):
+        batch = self.state.batches.get(batch_id)
+        if batch is None:
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": "Batch not found"}})
+            return
+        self._send_json(200, self._batch_payload(batch))
+
+    def batch_results(self, batch_id):
+        batch = self.state.batches.get(batch_id)
+        if batch is None or time.time() < batch["ends_at"]:
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": "Results not available"}})
+            return
+        data = "".join(json.dumps(result) + "\n" for result in batch["results"]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-jsonl")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(state, host="127.0.0.1", port=0, verbose=False):
+    """
+    Start the mock provider on a daemon thread.
+
+    Returns:
+        (server, base_url). Call server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), MockAIHandler)
+    server.daemon_threads = True
+    server.state = state
+    server.verbose = verbose
+    thread = threading.Thread(target=server.serve_forever, name="mock-ai", daemon=True)
+    thread.start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, f"http://{bound_host}:{bound_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock AI provider API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Latency added to every completion")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter applied to the latency")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="Probability of a 429 per call")
+    parser.add_argument("--slow-probability", type=float, default=0.0, help="Probability that a call is a slow tail call")
+    parser.add_argument("--slow-factor", type=float, default=10.0, help="Latency multiplier for slow tail calls")
+    parser.add_argument("--batch-seconds", type=float, default=2.0, help="Time until a message batch ends")
+    parser.add_argument("--batch-error-probability", type=float, default=0.0, help="Probability that a batch request errors")
+    parser.add_argument("--no-list-prompts", action="store_true", help="Reject prompt lists on /v1/completions (like Ollama)")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="Return 429 above this many in-flight calls (0 = unlimited)")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    state = MockAIState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                        rate_limit_probability=args.rate_limit_probability, max_concurrent=args.max_concurrent,
+                        slow_probability=args.slow_probability, slow_factor=args.slow_factor,
+                        batch_processing_seconds=args.batch_seconds, batch_error_probability=args.batch_error_probability,
+                        list_prompts=not args.no_list_prompts)
+    server = ThreadingHTTPServer((args.host, args.port), MockAIHandler)
+    server.daemon_threads = True
+    server.state = state
+    server.verbose = args.verbose
+    print(f"Mock AI provider listening on http://{args.host}:{args.port}")
+    print(f"Stats: http://{args.host}:{args.port}/__mock__/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down mock AI server")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from sqlalchemy import JSON # Import JSON type
+from sqlalchemy.orm import validates
 
 db = SQLAlchemy()
 
@@ -89,6 +90,9 @@ class Product(db.Model, SEOFields): # Added SEOFields mixin
     title = db.Column(db.String(255), nullable=False)
     cleaned_title = db.Column(db.String(255))
     description = db.Column(db.Text)
+    # Plain-text description for AI prompts (HTML and store boilerplate removed); None until computed
+    # by product_descriptions.refresh_compact_descriptions and whenever description changes
+    compact_description = db.Column(db.Text, nullable=True)
     price = db.Column(db.Float)
     image_url = db.Column(db.String(500))
     shopify_id = db.Column(db.String(100))  # Shopify product ID for syncing
@@ -102,6 +106,12 @@ class Product(db.Model, SEOFields): # Added SEOFields mixin
     tags = db.relationship('Tag', secondary=product_tags, lazy='subquery',
                           backref=db.backref('products', lazy=True))
     
+    @validates('description')
+    def _invalidate_compact_description(self, key, description):
+        if description != self.description:
+            self.compact_description = None
+        return description
+
     def __repr__(self):
         return f'<Product {self.title}>'
     
@@ -286,6 +296,14 @@ class BlogPost(db.Model, SEOFields):
     source_tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), nullable=True) # Nullable if a post can be created manually
     source_tag = db.relationship('Tag', backref=db.backref('generated_blog_posts', lazy=True))
 
+    # Set for posts generated by a batch job (generate_blog_posts), which reports their status
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'), nullable=True, index=True)
+    job = db.relationship('Job', backref=db.backref('blog_posts', lazy=True))
+
+    # Generated one content block at a time; see blog_generation.py for the status flow
+    sections = db.relationship('BlogPostSection', backref='post', lazy=True, cascade="all, delete-orphan",
+                               order_by='BlogPostSection.position')
+
     def __repr__(self):
         return f'<BlogPost {self.id}: {self.title[:50]}... ({self.status})>'
 
@@ -308,3 +326,149 @@ class BlogPost(db.Model, SEOFields):
         }
         base_dict.update(seo_dict)
         return base_dict
+
+# --- AI Tag Batch Model ---
+class AITagBatch(db.Model):
+    """An offline tagging job submitted through a provider batch API (e.g. Claude Message Batches)."""
+    __tablename__ = 'ai_tag_batches'
+
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=True)
+    provider = db.Column(db.String(50), nullable=False)
+    model_name = db.Column(db.String(100), nullable=True)
+    batch_id = db.Column(db.String(255), nullable=False, unique=True) # Provider-side batch identifier
+    status = db.Column(db.String(50), nullable=False, default='in_progress', index=True) # 'in_progress', 'ended', 'applied', 'failed'
+    product_ids = db.Column(JSON, nullable=False) # Products included in the batch
+    request_count = db.Column(db.Integer, default=0)
+    succeeded_count = db.Column(db.Integer, default=0)
+    errored_count = db.Column(db.Integer, default=0)
+    applied_count = db.Column(db.Integer, default=0) # Products that received at least one new tag
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    store = db.relationship('Store', backref=db.backref('ai_tag_batches', lazy=True))
+
+    def __repr__(self):
+        return f'<AITagBatch {self.batch_id} ({self.status})>'
+
+# --- Blog Post Section Model ---
+class BlogPostSection(db.Model):
+    """
+    One generated content block of a blog post (introduction, an outline section or the
+    conclusion). Blocks are generated and saved independently, so a failed generation can
+    be resumed by regenerating only the blocks that are not 'done'.
+    """
+    __tablename__ = 'blog_post_sections'
+    __table_args__ = (
+        db.UniqueConstraint('post_id', 'position', name='uq_blog_post_section_position'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('blog_posts.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False) # Reading order within the post
+    heading = db.Column(db.String(255), nullable=True) # Markdown heading; None for the introduction
+    topic = db.Column(db.String(255), nullable=False) # Section topic sent to the AI
+    prompt = db.Column(db.Text, nullable=False) # Section instruction (the shared context is rebuilt per run)
+    status = db.Column(db.String(50), nullable=False, default='pending') # 'pending', 'generating', 'done', 'failed'
+    content = db.Column(db.Text, nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<BlogPostSection {self.position} of post {self.post_id} ({self.status})>'
+
+
+# --- Background Job Queue Models ---
+class Job(db.Model):
+    """A unit of background work (e.g. auto-tagging a selection of products), split into leased tasks."""
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=True)
+    job_type = db.Column(db.String(50), nullable=False) # e.g. 'auto_tag'
+    status = db.Column(db.String(50), nullable=False, default='queued', index=True) # 'queued', 'running', 'completed', 'failed'
+    options = db.Column(JSON, nullable=True) # Job parameters shared by all of its tasks
+    total_items = db.Column(db.Integer, default=0) # e.g. products to tag
+    processed_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    result = db.Column(JSON, nullable=True) # Summary counters (tags added, products exported, ...)
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    store = db.relationship('Store', backref=db.backref('jobs', lazy=True))
+    tasks = db.relationship('JobTask', backref='job', lazy=True, cascade="all, delete-orphan")
+
+    @property
+    def is_active(self):
+        return self.status in ('queued', 'running')
+
+    def progress(self):
+        """
+        Progress snapshot for the UI: counters, percent done, throughput (items/s) and ETA
+        (seconds), plus each post's status for blog batch jobs.
+        """
+        total = self.total_items or 0
+        processed = self.processed_count or 0
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = ((self.completed_at or datetime.utcnow()) - self.started_at).total_seconds()
+        throughput = processed / elapsed if elapsed > 0 else 0.0
+        eta_seconds = None
+        if self.is_active and throughput > 0 and total > processed:
+            eta_seconds = round((total - processed) / throughput)
+        progress = {
+            'id': self.id,
+            'job_type': self.job_type,
+            'label': self.job_type.replace('_', ' ').title(),
+            'status': self.status,
+            'total': total,
+            'processed': processed,
+            'failed': self.failed_count or 0,
+            'percent': min(100, round(100 * processed / total)) if total else (100 if not self.is_active else 0),
+            'throughput': round(throughput, 2),
+            'eta_seconds': eta_seconds,
+            'elapsed_seconds': round(elapsed),
+            'result': self.result or {},
+            'error_message': self.error_message,
+        }
+        if self.job_type == 'generate_blog_posts':
+            # Per-post status, so the progress bar can list each post as it moves to draft or failed
+            progress['posts'] = [{'id': post.id, 'tag': post.source_tag.name if post.source_tag else None,
+                                  'status': post.status} for post in sorted(self.blog_posts, key=lambda post: post.id)]
+        return progress
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.job_type} ({self.status})>'
+
+
+class JobTask(db.Model):
+    """
+    A chunk of a job that one worker processes at a time. A worker claims a task by taking
+    a lease; tasks whose lease expired (crashed or stuck worker) are claimed again.
+    """
+    __tablename__ = 'job_tasks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'), nullable=False, index=True)
+    status = db.Column(db.String(50), nullable=False, default='pending', index=True) # 'pending', 'leased', 'done', 'failed'
+    payload = db.Column(JSON, nullable=False) # e.g. {"items": [...]}, plus "reported" progress of a running attempt
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow) # Not claimed before this time (retry backoff)
+    lease_owner = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    result = db.Column(JSON, nullable=True) # Counters from the handler, summed into Job.result when the job ends
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<JobTask {self.id} of job {self.job_id} ({self.status})>'
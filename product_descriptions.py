@@ -0,0 +1,80 @@
+"""
+Compacted product descriptions for AI prompts (products.compact_description).
+
+Tagging and categorization prompts used to carry the raw Shopify body_html: markup,
+inline styles and the store's shipping/returns footer, on every call. The compacted
+text (see ai_services/text_compaction.py) is computed once and stored; setting a
+product's description clears it, and refresh_compact_descriptions() fills it in again
+right before the product is next sent to the AI. The per-task token budget is applied
+when the prompt is built, so changing a budget doesn't require recomputing anything.
+
+Boilerplate is detected per store from a sample of its most recent descriptions.
+Recompute a store's descriptions (e.g. after changing its theme footer) with:
+    python product_descriptions.py --store-id 1
+"""
+
+import argparse
+from typing import Dict, FrozenSet, List, Optional
+
+from ai_services.text_compaction import compact_description, find_boilerplate
+from models import db, Product
+
+# Descriptions sampled per store for boilerplate detection; boilerplate is in most of them by definition
+BOILERPLATE_SAMPLE_SIZE = 1000
+
+
+def store_boilerplate(store_id: Optional[int]) -> FrozenSet[str]:
+    """Boilerplate sentence keys of a store, from its most recent product descriptions."""
+    rows = (db.session.query(Product.description).filter(Product.store_id == store_id)
+            .order_by(Product.id.desc()).limit(BOILERPLATE_SAMPLE_SIZE).all())
+    return find_boilerplate(description for description, in rows)
+
+
+def refresh_compact_descriptions(products: List[Product], force: bool = False) -> int:
+    """
+    Compute compact_description for the products that don't have one (all of them with
+    force=True). Returns how many were computed; the caller commits.
+    """
+    pending = [product for product in products if force or product.compact_description is None]
+    boilerplate: Dict[Optional[int], FrozenSet[str]] = {}
+    for product in pending:
+        if product.store_id not in boilerplate:
+            boilerplate[product.store_id] = store_boilerplate(product.store_id)
+        product.compact_description = compact_description(product.description, boilerplate[product.store_id])
+    return len(pending)
+
+
+def refresh_store_compact_descriptions(store_id: Optional[int], batch_size: int = 500) -> int:
+    """Recompute compact_description for every product of a store, committing in batches."""
+    boilerplate = store_boilerplate(store_id)
+    refreshed = 0
+    last_id = 0
+    while True:
+        batch = (Product.query.filter(Product.store_id == store_id, Product.id > last_id)
+                 .order_by(Product.id).limit(batch_size).all())
+        if not batch:
+            return refreshed
+        for product in batch:
+            product.compact_description = compact_description(product.description, boilerplate)
+        db.session.commit()
+        refreshed += len(batch)
+        last_id = batch[-1].id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the compacted product descriptions sent to the AI.")
+    parser.add_argument("--store-id", type=int, default=None, help="Only this store (default: every store)")
+    args = parser.parse_args()
+
+    from app import create_app
+    from models import Store
+
+    app = create_app()
+    with app.app_context():
+        store_ids = [args.store_id] if args.store_id else [store.id for store in Store.query.all()]
+        for store_id in store_ids:
+            print(f"Store {store_id}: {refresh_store_compact_descriptions(store_id)} descriptions compacted")
+
+
+if __name__ == "__main__":
+    main()
@@ -326,8 +326,12 @@ class ShopifyIntegration:
         
         return {'products': all_products}
     
-    def import_products_from_shopify(self, db, current_store=None): # Keep current_store for association
-        """Import products from Shopify to the local database."""
+    def import_products_from_shopify(self, db, current_store=None, progress=None): # Keep current_store for association
+        """
+        Import products from Shopify to the local database.
+
+        progress, if given, is called as progress(done, total) as products are imported.
+        """
         # is_configured() now checks the context set by set_store_context
         if not self.is_configured():
             error_msg = 'Shopify integration not configured for the selected store.'
@@ -362,7 +366,10 @@ class ShopifyIntegration:
             normalized_url = normalize_url(self.store_url)
             store = Store.query.filter_by(url=normalized_url).first()
         
-        for shopify_product in products:
+        if progress:
+            progress(0, len(products))
+        
+        for index, shopify_product in enumerate(products, start=1):
             # Check if product already exists in database
             existing_product = Product.query.filter_by(shopify_id=str(shopify_product['id'])).first()
             
@@ -435,8 +442,13 @@ class ShopifyIntegration:
                 
                 db.session.add(new_product)
                 imported_count += 1
+            
+            if progress and index % 50 == 0:
+                progress(index, len(products))
         
         db.session.commit()
+        if progress:
+            progress(len(products), len(products))
         
         return {
             'success': True,
@@ -573,8 +585,12 @@ class ShopifyIntegration:
         
         return result
     
-    def import_collections_from_shopify(self, db, current_store=None): # Keep current_store for association
-        """Import collections from Shopify to the local database."""
+    def import_collections_from_shopify(self, db, current_store=None, progress=None): # Keep current_store for association
+        """
+        Import collections from Shopify to the local database.
+
+        progress, if given, is called as progress(done, total) as each collection's products are fetched.
+        """
         # is_configured() now checks the context set by set_store_context
         if not self.is_configured():
             error_msg = 'Shopify integration not configured for the selected store.'
@@ -656,10 +672,14 @@ class ShopifyIntegration:
                 imported_count += 1
         
         db.session.commit()
+        if progress:
+            progress(0, len(collections))
         
         # Now fetch products for each collection
-        for shopify_collection in collections:
+        for index, shopify_collection in enumerate(collections, start=1):
             collection_id = str(shopify_collection.get('id'))
+            if progress and index > 1:
+                progress(index - 1, len(collections))
             
             # Get the local collection
             local_collection = Collection.query.filter_by(shopify_id=collection_id).first()
@@ -691,6 +711,9 @@ class ShopifyIntegration:
             except requests.exceptions.RequestException as e:
                 print(f"Error fetching products for collection {collection_id}: {str(e)}")
         
+        if progress:
+            progress(len(collections), len(collections))
+        
         return {
             'success': True,
             'imported': imported_count,
@@ -0,0 +1,212 @@
+"""
+Synthetic Shopify catalog generator.
+
+Builds a deterministic catalog of products, custom collections, smart collections
+and collects shaped like Shopify Admin API (2023-07) payloads. Used to seed the
+local fake Admin API (fake_shopify_server.py) and the offline benchmarks.
+
+Usage:
+    python synthetic_catalog.py --products 1000 --seed 42 > catalog.json
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+
+# Building blocks for product titles. Combined they give plenty of distinct,
+# realistic-looking products while still producing the families of near-identical
+# variants (same item in several colors/sizes) that real catalogs are full of.
+MATERIALS = [
+    "cotton", "organic cotton", "linen", "wool", "merino wool", "leather", "vegan leather",
+    "stainless steel", "bamboo", "ceramic", "glass", "oak", "walnut", "recycled plastic",
+    "silicone", "canvas", "denim", "cast iron", "copper", "marble",
+]
+PRODUCT_TYPES = [
+    ("t-shirt", "Apparel"), ("hoodie", "Apparel"), ("beanie", "Accessories"), ("tote bag", "Bags"),
+    ("backpack", "Bags"), ("coffee mug", "Kitchen"), ("water bottle", "Kitchen"), ("chef knife", "Kitchen"),
+    ("cutting board", "Kitchen"), ("desk lamp", "Home Office"), ("notebook", "Stationery"),
+    ("phone case", "Electronics"), ("bluetooth speaker", "Electronics"), ("yoga mat", "Fitness"),
+    ("dumbbell set", "Fitness"), ("dog collar", "Pets"), ("cat bed", "Pets"), ("throw blanket", "Home"),
+    ("scented candle", "Home"), ("plant pot", "Garden"),
+]
+STYLES = [
+    "classic", "minimalist", "vintage", "modern", "rustic", "premium", "lightweight", "heavy duty",
+    "handmade", "travel", "eco friendly", "oversized", "slim fit", "insulated",
+]
+COLORS = ["black", "white", "navy", "olive", "sand", "charcoal", "red", "sky blue", "forest green", "mustard", "blush", "grey"]
+SIZES = ["XS", "S", "M", "L", "XL", "XXL"]
+VENDORS = ["Northwind Goods", "Acme Supply Co", "Blue Fern Studio", "Harbor & Pine", "Kettle Works"]
+AUDIENCES = ["outdoor enthusiasts", "busy professionals", "students", "home cooks", "pet owners", "new parents", "travelers"]
+FEATURES = [
+    "machine washable", "dishwasher safe", "water resistant", "double stitched seams", "ergonomic grip",
+    "non slip base", "BPA free", "lifetime warranty", "ethically sourced materials", "fits 15 inch laptops",
+    "keeps drinks cold for 24 hours", "reinforced handles", "adjustable strap", "gift ready packaging",
+]
+
+# Store-wide boilerplate appended to every description, like the shipping and
+# returns footers most Shopify themes bake into body_html.
+BOILERPLATE_HTML = (
+    '<div class="shipping-info" style="margin-top:12px;font-size:12px;color:#666">'
+    "<p><strong>Free shipping</strong> on orders over $50. Easy 30-day returns.</p>"
+    "<p>Questions? Contact our support team, we reply within 24 hours.</p></div>"
+)
+
+BASE_PRODUCT_ID = 7000000000000
+BASE_VARIANT_ID = 42000000000000
+BASE_COLLECTION_ID = 400000000000
+BASE_COLLECT_ID = 30000000000000
+
+
+def _handleize(text):
+    """Convert a title into a Shopify-style handle."""
+    return "-".join("".join(ch if ch.isalnum() else " " for ch in text.lower()).split())
+
+
+def _product_description(title, material, product_type, style, features, audience):
+    """Build a body_html description with markup, inline styles and boilerplate."""
+    return (
+        f'<p style="font-family:Helvetica,Arial,sans-serif">Meet the <strong>{title}</strong>, '
+        f"a {style} {product_type} made from {material}, designed for {audience}.</p>"
+        "<ul>" + "".join(f"<li>{feature.capitalize()}</li>" for feature in features) + "</ul>"
+        f"<p>Pairs well with the rest of our {material} range.</p>"
+        + BOILERPLATE_HTML
+    )
+
+
+def generate_catalog(num_products=1000, num_custom_collections=20, num_smart_collections=10,
+                     max_variants_per_family=6, seed=42):
+    """
+    Generate a synthetic Shopify catalog.
+
+    Products are generated in families: each family is one base item imported as
+    several separate products that differ only by color, which mirrors how many
+    merchants import variants.
+
+    Returns:
+        A dict with 'products', 'custom_collections', 'smart_collections' and
+        'collects' lists, each in Admin API JSON shape.
+    """
+    rng = random.Random(seed)
+    created_base = datetime(2024, 1, 1)
+
+    products = []
+    while len(products) < num_products:
+        material = rng.choice(MATERIALS)
+        product_type, category = rng.choice(PRODUCT_TYPES)
+        style = rng.choice(STYLES)
+        vendor = rng.choice(VENDORS)
+        base_price = round(rng.uniform(8, 180), 2)
+        family_size = rng.randint(1, max_variants_per_family)
+        colors = rng.sample(COLORS, k=min(family_size, len(COLORS)))
+        # Variants of a family share their copy; only the title (color) differs
+        features = rng.sample(FEATURES, k=3)
+        audience = rng.choice(AUDIENCES)
+
+        for color in colors:
+            if len(products) >= num_products:
+                break
+            index = len(products)
+            title = f"{style.title()} {material.title()} {product_type.title()} - {color.title()}"
+            product_id = BASE_PRODUCT_ID + index
+            created_at = created_base + timedelta(minutes=17 * index)
+            sizes = SIZES if category == "Apparel" else ["Default Title"]
+            variants = [
+                {
+                    "id": BASE_VARIANT_ID + index * 10 + position,
+                    "product_id": product_id,
+                    "title": size,
+                    "price": f"{base_price:.2f}",
+                    "sku": f"SKU-{index:06d}-{position}",
+                    "position": position + 1,
+                }
+                for position, size in enumerate(sizes)
+            ]
+            products.append({
+                "id": product_id,
+                "title": title,
+                "body_html": _product_description(title, material, product_type, style, features, audience),
+                "vendor": vendor,
+                "product_type": category,
+                "handle": _handleize(title),
+                "tags": ", ".join([category.lower(), material, color]),
+                "status": "active",
+                "variants": variants,
+                "images": [{
+                    "id": product_id + 1,
+                    "product_id": product_id,
+                    "src": f"https://cdn.example.com/products/{_handleize(title)}.jpg",
+                }],
+                "created_at": created_at.isoformat() + "Z",
+                "updated_at": created_at.isoformat() + "Z",
+            })
+
+    custom_collections = []
+    collects = []
+    for index in range(num_custom_collections):
+        collection_id = BASE_COLLECTION_ID + index
+        material = MATERIALS[index % len(MATERIALS)]
+        title = f"{material.title()} Favorites"
+        if index >= len(MATERIALS):
+            title = f"{title} {index // len(MATERIALS) + 1}"
+        custom_collections.append({
+            "id": collection_id,
+            "title": title,
+            "handle": _handleize(title),
+            "body_html": f"<p>Our favorite {material} pieces, hand picked by the team.</p>",
+            "published_at": created_base.isoformat() + "Z",
+            "sort_order": "best-selling",
+        })
+        members = [p for p in products if material in p["tags"]]
+        for product in members[:rng.randint(5, 60)]:
+            collects.append({
+                "id": BASE_COLLECT_ID + len(collects),
+                "collection_id": collection_id,
+                "product_id": product["id"],
+                "position": len(collects) + 1,
+            })
+
+    smart_collections = []
+    for index in range(num_smart_collections):
+        collection_id = BASE_COLLECTION_ID + num_custom_collections + index
+        color = COLORS[index % len(COLORS)]
+        title = f"Shop {color.title()}"
+        if index >= len(COLORS):
+            title = f"{title} {index // len(COLORS) + 1}"
+        smart_collections.append({
+            "id": collection_id,
+            "title": title,
+            "handle": _handleize(title),
+            "body_html": f"<p>Everything we make in {color}.</p>",
+            "published_at": created_base.isoformat() + "Z",
+            "disjunctive": False,
+            "rules": [{"column": "tag", "relation": "equals", "condition": color}],
+        })
+
+    return {
+        "products": products,
+        "custom_collections": custom_collections,
+        "smart_collections": smart_collections,
+        "collects": collects,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Shopify catalog as JSON.")
+    parser.add_argument("--products", type=int, default=1000, help="Number of products to generate")
+    parser.add_argument("--custom-collections", type=int, default=20)
+    parser.add_argument("--smart-collections", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    catalog = generate_catalog(
+        num_products=args.products,
+        num_custom_collections=args.custom_collections,
+        num_smart_collections=args.smart_collections,
+        seed=args.seed,
+    )
+    print(json.dumps(catalog, indent=2))
+
+
+if __name__ == "__main__":
+    main()
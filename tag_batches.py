@@ -0,0 +1,161 @@
+"""
+Offline bulk tagging through a provider batch API.
+
+A tagging job is submitted as one provider batch (see BaseAIService.submit_tag_batch)
+and recorded as an AITagBatch row. Syncing a batch polls the provider and, once the
+batch has ended, streams its results into product_tags.
+
+Batches can be synced from the UI or by running this module as a poller:
+    python tag_batches.py --interval 300
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from models import db, Product, Tag, AITagBatch
+from product_descriptions import refresh_compact_descriptions
+from config import Config
+
+
+def apply_generated_tags(product, tag_names, store_id=None):
+    """
+    Attach AI-generated tags to a product, creating store-scoped tags as needed.
+
+    Returns:
+        The number of tags newly added to the product.
+    """
+    tags_added = 0
+    for tag_name in tag_names:
+        # Check if tag exists for this store, create if not
+        tag_query = Tag.query.filter_by(name=tag_name)
+        if store_id:
+            tag_query = tag_query.filter_by(store_id=store_id)
+
+        tag = tag_query.first()
+        if not tag:
+            print(f"Creating new tag: {tag_name}")
+            # Set is_app_managed=True when creating the tag
+            tag = Tag(name=tag_name, store_id=store_id, is_app_managed=True)
+            db.session.add(tag)
+            try:
+                db.session.flush()  # Flush to get the tag ID
+            except Exception as e:
+                print(f"Error creating tag {tag_name}: {str(e)}")
+                db.session.rollback()
+                continue
+
+        # Add tag to product if not already added
+        if tag not in product.tags:
+            product.tags.append(tag)
+            tags_added += 1
+    return tags_added
+
+
+async def submit_tag_batch_job(ai_service, products, store_id=None):
+    """Submit `products` as one provider batch and persist the batch record."""
+    refresh_compact_descriptions(products)
+    submitted = await ai_service.submit_tag_batch(products)
+    batch = AITagBatch(
+        store_id=store_id,
+        provider=Config.AI_PROVIDER,
+        model_name=ai_service.model_for('generate_tags'),
+        batch_id=submitted['batch_id'],
+        status=submitted['status'] or 'in_progress',
+        product_ids=[product.id for product in products],
+        request_count=len(products),
+    )
+    db.session.add(batch)
+    db.session.commit()
+    return batch
+
+
+async def sync_tag_batch(ai_service, batch):
+    """
+    Poll a batch and, if it has ended, stream its results into product_tags.
+
+    Returns:
+        The updated AITagBatch.
+    """
+    if batch.status in ('applied', 'failed'):
+        return batch
+    try:
+        status = await ai_service.get_tag_batch_status(batch.batch_id)
+    except Exception as e:
+        print(f"Error polling batch {batch.batch_id}: {e}")
+        batch.error_message = str(e)
+        db.session.commit()
+        return batch
+
+    counts = status.get('counts') or {}
+    batch.succeeded_count = counts.get('succeeded', 0)
+    batch.errored_count = sum(counts.get(key, 0) for key in ('errored', 'canceled', 'expired'))
+    batch.status = status['status'] if status['status'] != 'canceling' else 'in_progress'
+    if batch.status != 'ended':
+        db.session.commit()
+        return batch
+
+    products = {ai_service.batch_custom_id(p): p for p in Product.query.filter(Product.id.in_(batch.product_ids)).all()}
+    applied = 0
+    processed = 0
+    try:
+        async for custom_id, tags in ai_service.iter_tag_batch_results(batch.batch_id):
+            product = products.get(custom_id)
+            if product is None or not tags:
+                continue
+            if apply_generated_tags(product, tags, batch.store_id):
+                applied += 1
+            processed += 1
+            # Commit periodically so a long results file is applied incrementally
+            if processed % 25 == 0:
+                db.session.commit()
+    except Exception as e:
+        print(f"Error applying results of batch {batch.batch_id}: {e}")
+        db.session.rollback()
+        batch.status = 'failed'
+        batch.error_message = str(e)
+        db.session.commit()
+        return batch
+
+    batch.applied_count = applied
+    batch.status = 'applied'
+    batch.completed_at = datetime.utcnow()
+    db.session.commit()
+    print(f"Applied batch {batch.batch_id}: {applied} products tagged")
+    return batch
+
+
+async def sync_pending_batches(ai_service):
+    """Sync every batch that has not been applied yet. Returns the batches touched."""
+    pending = AITagBatch.query.filter(AITagBatch.status.in_(('in_progress', 'ended'))).all()
+    synced = []
+    for batch in pending:
+        synced.append(await sync_tag_batch(ai_service, batch))
+    await ai_service.aclose()
+    return synced
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll provider tagging batches and apply finished results.")
+    parser.add_argument("--interval", type=float, default=float(Config.AI_BATCH_POLL_SECONDS or 60), help="Seconds between polls")
+    parser.add_argument("--once", action="store_true", help="Sync pending batches once and exit")
+    args = parser.parse_args()
+
+    from app import create_app
+    from ai_services import get_ai_service
+
+    app = create_app()
+    with app.app_context():
+        ai_service = get_ai_service()
+        while True:
+            synced = asyncio.run(sync_pending_batches(ai_service))
+            for batch in synced:
+                print(f"{batch.batch_id}: {batch.status} ({batch.succeeded_count} succeeded, {batch.errored_count} errored)")
+            if args.once or not AITagBatch.query.filter(AITagBatch.status.in_(('in_progress', 'ended'))).count():
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
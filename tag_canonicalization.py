@@ -0,0 +1,247 @@
+"""
+Tag canonicalization: find near-synonymous tags and merge them into one canonical tag.
+
+Auto-tagging produces many spellings of the same tag ("stainless steel mug",
+"stainless-steel mugs"). Tag names are normalized (case, separators, plurals) and
+embedded locally with a hashed character n-gram vectorizer, so no remote embedding
+service is needed. Candidate pairs come from batched cosine similarity (one matrix
+product per block of tags) and are confirmed against the exact n-gram cosine.
+
+Each tag joins the most popular similar tag as its canonical tag, so clusters never
+chain through a series of slightly different names. Merges are applied with
+set-based SQL: product_tags, collections.tag_id and blog_posts.source_tag_id are
+rewritten through a temporary old -> new mapping table, then the merged tags are deleted.
+
+Proposals are shown on the tags page, or from the command line:
+    python tag_canonicalization.py --store-id 1 --threshold 0.9 [--apply]
+"""
+
+import argparse
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, text
+
+from models import db, Tag, product_tags
+from config import Config
+
+SEPARATOR_RE = re.compile(r"[-_/&+.,]+")
+NON_WORD_RE = re.compile(r"[^a-z0-9 ]+")
+
+
+def singularize(word: str) -> str:
+    """Crude English singular form, enough to line up plural and singular tag names."""
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('ches', 'shes', 'sses', 'xes', 'zes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def normalize_tag_name(name: str) -> str:
+    """Lowercase, separators to spaces, punctuation dropped, every word singular."""
+    name = NON_WORD_RE.sub("", SEPARATOR_RE.sub(" ", (name or "").lower()))
+    return " ".join(singularize(word) for word in name.split())
+
+
+def tag_features(normalized: str) -> Counter:
+    """Character 3-grams of the padded name, of the name without spaces ("tshirt" vs "t shirt"), and whole words."""
+    padded = f" {normalized} "
+    compact = f" {normalized.replace(' ', '')} "
+    features = Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+    features.update(f"c:{compact[i:i + 3]}" for i in range(len(compact) - 2))
+    features.update(f"w:{word}" for word in normalized.split())
+    return features
+
+
+def exact_cosine(a: Counter, b: Counter) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(count * b.get(feature, 0) for feature, count in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+class TagVectorizer:
+    """
+    Dense local tag embeddings: n-gram features hashed with a random sign into `dimensions`
+    buckets and L2-normalized, so a dot product approximates the n-gram cosine similarity.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def transform(self, feature_sets: List[Counter]) -> np.ndarray:
+        rows, columns, values = [], [], []
+        for row, features in enumerate(feature_sets):
+            for feature, count in features.items():
+                hashed = zlib.crc32(feature.encode('utf-8'))
+                rows.append(row)
+                columns.append(hashed % self.dimensions)
+                values.append(count if (hashed >> 31) & 1 else -count)
+        matrix = np.zeros((len(feature_sets), self.dimensions), dtype=np.float32)
+        np.add.at(matrix, (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)), np.array(values, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+
+def similar_pairs(vectors: np.ndarray, threshold: float, block_size: int = 2048) -> List[Tuple[int, int]]:
+    """Index pairs (i < j) whose embedding cosine reaches `threshold`, one matrix product per block."""
+    pairs: List[Tuple[int, int]] = []
+    for start in range(0, len(vectors), block_size):
+        similarities = vectors[start:start + block_size] @ vectors.T
+        rows, columns = np.nonzero(similarities >= threshold)
+        rows += start
+        upper = columns > rows
+        pairs.extend(zip(rows[upper].tolist(), columns[upper].tolist()))
+    return pairs
+
+
+def find_merge_groups(tags: List[Tuple[int, str, int]], threshold: float = 0.9,
+                      dimensions: int = 256) -> List[Dict[str, Any]]:
+    """
+    Group near-synonymous tags.
+
+    Args:
+        tags: (tag_id, name, product_count) for one store.
+        threshold: Minimum n-gram cosine similarity between a tag and its canonical tag.
+
+    Returns:
+        Merge proposals, largest first: dicts with 'canonical' and 'duplicates', each entry
+        a dict with 'id', 'name', 'product_count' (and 'similarity' for duplicates).
+    """
+    if len(tags) < 2:
+        return []
+    # Most used tags first, so they become the canonical spelling; then shorter names
+    tags = sorted(tags, key=lambda tag: (-tag[2], len(tag[1]), tag[0]))
+    features = [tag_features(normalize_tag_name(name)) for _, name, _ in tags]
+    vectors = TagVectorizer(dimensions).transform(features)
+
+    # Hashed embeddings are approximate: gather candidates with some slack, then check exactly
+    neighbours: Dict[int, List[Tuple[int, float]]] = {}
+    for i, j in similar_pairs(vectors, threshold - 0.1):
+        similarity = exact_cosine(features[i], features[j])
+        if similarity >= threshold:
+            neighbours.setdefault(j, []).append((i, similarity))
+
+    canonical_of: Dict[int, int] = {}
+    groups: Dict[int, Dict[str, Any]] = {}
+    for index, (tag_id, name, product_count) in enumerate(tags):
+        # Join the closest more popular tag that is itself canonical
+        options = [(similarity, other) for other, similarity in neighbours.get(index, []) if canonical_of.get(other) == other]
+        if not options:
+            canonical_of[index] = index
+            continue
+        similarity, canonical = max(options)
+        canonical_of[index] = canonical
+        group = groups.setdefault(canonical, {
+            'canonical': {'id': tags[canonical][0], 'name': tags[canonical][1], 'product_count': tags[canonical][2]},
+            'duplicates': [],
+        })
+        group['duplicates'].append({'id': tag_id, 'name': name, 'product_count': product_count, 'similarity': round(similarity, 3)})
+    return sorted(groups.values(), key=lambda group: -sum(d['product_count'] for d in group['duplicates']) - group['canonical']['product_count'])
+
+
+def propose_tag_merges(store_id: Optional[int] = None, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Merge proposals for a store's tags (all tags when store_id is None, never across stores)."""
+    threshold = float(threshold if threshold is not None else (Config.TAG_MERGE_THRESHOLD or 0.9))
+    query = db.session.query(Tag.id, Tag.name, Tag.store_id, func.count(product_tags.c.product_id)) \
+        .outerjoin(product_tags, product_tags.c.tag_id == Tag.id) \
+        .group_by(Tag.id)
+    if store_id:
+        query = query.filter(Tag.store_id == store_id)
+    by_store: Dict[Any, List[Tuple[int, str, int]]] = {}
+    for tag_id, name, tag_store_id, product_count in query.all():
+        by_store.setdefault(tag_store_id, []).append((tag_id, name, product_count))
+    proposals = []
+    for store_tags in by_store.values():
+        proposals.extend(find_merge_groups(store_tags, threshold))
+    return proposals
+
+
+def apply_tag_merges(mapping: Dict[int, int]) -> Dict[str, int]:
+    """
+    Merge tags with set-based updates. `mapping` maps each merged tag id to its canonical tag id.
+
+    Returns:
+        Row counts: product links moved, product links dropped, collections and blog posts
+        repointed, tags deleted.
+    """
+    mapping = {int(old): int(new) for old, new in mapping.items() if int(old) != int(new)}
+    if not mapping:
+        return {'product_links_added': 0, 'product_links_removed': 0, 'collections_updated': 0,
+                'blog_posts_updated': 0, 'tags_deleted': 0}
+    session = db.session
+    session.execute(text("DROP TABLE IF EXISTS tag_merge_map"))
+    session.execute(text("CREATE TEMPORARY TABLE tag_merge_map (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)"))
+    try:
+        session.execute(text("INSERT INTO tag_merge_map (old_id, new_id) VALUES (:old_id, :new_id)"),
+                        [{'old_id': old, 'new_id': new} for old, new in mapping.items()])
+        # Products tagged with a merged tag get the canonical tag (once, even if several of their tags merge)
+        added = session.execute(text(
+            "INSERT INTO product_tags (product_id, tag_id)"
+            " SELECT DISTINCT pt.product_id, m.new_id FROM product_tags pt"
+            " JOIN tag_merge_map m ON pt.tag_id = m.old_id"
+            " WHERE NOT EXISTS (SELECT 1 FROM product_tags existing"
+            "                   WHERE existing.product_id = pt.product_id AND existing.tag_id = m.new_id)"
+        )).rowcount
+        removed = session.execute(text(
+            "DELETE FROM product_tags WHERE tag_id IN (SELECT old_id FROM tag_merge_map)"
+        )).rowcount
+        collections = session.execute(text(
+            "UPDATE collections SET tag_id = (SELECT new_id FROM tag_merge_map WHERE old_id = collections.tag_id)"
+            " WHERE tag_id IN (SELECT old_id FROM tag_merge_map)"
+        )).rowcount
+        blog_posts = session.execute(text(
+            "UPDATE blog_posts SET source_tag_id = (SELECT new_id FROM tag_merge_map WHERE old_id = blog_posts.source_tag_id)"
+            " WHERE source_tag_id IN (SELECT old_id FROM tag_merge_map)"
+        )).rowcount
+        deleted = session.execute(text(
+            "DELETE FROM tags WHERE id IN (SELECT old_id FROM tag_merge_map)"
+        )).rowcount
+        session.execute(text("DROP TABLE tag_merge_map"))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    # Tag relationships loaded before the merge are stale now
+    session.expire_all()
+    return {'product_links_added': added, 'product_links_removed': removed, 'collections_updated': collections,
+            'blog_posts_updated': blog_posts, 'tags_deleted': deleted}
+
+
+def mapping_from_proposals(proposals: List[Dict[str, Any]]) -> Dict[int, int]:
+    """Flatten merge proposals into a merged tag id -> canonical tag id mapping."""
+    return {duplicate['id']: group['canonical']['id'] for group in proposals for duplicate in group['duplicates']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-synonymous tags and merge them into canonical tags.")
+    parser.add_argument("--store-id", type=int, default=None, help="Only this store's tags (default: every store separately)")
+    parser.add_argument("--threshold", type=float, default=None, help="Minimum similarity to the canonical tag")
+    parser.add_argument("--apply", action="store_true", help="Apply the merges instead of only listing them")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        proposals = propose_tag_merges(args.store_id, args.threshold)
+        for group in proposals:
+            names = ", ".join(f"{d['name']} ({d['similarity']})" for d in group['duplicates'])
+            print(f"{group['canonical']['name']} <- {names}")
+        print(f"{len(proposals)} canonical tags, {sum(len(g['duplicates']) for g in proposals)} tags to merge")
+        if args.apply and proposals:
+            print(apply_tag_merges(mapping_from_proposals(proposals)))
+
+
+if __name__ == "__main__":
+    main()
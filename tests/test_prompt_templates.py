@@ -0,0 +1,32 @@
+import string
+
+import pytest
+
+from ai_services import base, claude, gemini, llama
+from ai_services.claude import ClaudeService
+
+DEFAULT_TEMPLATES = {
+    name: value
+    for module in (base, claude, gemini, llama)
+    for name, value in vars(module).items()
+    if name.startswith('DEFAULT_') and name.endswith('_PROMPT')
+}
+
+
+def placeholders(text):
+    return {field for _, field, _, _ in string.Formatter().parse(text) if field}
+
+
+@pytest.mark.parametrize('name', sorted(DEFAULT_TEMPLATES))
+def test_default_template_keeps_every_instruction_in_the_static_prefix(name):
+    template = DEFAULT_TEMPLATES[name]
+    variables = {field: f"<{field}>" for field in placeholders(template)}
+    instructions, variable_text = ClaudeService(api_key="test-key").split_prompt_template(template, **variables)
+
+    assert instructions
+    assert not any(value in instructions for value in variables.values())
+    # Only placeholder lines (and a label line above one) may follow the split
+    lines = [line for line in variable_text.splitlines() if line.strip()]
+    for index, line in enumerate(lines):
+        is_label = line.rstrip().endswith(':') and index + 1 < len(lines)
+        assert is_label or any(value in line for value in variables.values()), f"{name}: {line!r} is not cached"
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from ai_services.base import SingleFlight
+
+
+def test_cancelled_follower_does_not_cancel_the_shared_call():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def scenario():
+        leader = asyncio.ensure_future(single_flight.do("key", call))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(single_flight.do("key", call)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        followers[0].cancel()
+        results = await asyncio.gather(leader, *followers, return_exceptions=True)
+        return results
+
+    leader_result, cancelled, *others = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert leader_result == ("answer", False)
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert others == [("answer", True), ("answer", True)]
+    assert single_flight.in_flight == {}
+
+
+def test_followers_retry_when_the_leader_is_cancelled():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def scenario():
+        leader = asyncio.ensure_future(single_flight.do("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.do("key", call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == ("answer", False)
+    assert len(calls) == 2